@@ -0,0 +1,130 @@
+"""
+A microbenchmark of `FunnyBot._create_post` at different log levels, this
+measures what the logging costs the hot path of the bot.
+
+Everything is served by a local HTTP server (a post page and its image), so
+this runs offline. Run it from the root of the repository, the results are
+written to stderr (the logs of the bot go to stdout):
+
+    python -m benchmarks.create_post [-n 200] > /dev/null
+"""
+
+import io
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+import statistics
+import http.server
+
+import discord
+from PIL import Image
+
+import ifunnybot as funny
+
+# the post that's served
+POST_URL = "https://ifunny.co/picture/benchmark"
+PAGE = b"""<html><head>
+<meta property="og:url" content="https://ifunny.co/picture/benchmark"/>
+<meta property="og:image" content="https://img.ifunny.co/images/benchmark.png"/>
+<meta name="author" content="benchmark"/>
+</head><body><div class="T_Se"><div>
+<button><span class="bWIw"><span>x</span><span>12</span></span></button>
+<button><span class="bWIw"><span>x</span><span>3</span></span></button>
+</div></div></body></html>"""
+
+
+def create_image() -> bytes:
+    """Creates the image of the post."""
+    buf = io.BytesIO()
+    Image.new("RGB", (640, 640), (255, 0, 0)).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def serve(image: bytes) -> http.server.ThreadingHTTPServer:
+    """Serves the post page and its image on a local port."""
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            (body, content_type) = (
+                (image, "image/png")
+                if self.path.startswith("/images")
+                else (PAGE, "text/html; charset=utf-8")
+            )
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def measure(bot: funny.FunnyBot, iterations: int) -> list[float]:
+    """Creates the post `iterations` times, returning every latency in seconds."""
+    latencies = []
+    for _ in range(iterations):
+        started_at = time.perf_counter()
+        await bot._create_post(POST_URL, bot.headers)
+        latencies.append(time.perf_counter() - started_at)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", type=int, default=200, dest="iterations")
+    args = parser.parse_args()
+
+    # everything comes from the local server
+    server = serve(create_image())
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    with tempfile.TemporaryDirectory() as directory:
+        secrets = funny.Secrets(
+            {"TOKEN": "-", "CLIENTID": "0", "GUILDID": "0", "ERRORCHANNEL": "0"}
+        )
+        bot = funny.FunnyBot(
+            intents=discord.Intents.default(),
+            secrets=secrets,
+            configuration=funny.Configuration(
+                log_location=directory, pickle_location=directory, cache_ttl=0
+            ),
+        )
+        get = bot.fetcher.get
+        bot.fetcher.get = lambda url, **kwargs: get(
+            url.replace("https://ifunny.co", base).replace("https://img.ifunny.co", base),
+            **kwargs,
+        )
+
+        logger = logging.getLogger("FunnyBot")
+
+        async def run():
+            await measure(bot, 10)  # warming up
+            for level in (logging.WARNING, logging.INFO, logging.DEBUG):
+                logger.setLevel(level)
+                latencies = await measure(bot, args.iterations)
+                print(
+                    f"{logging.getLevelName(level):<8} "
+                    f"mean={statistics.mean(latencies) * 1000:.3f}ms "
+                    f"median={statistics.median(latencies) * 1000:.3f}ms "
+                    f"p95={statistics.quantiles(latencies, n=20)[-1] * 1000:.3f}ms",
+                    file=sys.stderr,
+                )
+            bot.pipeline.stop()
+
+        asyncio.run(run())
+        funny.stop_logger(logger)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+An end-to-end benchmark of the bot against a local stand-in of iFunny and
+its CDN (see `benchmarks/standin.py`), so this runs offline.
+
+It drives `get_post` (of pictures, videos and gifs), `get_user` and
+`get_icon` at a set concurrency, every request for a post or a user that
+wasn't requested before so that nothing comes from the cache, and reports
+the throughput, the latency percentiles, the CPU time and the peak RSS of
+the bot (the stand-in runs in a process of its own). Run it from the root
+of the repository, the results are written to stderr (the logs of the bot
+go to stdout):
+
+    python -m benchmarks.end_to_end [-n 200] [-c 8] [--operations picture,video,gif,user,icon] > /dev/null
+
+With `-c 1` the jobs run one at a time, so how far the peak RSS grows from
+before the first request is the peak of a single job. With large media, e.g.,
+
+    python -m benchmarks.end_to_end -n 3 -c 1 --operations gif --video-size 720 --video-frames 300 > /dev/null
+
+that is the memory of turning a large video into a gif.
+"""
+
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import statistics
+from typing import Any, Awaitable, Callable
+
+import discord
+
+import ifunnybot as funny
+from benchmarks.standin import StandIn, PICTURE_SIZE, VIDEO_SIZE, VIDEO_FRAMES
+
+# the operations that are driven
+OPERATIONS = ("picture", "video", "gif", "user", "icon")
+
+
+def operation(bot: funny.FunnyBot, name: str, i: int) -> Callable[[], Awaitable[Any]]:
+    """Returns the `i`th request of an operation."""
+    match name:
+        case "user":
+            return lambda: bot.get_user(f"user{i}")
+        case "icon":
+            return lambda: bot.get_icon(f"icon{i}")
+        case _:
+            return lambda: bot.get_post(f"https://ifunny.co/{name}/{name}{i}")
+
+
+async def drive(
+    bot: funny.FunnyBot, operations: list[str], iterations: int, concurrency: int, offset: int = 0
+) -> tuple[dict[str, list[float]], dict[str, list[str]]]:
+    """
+    Makes `iterations` requests, going round the operations, with at most
+    `concurrency` of them at once. Returns the latencies and the errors of
+    every operation.
+    """
+    latencies: dict[str, list[float]] = {name: [] for name in operations}
+    errors: dict[str, list[str]] = {name: [] for name in operations}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def request(i: int):
+        name = operations[i % len(operations)]
+        func = operation(bot, name, offset + i)
+        async with semaphore:
+            started_at = time.perf_counter()
+            try:
+                await func()
+            except Exception as e:  # type: ignore
+                errors[name].append(f"{type(e).__name__}: {e}")
+                return
+            latencies[name].append(time.perf_counter() - started_at)
+
+    await asyncio.gather(*(request(i) for i in range(iterations)))
+    return (latencies, errors)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Returns the `q` percentile (0 to 1) of `values`."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def cpu_time() -> float:
+    """Returns the CPU time (user and system, of every thread) used by the process so far."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def peak_rss() -> float:
+    """Returns the peak RSS of the process so far in MB."""
+    # kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1_000_000 if sys.platform == "darwin" else rss / 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", type=int, default=200, dest="iterations")
+    parser.add_argument("-c", type=int, default=8, dest="concurrency")
+    parser.add_argument("--operations", default=",".join(OPERATIONS))
+    parser.add_argument("--picture-size", type=int, default=PICTURE_SIZE, help="The width (and height) of the pictures.")
+    parser.add_argument("--video-size", type=int, default=VIDEO_SIZE, help="The width (and height) of the videos.")
+    parser.add_argument("--video-frames", type=int, default=VIDEO_FRAMES, help="The number of frames of the videos (at 30 fps).")
+    args = parser.parse_args()
+
+    operations = [name.strip() for name in args.operations.split(",") if name.strip()]
+    if unknown := set(operations) - set(OPERATIONS):
+        parser.error(f"unknown operations: {', '.join(sorted(unknown))}")
+
+    sizes = {
+        "picture_size": args.picture_size,
+        "video_size": args.video_size,
+        "video_frames": args.video_frames,
+    }
+    with StandIn(**sizes) as standin, tempfile.TemporaryDirectory() as directory:
+        secrets = funny.Secrets(
+            {"TOKEN": "-", "CLIENTID": "0", "GUILDID": "0", "ERRORCHANNEL": "0"}
+        )
+        bot = funny.FunnyBot(
+            intents=discord.Intents.default(),
+            secrets=secrets,
+            configuration=funny.Configuration(
+                log_location=directory, pickle_location=directory, hosts=standin.hosts
+            ),
+        )
+
+        logger = logging.getLogger("FunnyBot")
+        logger.setLevel(logging.WARNING)
+
+        async def run():
+            # warming up, one of every operation
+            baseline = peak_rss()
+            await drive(bot, operations, len(operations), 1, offset=-len(operations))
+
+            (rss, cpu, started_at) = (peak_rss(), cpu_time(), time.perf_counter())
+            results = await drive(bot, operations, args.iterations, args.concurrency)
+            (elapsed, cpu) = (time.perf_counter() - started_at, cpu_time() - cpu)
+
+            bot.pipeline.stop()
+            return (results, elapsed, cpu, rss, baseline)
+
+        ((latencies, errors), elapsed, cpu, rss, baseline) = asyncio.run(run())
+        bot.archive.close()
+        funny.stop_logger(logger)
+
+    everything = [latency for name in operations for latency in latencies[name]]
+    failed = sum(len(e) for e in errors.values())
+    print(
+        f"{len(everything)} requests in {elapsed:.2f}s at a concurrency of {args.concurrency}, "
+        f"{len(everything) / elapsed:.1f} requests/s, {failed} failed",
+        file=sys.stderr,
+    )
+    for (name, values) in [*latencies.items(), ("all", everything)]:
+        if not values:
+            continue
+        print(
+            f"{name:<8} n={len(values):<5} "
+            f"mean={statistics.mean(values) * 1000:.1f}ms "
+            f"p50={percentile(values, 0.5) * 1000:.1f}ms "
+            f"p95={percentile(values, 0.95) * 1000:.1f}ms "
+            f"p99={percentile(values, 0.99) * 1000:.1f}ms",
+            file=sys.stderr,
+        )
+    print(
+        f"cpu {cpu:.2f}s ({cpu / elapsed:.0%} of a core), "
+        f"peak rss {peak_rss():.1f}MB ({rss:.1f}MB before the run, "
+        f"{baseline:.1f}MB before the first request)",
+        file=sys.stderr,
+    )
+    for (name, messages) in errors.items():
+        if messages:
+            print(f"{name} failed {len(messages)} times, e.g.: {messages[0]}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+A load generator for `FunnyBot.on_message`, standing in for the Discord
+gateway. It feeds synthetic messages into the bot at a set rate, a share of
+them with a link to a post or a profile, and the bot replies to a stub
+instead of Discord. The links are served by the local stand-in of iFunny
+(see `benchmarks/standin.py`), so this runs offline.
+
+Messages are sent at the set rate no matter how far behind the bot is (like
+the gateway does), every one handled in a task of its own. It reports the
+messages handled per second, how long the bot takes to pass on a message
+without a link, the time to reply to a message with a link and how many of
+those were shed. Run it from the root of the repository, the results are
+written to stderr (the logs of the bot go to stdout):
+
+    python -m benchmarks.gateway [-r 50] [-d 10] [--links 0.1] [--upload-latency 0.1] > /dev/null
+"""
+
+import sys
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import statistics
+from typing import Any, Optional
+
+import discord
+
+import ifunnybot as funny
+from ifunnybot.types.mode import Priority
+from ifunnybot.types.reply import Reply
+from benchmarks.standin import StandIn
+
+# the kinds of links, as often as they're posted
+LINKS = ("picture", "picture", "picture", "video", "gif", "user")
+
+# the words messages without a link are made of
+WORDS = ("lol", "did", "you", "see", "that", "the", "game", "last", "night", "bro", "what", "is", "this")
+
+
+class FakeUser(object):
+    """The author of a message."""
+
+    def __init__(self, id: int):
+        self.id = id
+        self.bot = False
+
+
+class FakeGuild(object):
+    """The server a message was sent in."""
+
+    def __init__(self, id: int):
+        self.id = id
+        self.shard_id = 0
+        self.filesize_limit = Reply.MAX_UPLOAD_SIZE
+
+
+class FakeChannel(object):
+    """The channel a message was sent in."""
+
+    def __init__(self, id: int):
+        self.id = id
+
+
+class FakeMessage(object):
+    """
+    A message, with everything of a `discord.Message` that the bot uses.
+    Replying only records when it happened, after `upload_latency` seconds
+    (the time Discord takes to take an upload).
+    """
+
+    def __init__(self, id: int, content: str, guild: FakeGuild, upload_latency: float):
+        self.id = id
+        self.content = content
+        self.author = FakeUser(id)
+        self.guild = guild
+        self.channel = FakeChannel(guild.id)
+        self._upload_latency = upload_latency
+
+        # when the message was sent and replied to
+        self.sent_at = time.perf_counter()
+        self.replied_at: Optional[float] = None
+        self.replies = 0
+
+    def __repr__(self) -> str:
+        return f"<FakeMessage: {self.id}, {self.content!r}>"
+
+    async def reply(self, **kwargs: Any):
+        await asyncio.sleep(self._upload_latency)
+        if self.replied_at is None:
+            self.replied_at = time.perf_counter()
+        self.replies += 1
+
+
+def create_content(rng: random.Random, i: int, links: float) -> tuple[str, bool]:
+    """Returns the content of the `i`th message and whether or not it has a link."""
+    words = " ".join(rng.choices(WORDS, k=rng.randint(3, 20)))
+    if rng.random() >= links:
+        return (words, False)
+
+    # every link is new, so nothing comes from the cache
+    kind = rng.choice(LINKS)
+    return (f"{words} https://ifunny.co/{kind}/{kind}{i}", True)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Returns the `q` percentile (0 to 1) of `values`."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+async def generate(bot: funny.FunnyBot, args: argparse.Namespace) -> dict[str, Any]:
+    """Sends the messages at the set rate and waits for the bot to handle all of them."""
+    rng = random.Random(args.seed)
+    guilds = [FakeGuild(i + 1) for i in range(args.guilds)]
+    messages: list[tuple[FakeMessage, bool]] = []
+    handled: list[float] = []  # how long handling took, of the messages without a link
+    errors: list[str] = []
+
+    async def handle(message: FakeMessage, linked: bool):
+        started_at = time.perf_counter()
+        try:
+            await bot.on_message(message)  # type: ignore
+        except Exception as e:  # type: ignore
+            errors.append(f"{type(e).__name__}: {e}")
+        if not linked:
+            handled.append(time.perf_counter() - started_at)
+
+    bot.monitor.start()
+    tasks = []
+    total = int(args.rate * args.duration)
+    started_at = time.perf_counter()
+    for i in range(total):
+        # keeping to the rate, no matter how far behind the bot is
+        if (delay := started_at + i / args.rate - time.perf_counter()) > 0:
+            await asyncio.sleep(delay)
+
+        (content, linked) = create_content(rng, i, args.links)
+        message = FakeMessage(i, content, rng.choice(guilds), args.upload_latency)
+        messages.append((message, linked))
+        tasks.append(asyncio.create_task(handle(message, linked)))
+    sent = time.perf_counter() - started_at
+
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started_at
+    bot.monitor.stop()
+
+    return {
+        "messages": messages,
+        "handled": handled,
+        "errors": errors,
+        "sent": sent,
+        "elapsed": elapsed,
+    }
+
+
+def report(bot: funny.FunnyBot, results: dict[str, Any]):
+    """Prints the results."""
+    messages = results["messages"]
+    elapsed = results["elapsed"]
+    linked = [m for (m, has_link) in messages if has_link]
+    replied = [m for m in linked if m.replied_at is not None]
+    to_reply = [m.replied_at - m.sent_at for m in replied]  # type: ignore
+    handled = results["handled"]
+
+    print(
+        f"sent {len(messages)} messages in {results['sent']:.2f}s "
+        f"({len(messages) / results['sent']:.1f}/s offered, {len(linked)} with a link), "
+        f"handled all of them in {elapsed:.2f}s ({len(messages) / elapsed:.1f}/s)",
+        file=sys.stderr,
+    )
+    if handled:
+        print(
+            f"without a link  n={len(handled):<5} "
+            f"mean={statistics.mean(handled) * 1e6:.0f}us "
+            f"p50={percentile(handled, 0.5) * 1e6:.0f}us "
+            f"p99={percentile(handled, 0.99) * 1e6:.0f}us",
+            file=sys.stderr,
+        )
+    if to_reply:
+        print(
+            f"time to reply   n={len(to_reply):<5} "
+            f"mean={statistics.mean(to_reply) * 1000:.1f}ms "
+            f"p50={percentile(to_reply, 0.5) * 1000:.1f}ms "
+            f"p95={percentile(to_reply, 0.95) * 1000:.1f}ms "
+            f"p99={percentile(to_reply, 0.99) * 1000:.1f}ms",
+            file=sys.stderr,
+        )
+    if linked:
+        print(
+            f"shed {len(linked) - len(replied)}/{len(linked)} messages with a link "
+            f"({(len(linked) - len(replied)) / len(linked):.1%}), "
+            f"turned away by admission: {bot.admission.shed_reasons(Priority.AUTOEMBED)}, "
+            f"dropped by the scheduler: {bot.scheduler.shed}",
+            file=sys.stderr,
+        )
+    print(
+        f"loop lag p50={bot.monitor.percentile(0.5) * 1000:.1f}ms "
+        f"p99={bot.monitor.percentile(0.99) * 1000:.1f}ms "
+        f"max={bot.monitor.max * 1000:.1f}ms, {bot.monitor.stalled} stalls",
+        file=sys.stderr,
+    )
+    if results["errors"]:
+        print(
+            f"on_message failed {len(results['errors'])} times, e.g.: {results['errors'][0]}",
+            file=sys.stderr,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-r", "--rate", type=float, default=50.0, help="The messages sent per second.")
+    parser.add_argument("-d", "--duration", type=float, default=10.0, help="How long (in seconds) messages are sent.")
+    parser.add_argument("--links", type=float, default=0.1, help="The share (0 to 1) of the messages with a link.")
+    parser.add_argument("--guilds", type=int, default=10, help="The number of servers the messages are sent in.")
+    parser.add_argument("--upload-latency", type=float, default=0.1, help="How long (in seconds) a reply takes.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with StandIn() as standin, tempfile.TemporaryDirectory() as directory:
+        secrets = funny.Secrets(
+            {"TOKEN": "-", "CLIENTID": "0", "GUILDID": "0", "ERRORCHANNEL": "0"}
+        )
+        bot = funny.FunnyBot(
+            intents=discord.Intents.default(),
+            secrets=secrets,
+            configuration=funny.Configuration(
+                log_location=directory, pickle_location=directory, hosts=standin.hosts
+            ),
+        )
+
+        logger = logging.getLogger("FunnyBot")
+        logger.setLevel(logging.WARNING)
+
+        async def run() -> dict[str, Any]:
+            results = await generate(bot, args)
+            bot.pipeline.stop()
+            return results
+
+        results = asyncio.run(run())
+        bot.archive.close()
+        funny.stop_logger(logger)
+
+    report(bot, results)
+
+
+if __name__ == "__main__":
+    main()
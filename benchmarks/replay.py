@@ -0,0 +1,276 @@
+"""
+Replays the pages in the failure archive (and the plain pickles written
+before it) through the parsers of the bot, `FunnyBot._parse_post` and
+`FunnyBot._parse_profile`, without any network.
+
+For every selector it reports on how many pages it matches, for every page
+whether it parses, how long that takes and how much it allocates. With
+`--save` the results are written to a file that a later run can be checked
+against with `--compare`, which fails if a selector matches fewer pages
+than before. Run it from the root of the repository, the results are
+written to stderr (the logs of the bot go to stdout):
+
+    python -m benchmarks.replay [pickles/ ...] [-n 5] [--save before.json] [--compare before.json] > /dev/null
+"""
+
+import os
+import sys
+import json
+import time
+import glob
+import hashlib
+import logging
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+from typing import Any, Optional
+
+import discord
+from bs4 import BeautifulSoup as soup
+
+import ifunnybot as funny
+from ifunnybot.utils.urls import get_datatype, get_username_from_url
+
+# the selectors of every kind of page, by name
+POST_SELECTORS = {
+    "canonical": funny.Post.CANONICAL_SEL[0],
+    "picture": funny.Post.PICTURE_SEL[0],
+    "video": funny.Post.VIDEO_SEL[0],
+    "gif": funny.Post.GIF_SEL[0],
+    "author": funny.Post.AUTHOR_SEL[0],
+    "icon": funny.Post.ICON_SEL[0],
+    "likes": funny.Post.LIKES_SEL,
+    "comments": funny.Post.COMMENTS_SEL,
+}
+PROFILE_SELECTORS = {
+    "username": funny.Profile.USERNAME_SEL,
+    "icon": funny.Profile.ICON_SEL,
+    "description": funny.Profile.DESCRIPTION_SEL,
+    "subscribers": funny.Profile.SUBSCRIBERS_SEL,
+    "subscriptions": funny.Profile.SUBSCRIPTIONS_SEL,
+    "features": funny.Profile.FEATURES_SEL,
+}
+
+# the content selector that a type of post needs
+CONTENT_SELECTORS = {
+    funny.PostType.PICTURE: "picture",
+    funny.PostType.VIDEO: "video",
+    funny.PostType.GIF: "gif",
+}
+
+
+def load(paths: list[str]) -> list[tuple[str, dict[str, Any]]]:
+    """Loads every archived page under `paths` (files or directories), once per page."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, "*.pickle.gz")))
+            files += sorted(glob.glob(os.path.join(path, "*.pickle")))
+        else:
+            files.append(path)
+
+    pages = []
+    seen = set()
+    for file in files:
+        try:
+            page = funny.FailureArchive.load(file)
+        except Exception as e:  # type: ignore
+            print(f"skipping {file}: {e}", file=sys.stderr)
+            continue
+        if not isinstance(page.get("payload"), str) or not page.get("url"):
+            print(f"skipping {file}: not an archived page", file=sys.stderr)
+            continue
+
+        # the plain pickles have the same page over and over
+        digest = page.get("hash") or hashlib.sha1(
+            page["payload"].encode("utf-8", "replace")
+        ).hexdigest()
+        if digest in seen:
+            continue
+        seen.add(digest)
+        pages.append((file, page))
+    return pages
+
+
+def replay(
+    bot: funny.FunnyBot, page: dict[str, Any], iterations: int
+) -> dict[str, Any]:
+    """Parses a page `iterations` times, returning what matched, how long it took and what it allocated."""
+    url = page["url"]
+    response = funny.CacheEntry(
+        url,
+        200,
+        "OK",
+        page["payload"].encode("utf-8"),
+        {"content-type": "text/html; charset=utf-8"},
+        "utf-8",
+    )
+
+    # a profile or a post?
+    username = get_username_from_url(url) if get_datatype(url) == funny.PostType.USER else None
+    if username is not None:
+        (kind, selectors) = ("profile", PROFILE_SELECTORS)
+        parse = lambda: bot._parse_profile(username, response)
+    else:
+        (kind, selectors) = ("post", POST_SELECTORS)
+        parse = lambda: bot._parse_post(url, response)
+
+    # which selectors match
+    dom = soup(page["payload"], "html.parser")
+    matched = {
+        name: dom.css.select_one(selector) is not None  # type: ignore
+        for (name, selector) in selectors.items()
+    }
+
+    # how long parsing takes
+    error: Optional[str] = None
+    latencies = []
+    for _ in range(iterations):
+        started_at = time.perf_counter()
+        try:
+            result = parse()
+        except Exception as e:  # type: ignore
+            result = None
+            error = f"{type(e).__name__}: {e}"
+        latencies.append(time.perf_counter() - started_at)
+
+    # what parsing allocates, measured apart as tracing slows everything down
+    tracemalloc.start()
+    try:
+        parse()
+    except Exception:  # type: ignore
+        pass
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # only the content selector of the type of the post counts
+    if kind == "post":
+        post_type = getattr(result, "post_type", None) or get_datatype(url)
+        for (content_type, name) in CONTENT_SELECTORS.items():
+            if content_type != post_type:
+                matched.pop(name)
+
+    return {
+        "kind": kind,
+        "url": url,
+        "error": error,
+        "matched": matched,
+        "archived_selector": page.get("selector"),
+        "latency": statistics.median(latencies),
+        "allocated": peak,
+    }
+
+
+def summarize(results: list[dict[str, Any]]) -> dict[str, dict[str, list[int]]]:
+    """Returns how many pages every selector matched (and was tried on), by kind of page."""
+    summary: dict[str, dict[str, list[int]]] = {}
+    for result in results:
+        selectors = summary.setdefault(result["kind"], {})
+        for (name, matched) in result["matched"].items():
+            counts = selectors.setdefault(name, [0, 0])
+            counts[0] += int(matched)
+            counts[1] += 1
+    return summary
+
+
+def report(results: list[dict[str, Any]], summary: dict[str, dict[str, list[int]]]):
+    """Prints the results of every page and the summary."""
+    for result in results:
+        status = "ok" if result["error"] is None else result["error"][:100]
+        print(
+            f"{result['kind']:<8} {result['latency'] * 1000:8.3f}ms {result['allocated'] / 1000:9.1f}KB  {result['url']}  {status}",
+            file=sys.stderr,
+        )
+
+    print(file=sys.stderr)
+    for (kind, selectors) in summary.items():
+        pages = [r for r in results if r["kind"] == kind]
+        parsed = sum(r["error"] is None for r in pages)
+        latencies = [r["latency"] for r in pages]
+        allocated = [r["allocated"] for r in pages]
+        print(
+            f"{kind}: {parsed}/{len(pages)} parsed, "
+            f"latency mean={statistics.mean(latencies) * 1000:.3f}ms "
+            f"median={statistics.median(latencies) * 1000:.3f}ms "
+            f"max={max(latencies) * 1000:.3f}ms, "
+            f"allocated mean={statistics.mean(allocated) / 1000:.1f}KB "
+            f"max={max(allocated) / 1000:.1f}KB",
+            file=sys.stderr,
+        )
+        for (name, (matched, tried)) in selectors.items():
+            print(f"  {name:<14} {matched:>5}/{tried:<5} {matched / tried:7.1%}", file=sys.stderr)
+
+    # what failed back then
+    archived = [r["archived_selector"] for r in results if r["archived_selector"]]
+    if archived:
+        print(file=sys.stderr)
+        print("selectors that failed when the pages were archived:", file=sys.stderr)
+        for selector in sorted(set(archived)):
+            print(f"  {archived.count(selector):>5}  {selector}", file=sys.stderr)
+
+
+def compare(summary: dict[str, dict[str, list[int]]], path: str) -> bool:
+    """Prints the selectors that match fewer pages than in the results at `path`, returns false if any do."""
+    with open(path, "r", encoding="utf-8") as fd:
+        before = json.load(fd)
+
+    ok = True
+    print(file=sys.stderr)
+    for (kind, selectors) in before.items():
+        for (name, (matched, _)) in selectors.items():
+            now = summary.get(kind, {}).get(name, [0, 0])[0]
+            if now < matched:
+                ok = False
+                print(f"regression: {kind} {name} matched {matched} pages, now {now}", file=sys.stderr)
+    if ok:
+        print(f"no regressions compared to {path}", file=sys.stderr)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("paths", nargs="*", default=[funny.Configuration.PICKLE_LOCATION])
+    parser.add_argument("-n", type=int, default=5, dest="iterations")
+    parser.add_argument("--save", default=None, help="Writes the matches of every selector to this file.")
+    parser.add_argument("--compare", default=None, help="Fails if a selector matches fewer pages than in this file.")
+    args = parser.parse_args()
+
+    pages = load(args.paths)
+    if not pages:
+        print(f"no archived pages in {', '.join(args.paths)}", file=sys.stderr)
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        secrets = funny.Secrets(
+            {"TOKEN": "-", "CLIENTID": "0", "GUILDID": "0", "ERRORCHANNEL": "0"}
+        )
+        bot = funny.FunnyBot(
+            intents=discord.Intents.default(),
+            secrets=secrets,
+            configuration=funny.Configuration(
+                log_location=directory, pickle_location=directory
+            ),
+        )
+
+        # the pages are expected to fail, logging them would only be measured too
+        logger = logging.getLogger("FunnyBot")
+        logger.setLevel(logging.CRITICAL)
+
+        results = [replay(bot, page, args.iterations) for (_, page) in pages]
+        bot.archive.close()
+        funny.stop_logger(logger)
+
+    summary = summarize(results)
+    report(results, summary)
+
+    if args.save is not None:
+        with open(args.save, "w", encoding="utf-8") as fd:
+            json.dump(summary, fd, indent=2)
+
+    if args.compare is not None and not compare(summary, args.compare):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
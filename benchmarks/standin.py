@@ -0,0 +1,256 @@
+"""
+A local stand-in of iFunny and its CDN for the benchmarks, so that they
+run offline. It serves a post page (of a picture, a video or a gif) and a
+profile page for any id, along with the media behind them, from a process
+of its own so that serving doesn't count towards what the benchmarks
+measure. The bot is pointed at it with `Configuration(hosts=standin.hosts)`.
+The size of the media can be set, e.g., a large video to measure the memory
+that turning it into a gif takes.
+
+It can be run on its own too e.g., for a bot in development mode:
+
+    python -m benchmarks.standin [--port 8080] [--picture-size 640] [--video-size 320] [--video-frames 60]
+"""
+
+import io
+import time
+import queue
+import asyncio
+import hashlib
+import argparse
+import multiprocessing
+from typing import Any, Optional
+
+import av
+import numpy as np
+from PIL import Image
+from aiohttp import web
+
+# the origins that are served
+ORIGINS = ("https://ifunny.co", "https://br.ifunny.co", "https://img.ifunny.co")
+
+# the default size of the pictures (and icons), and of the videos (and gifs)
+PICTURE_SIZE = 640
+VIDEO_SIZE = 320
+VIDEO_FRAMES = 60
+
+POST_PAGE = """<html><head>
+<meta property="og:url" content="https://ifunny.co/{kind}/{id}"/>
+<meta property="og:image" content="https://img.ifunny.co/images/{hash}_1.jpg"/>
+<meta property="og:image:secure_url" content="https://img.ifunny.co/images/{hash}_1.jpg"/>
+<meta property="og:video:url" content="https://img.ifunny.co/videos/{hash}_1.mp4"/>
+<meta name="author" content="standin"/>
+</head><body>
+<div><a href="/user/standin"><img class="MmRx xY6H gsQw YDCg" data-src="https://img.ifunny.co/images/{hash}_icon.jpg"/></a></div>
+<div class="T_Se"><div>
+<button><span class="bWIw"><span>x</span><span>12</span></span></button>
+<button><span class="bWIw"><span>x</span><span>3</span></span></button>
+</div></div></body></html>"""
+
+PROFILE_PAGE = """<html><body>
+<div class="Du6F"><span class="uHyU"><span class="rL50"><img src="https://img.ifunny.co/images/{hash}_icon.jpg"/></span></span></div>
+<div class="pkOr">
+<div class="zWwJ">{id}</div>
+<div class="aSGm">A stand-in of a user.</div>
+<div class="brxh"><a>12 subscribers</a><a>3 subscriptions</a></div>
+<div class="x6q6">5 features</div>
+</div></body></html>"""
+
+
+def create_picture(size: int = PICTURE_SIZE) -> bytes:
+    """Creates the picture served for every image and icon, a square gradient."""
+    (width, height) = (size, size)
+    x = np.linspace(0, 255, width, dtype=np.uint8)
+    y = np.linspace(0, 255, height, dtype=np.uint8)
+    pixels = np.stack([*np.meshgrid(x, y), np.full((height, width), 128, np.uint8)], axis=-1)
+
+    buf = io.BytesIO()
+    Image.fromarray(pixels, "RGB").save(buf, "JPEG")
+    return buf.getvalue()
+
+
+def create_video(size: int = VIDEO_SIZE, frames: int = VIDEO_FRAMES) -> bytes:
+    """Creates the video served for every video and gif, a square moving gradient."""
+    (width, height) = (size, size)
+    x = np.linspace(0, 255, width, dtype=np.uint8)
+
+    buf = io.BytesIO()
+    with av.open(buf, "w", format="mp4") as container:
+        stream = container.add_stream("h264", rate=30)
+        (stream.width, stream.height, stream.pix_fmt) = (width, height, "yuv420p")  # type: ignore
+        for i in range(frames):
+            row = np.roll(x, i * 4)
+            colors = np.stack([row, row[::-1], np.full(width, i * 4 % 256, np.uint8)], axis=-1)
+            pixels = np.repeat(colors[None], height, axis=0)
+            for packet in stream.encode(av.VideoFrame.from_ndarray(pixels, format="rgb24")):  # type: ignore
+                container.mux(packet)
+        for packet in stream.encode():  # type: ignore
+            container.mux(packet)
+    return buf.getvalue()
+
+
+def create_app(
+    picture_size: int = PICTURE_SIZE, video_size: int = VIDEO_SIZE, video_frames: int = VIDEO_FRAMES
+) -> web.Application:
+    """Creates the stand-in, serving the pages and media."""
+    picture = create_picture(picture_size)
+    video = create_video(video_size, video_frames)
+
+    def page(template: str, kind: str, id: str) -> web.Response:
+        digest = hashlib.sha1(id.encode()).hexdigest()[:16]
+        return web.Response(
+            text=template.format(kind=kind, id=id, hash=digest),
+            content_type="text/html",
+            charset="utf-8",
+        )
+
+    async def post(request: web.Request) -> web.Response:
+        return page(POST_PAGE, request.match_info["kind"], request.match_info["id"])
+
+    async def profile(request: web.Request) -> web.Response:
+        return page(PROFILE_PAGE, "user", request.match_info["id"])
+
+    async def media(request: web.Request) -> web.Response:
+        if request.path.endswith(".mp4"):
+            return web.Response(body=video, content_type="video/mp4")
+        return web.Response(body=picture, content_type="image/jpeg")
+
+    app = web.Application()
+    app.router.add_get("/{kind:picture|video|gif}/{id}", post)
+    app.router.add_get("/user/{id}", profile)
+    app.router.add_get("/{kind:images|videos}/{file}", media)
+    return app
+
+
+async def serve(host: str, port: int, ready: Optional[Any] = None, **sizes: int):
+    """
+    Serves the stand-in until cancelled, putting the port it's served on
+    into `ready`. The `sizes` of the media are passed on to `create_app`.
+    """
+    runner = web.AppRunner(create_app(**sizes), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+
+    port = runner.addresses[0][1]
+    if ready is not None:
+        ready.put(port)
+    else:
+        print(f"Serving on http://{host}:{port}", flush=True)
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def _run(host: str, port: int, ready: Any, sizes: dict[str, int]):
+    """The entry point of the process of the stand-in."""
+    try:
+        asyncio.run(serve(host, port, ready, **sizes))
+    except KeyboardInterrupt:
+        pass
+
+
+class StandIn(object):
+    """
+    The stand-in, served from a process of its own between `start` and
+    `stop` (or as a context manager).
+
+    The process is started with the `start_method` of `multiprocessing`,
+    "spawn" by default so that it doesn't inherit (or have to pickle) the
+    state of the benchmark, the bot or its threads. The `sizes` of the media
+    are passed on to `create_app`.
+    """
+
+    def __init__(
+        self, host: str = "127.0.0.1", port: int = 0, start_method: str = "spawn", **sizes: int
+    ):
+        self._host = host
+        self._port = port
+        self._sizes = sizes
+        self._context = multiprocessing.get_context(start_method)
+        self._process: Optional[Any] = None
+
+    def __repr__(self) -> str:
+        return f"<StandIn: {self.base}, running={self.running}>"
+
+    def __enter__(self) -> "StandIn":
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
+
+    @property
+    def running(self) -> bool:
+        """Returns true if the stand-in is being served."""
+        return self._process is not None and self._process.is_alive()
+
+    @property
+    def base(self) -> str:
+        """Returns the origin the stand-in is served on."""
+        return f"http://{self._host}:{self._port}"
+
+    @property
+    def hosts(self) -> dict[str, str]:
+        """Returns the origins of iFunny and its CDN mapped to the stand-in, for `Configuration.hosts`."""
+        return {origin: self.base for origin in ORIGINS}
+
+    def start(self, timeout: float = 60.0):
+        """Starts serving, waiting until the stand-in is up (creating the media takes a moment)."""
+        if self._process is not None:
+            return
+
+        ready = self._context.Queue()
+        self._process = self._context.Process(
+            target=_run, args=(self._host, self._port, ready, self._sizes), name="standin", daemon=True
+        )
+        self._process.start()
+
+        # it might fail to start, not waiting on it for nothing then
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self._port = ready.get(timeout=0.1)
+                return
+            except queue.Empty:
+                if not self._process.is_alive() or time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError("The stand-in failed to start.")
+
+    def stop(self):
+        """Stops serving."""
+        if self._process is None:
+            return
+
+        self._process.terminate()
+        self._process.join()
+        self._process = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--picture-size", type=int, default=PICTURE_SIZE, help="The width (and height) of the pictures.")
+    parser.add_argument("--video-size", type=int, default=VIDEO_SIZE, help="The width (and height) of the videos.")
+    parser.add_argument("--video-frames", type=int, default=VIDEO_FRAMES, help="The number of frames of the videos (at 30 fps).")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(
+            serve(
+                args.host,
+                args.port,
+                picture_size=args.picture_size,
+                video_size=args.video_size,
+                video_frames=args.video_frames,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,18 @@
 from .bot import *
 from .logging import *
 from .configuration import *
+from .cache import *
+from .disk_cache import *
+from .broker import *
+from .archive import *
+from .circuit_breaker import *
+from .fetcher import *
+from .scheduler import *
+from .pipeline import *
+from .memory import *
+from .monitor import *
+from .admission import *
+from .reporter import *
+from .metrics import *
+from .tracing import *
+from .profiler import *
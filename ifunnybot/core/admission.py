@@ -0,0 +1,123 @@
+"""
+This file contains the admission control of the bot, deciding whether or
+not there's room for a new job.
+"""
+
+import logging
+from typing import Optional
+
+from ifunnybot.core.memory import MemoryAccountant
+from ifunnybot.core.monitor import LagMonitor
+from ifunnybot.core.scheduler import Scheduler
+from ifunnybot.types.mode import Priority
+
+
+class AdmissionController(object):
+    """
+    Turns jobs away at the entry points (messages and slash commands) while
+    the bot is saturated, instead of letting them pile up.
+
+    The bot is saturated when too many jobs are waiting, too many bytes of
+    media are in flight or the event loop is lagging too much. Waiting jobs
+    are only counted if they'd go before the new job, so the auto-embeds
+    waiting in line don't turn away interactions.
+
+    Once the bot is draining (shutting down), every new job is turned away.
+    """
+
+    # the maximum number of jobs waiting to run
+    MAX_PENDING = 32
+
+    # the maximum number of bytes of media in flight
+    MAX_MEDIA_BYTES = 128_000_000
+
+    # the maximum (smoothed) lag of the event loop in seconds
+    MAX_LOOP_LAG = 0.5
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        scheduler: Scheduler,
+        memory: MemoryAccountant,
+        monitor: LagMonitor,
+        max_pending: int = MAX_PENDING,
+        max_media_bytes: int = MAX_MEDIA_BYTES,
+        max_loop_lag: float = MAX_LOOP_LAG,
+    ):
+        self._logger = logger
+        self._scheduler = scheduler
+        self._memory = memory
+        self._monitor = monitor
+        self._max_pending = max_pending
+        self._max_media_bytes = max_media_bytes
+        self._max_loop_lag = max_loop_lag
+
+        # the number of shed jobs per priority and per reason
+        self._shed: dict[Priority, dict[str, int]] = {p: {} for p in Priority}
+
+        # whether or not the bot is shutting down
+        self._draining = False
+
+    def __repr__(self) -> str:
+        return f"<AdmissionController: max_pending={self._max_pending}, max_media_bytes={self._max_media_bytes}, max_loop_lag={self._max_loop_lag}s, shed={self.shed}>"
+
+    @property
+    def draining(self) -> bool:
+        """Returns true if the bot is shutting down and not taking new jobs."""
+        return self._draining
+
+    def drain(self):
+        """Turns away every new job from now on."""
+        self._draining = True
+
+    @property
+    def shed(self) -> dict[str, int]:
+        """Returns the total number of shed jobs per priority."""
+        return {p.name: sum(reasons.values()) for (p, reasons) in self._shed.items()}
+
+    def shed_reasons(self, priority: Priority) -> dict[str, int]:
+        """Returns the number of shed jobs of a priority per reason."""
+        return dict(self._shed[priority])
+
+    def saturated(self, priority: Priority) -> Optional[str]:
+        """
+        Returns the reason why a job of `priority` can't be admitted right
+        now, `None` if it can be.
+        """
+
+        # shutting down
+        if self._draining:
+            return "draining"
+
+        # only counting the jobs that would go first
+        pending = sum(
+            self._scheduler.pending(p) for p in Priority if p <= priority
+        )
+        if pending >= self._max_pending:
+            return "queue"
+        if self._memory.in_use >= self._max_media_bytes:
+            return "memory"
+        if self._monitor.average >= self._max_loop_lag:
+            return "lag"
+        return None
+
+    def admit(self, priority: Priority) -> bool:
+        """
+        Returns true if a job of `priority` can be admitted, otherwise the
+        job is counted as shed.
+        """
+        if (reason := self.saturated(priority)) is None:
+            return True
+
+        # counting
+        reasons = self._shed[priority]
+        reasons[reason] = reasons.get(reason, 0) + 1
+        self._logger.warning(
+            "Shedding a job of priority %s, reason: %s (%s, %s, %s)",
+            priority.name,
+            reason,
+            self._scheduler,
+            self._memory,
+            self._monitor,
+        )
+        return False
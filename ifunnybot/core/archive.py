@@ -0,0 +1,200 @@
+"""
+This file contains the archive of the pages that failed to parse, for
+debugging the selectors (see `benchmarks/replay.py`).
+"""
+
+import os
+import gzip
+import pickle
+import hashlib
+import logging
+import threading
+import contextvars
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+
+class FailureArchive(object):
+    """
+    A size capped archive of the pages that failed to parse, kept in a
+    directory as gzipped pickles (`<hash>.pickle.gz`) of:
+    {
+        timestamp: the time of the failure,
+        url: the url of the page,
+        reason: the exception,
+        selector: the selector that failed, if known,
+        hash: the SHA-1 of the page,
+        payload: the page,
+    }
+
+    Pages are deduplicated by their content, the same broken page is only
+    stored once no matter how often (or by how many requests) it fails.
+    Once the archive outgrows `max_size`, the least recently failed pages
+    are evicted. Everything but the hashing happens on a background thread.
+    """
+
+    # the total size (in bytes) of the archive
+    MAX_SIZE = 64_000_000
+
+    # the extension of the archived pages
+    EXTENSION = ".pickle.gz"
+
+    def __init__(self, logger: logging.Logger, directory: str, max_size: int = MAX_SIZE):
+        self._logger = logger
+        self._directory = directory
+        self._max_size = max_size
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="archive")
+        self._closed = False
+
+        # the archived pages (by hash) and their sizes, read from the directory once
+        self._entries: Optional[dict[str, int]] = None
+        self._size = 0
+        self._lock = threading.Lock()
+
+        # statistics
+        self._archived = 0
+        self._duplicates = 0
+        self._evicted = 0
+
+    def __repr__(self) -> str:
+        return f"<FailureArchive: {self._directory}, {self._size / 1_000_000:.2f} MB / {self._max_size / 1_000_000} MB, archived={self._archived}, duplicates={self._duplicates}, evicted={self._evicted}>"
+
+    @property
+    def directory(self) -> str:
+        """Returns the directory of the archive."""
+        return self._directory
+
+    @property
+    def size(self) -> int:
+        """Returns the total size of the archive in bytes."""
+        return self._size
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """Returns the number of archived pages, duplicate failures and evicted pages."""
+        return {
+            "archived": self._archived,
+            "duplicates": self._duplicates,
+            "evicted": self._evicted,
+        }
+
+    def add(self, url: str, content: str, reason: Optional[Exception] = None):
+        """
+        Archives the page `content` of `url` that failed with `reason`, this
+        doesn't block. Pages that fail once the archive is closed (i.e., while
+        the bot drains) are dropped.
+        """
+        if self._closed:
+            self._logger.warning("The archive is closed, dropped the page of %s.", url)
+            return
+
+        payload = {
+            "timestamp": datetime.now().timestamp(),
+            "url": url,
+            "reason": reason,
+            "selector": getattr(reason, "selector", None),
+            "hash": hashlib.sha1(content.encode("utf-8", "replace")).hexdigest(),
+            "payload": content,
+        }
+        try:
+            self._executor.submit(contextvars.copy_context().run, self._write, payload)
+        except RuntimeError:
+            # closed in the meantime
+            self._logger.warning("The archive is closed, dropped the page of %s.", url)
+
+    def close(self):
+        """Writes out whatever is left and stops the background thread."""
+        self._closed = True
+        self._executor.shutdown(wait=True)
+
+    @staticmethod
+    def load(path: str) -> dict[str, Any]:
+        """Loads an archived page, or a plain pickle written before the archive."""
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rb") as fd:
+            return pickle.load(fd)
+
+    def _path(self, digest: str) -> str:
+        """Returns the path of the page with the hash `digest`."""
+        return os.path.join(self._directory, f"{digest}{FailureArchive.EXTENSION}")
+
+    def _scan(self) -> dict[str, int]:
+        """Returns the archived pages, reading the directory the first time."""
+        if self._entries is None:
+            os.makedirs(self._directory, exist_ok=True)
+            self._entries = {}
+            for entry in os.scandir(self._directory):
+                if entry.name.endswith(FailureArchive.EXTENSION):
+                    self._entries[entry.name[: -len(FailureArchive.EXTENSION)]] = (
+                        entry.stat().st_size
+                    )
+            self._size = sum(self._entries.values())
+        return self._entries
+
+    def _write(self, payload: dict[str, Any]):
+        """Writes a page into the archive, on the background thread."""
+        try:
+            with self._lock:
+                entries = self._scan()
+                (digest, path) = (payload["hash"], self._path(payload["hash"]))
+
+                # the same page failed before, only marking it as recent
+                if digest in entries:
+                    self._duplicates += 1
+                    os.utime(path)
+                    self._logger.debug(
+                        "%s failed again, the page is archived as %s", payload["url"], path
+                    )
+                    return
+
+                # the exception might not be picklable
+                try:
+                    data = pickle.dumps(payload)
+                except Exception:  # type: ignore
+                    payload["reason"] = repr(payload["reason"])
+                    data = pickle.dumps(payload)
+
+                # writing it compressed, in one go so a crash can't leave half of it behind
+                compressed = gzip.compress(data)
+                with open(f"{path}.tmp", "wb") as fd:
+                    fd.write(compressed)
+                os.replace(f"{path}.tmp", path)
+                entries[digest] = len(compressed)
+                self._size += len(compressed)
+                self._archived += 1
+                self._logger.info(
+                    "Archived the page of %s to %s (%d bytes, %d compressed), selector: %s",
+                    payload["url"],
+                    path,
+                    len(data),
+                    len(compressed),
+                    payload["selector"],
+                )
+
+                self._evict(entries)
+        except Exception as e:  # type: ignore
+            # not logging this as an error, that would only feed the error channel
+            self._logger.warning("Failed to archive the page of %s: %s", payload["url"], e)
+
+    def _evict(self, entries: dict[str, int]):
+        """Removes the least recently failed pages until the archive fits."""
+        if self._size <= self._max_size:
+            return
+
+        def mtime(digest: str) -> float:
+            try:
+                return os.stat(self._path(digest)).st_mtime
+            except FileNotFoundError:
+                return 0.0
+
+        for digest in sorted(entries, key=mtime):
+            if self._size <= self._max_size:
+                break
+            try:
+                os.remove(self._path(digest))
+            except FileNotFoundError:
+                pass
+            self._size -= entries.pop(digest)
+            self._evicted += 1
+            self._logger.debug("Evicted %s from the archive.", digest)
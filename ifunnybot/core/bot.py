@@ -4,32 +4,56 @@ This file contains the bot object.
 
 import re
 import io
+import json
+import math
+import logging
 import sys
 import signal
-import pickle
 import asyncio
 import hashlib
+import time
+import threading
+import contextlib
 from datetime import datetime
-from typing import Tuple, Optional
+from collections import Counter
+from typing import IO, Any, Awaitable, Callable, Iterator, Tuple, Optional
 from urllib3.exceptions import NameResolutionError
 
 import pyfsig
 import discord
-import requests
 import imageio.v3 as iio
 from PIL import Image, ImageOps
 from discord import app_commands
 from bs4 import BeautifulSoup as soup
 
 from ifunnybot.core.configuration import Configuration
-from ifunnybot.core.logging import create_logger
+from ifunnybot.core.logging import create_logger, stop_logger, Lazy
+from ifunnybot.core.cache import Cache
+from ifunnybot.core.disk_cache import DiskCache
+from ifunnybot.core.broker import LeaseBroker
+from ifunnybot.core.archive import FailureArchive
+from ifunnybot.core.fetcher import Fetcher
+from ifunnybot.core.circuit_breaker import CircuitBreaker
+from ifunnybot.core.scheduler import Scheduler
+from ifunnybot.core.pipeline import Pipeline
+from ifunnybot.core.memory import MemoryAccountant
+from ifunnybot.core.monitor import LagMonitor
+from ifunnybot.core.admission import AdmissionController
+from ifunnybot.core.reporter import ErrorReporter
+from ifunnybot.core.metrics import MetricsRegistry, MetricsServer
+from ifunnybot.core.tracing import Tracer
+from ifunnybot.core.profiler import Profiler
 from ifunnybot.types.post import Post
-from ifunnybot.types.mode import Mode, CropMethod, ImageFormat
+from ifunnybot.types.mode import Mode, CropMethod, ImageFormat, Priority
 from ifunnybot.types.response import Response
 from ifunnybot.types.secrets import Secrets
 from ifunnybot.types.profile import Profile
+from ifunnybot.types.reply import Reply
+from ifunnybot.types.cache_entry import CacheEntry
+from ifunnybot.types.spooled_buffer import SpooledBuffer
 from ifunnybot.types.post_type import PostType
 from ifunnybot.types.parsing_exception import ParsingError
+from ifunnybot.types.overloaded_exception import OverloadedError
 from ifunnybot.data.signatures import IFUNNY_SIGS
 from ifunnybot.utils.html import generate_safe_selector
 from ifunnybot.utils.utils import (
@@ -44,12 +68,17 @@ from ifunnybot.utils.urls import (
     encode_url,
     username_to_url,
     remove_image_cropping,
+    canonicalize_url,
 )
 
 
-class FunnyBot(discord.Client):
+class FunnyBot(discord.AutoShardedClient):
     """
     The most elite Discord bot for iFunny posts yet.
+
+    The bot is sharded, by default it runs every shard Discord recommends.
+    To split the shards between processes, give every process its own
+    `shard_ids` out of the same `shard_count` (and the same cache path).
     """
 
     def __init__(
@@ -60,17 +89,150 @@ class FunnyBot(discord.Client):
         mode: Mode = Mode.PRODUCTION,
         log_name: str = f"{int(datetime.utcnow().timestamp())}-funnybot.log",
         configuration: Configuration = Configuration(),
+        shard_ids: Optional[list[int]] = None,
+        shard_count: Optional[int] = None,
     ) -> None:
-        super().__init__(intents=intents)
+        super().__init__(intents=intents, shard_ids=shard_ids, shard_count=shard_count)
 
         # saving variables
-        self._logger = create_logger(f"{configuration.log_location}/{log_name}")
+        self._logger = create_logger(
+            f"{configuration.log_location}/{log_name}",
+            max_bytes=configuration.log_max_bytes,
+            backup_count=configuration.log_backup_count,
+            level=logging.DEBUG if mode == Mode.DEVELOPMENT else logging.INFO,
+            levels=configuration.log_levels,
+        )
         self._tree = app_commands.CommandTree(
             self
         )  # the tree variable holds slash commands
         self._mode = mode
         self._headers = spoof_headers()
 
+        # shares the bot fairly between servers
+        self._scheduler = Scheduler(
+            self._logger.getChild("scheduler"),
+            workers=configuration.max_concurrent_jobs,
+            reserved=configuration.reserved_jobs,
+            per_key=configuration.max_guild_jobs,
+            max_pending=configuration.max_pending_jobs,
+        )
+
+        # the stages that every post goes through, sized to the jobs the
+        # scheduler lets run (which is what pushes back on new jobs)
+        self._pipeline = Pipeline(
+            self._logger.getChild("pipeline"),
+            workers={
+                name: min(workers, configuration.max_concurrent_jobs)
+                for (name, workers) in configuration.pipeline_workers.items()
+            },
+            maxsize=(
+                configuration.pipeline_queue_size
+                if configuration.pipeline_queue_size is not None
+                else configuration.max_concurrent_jobs
+            ),
+        )
+
+        # keeping an eye on the load, turning away jobs when saturated
+        self._memory = MemoryAccountant(budget=configuration.media_budget)
+        self._monitor = LagMonitor(
+            self._logger.getChild("monitor"),
+            threshold=configuration.loop_stall_threshold,
+        )
+        self._admission = AdmissionController(
+            self._logger.getChild("admission"),
+            self._scheduler,
+            self._memory,
+            self._monitor,
+            max_pending=configuration.admission_max_pending,
+            max_media_bytes=configuration.max_media_bytes,
+            max_loop_lag=configuration.max_loop_lag,
+        )
+
+        # the fetch layer, all of the requests to iFunny go through here
+        self._fetcher = Fetcher(
+            self._logger.getChild("fetcher"),
+            cache=(
+                DiskCache(configuration.cache_path, max_size=configuration.cache_size)
+                if configuration.cache_path is not None
+                else Cache(max_size=configuration.cache_size)
+            ),
+            ttl=configuration.cache_ttl,
+            broker=(
+                LeaseBroker(configuration.cache_path, ttl=configuration.lease_ttl)
+                if configuration.cache_path is not None
+                else None
+            ),
+            failure_threshold=configuration.failure_threshold,
+            cooldown=configuration.breaker_cooldown,
+            hosts=configuration.hosts,
+        )
+
+        # when a page was last scraped successfully
+        self._last_scrape: Optional[float] = None
+
+        # the pages that failed to parse, for debugging
+        self._archive = FailureArchive(
+            self._logger.getChild("archive"),
+            configuration.pickle_location,
+            max_size=configuration.archive_size,
+        )
+
+        # posting digests of the errors to the error channel
+        self._error_channel: Optional[discord.abc.Messageable] = None
+        self._reporter = ErrorReporter(
+            self._logger.getChild("reporter"),
+            self.log_to_error_channel,
+            interval=configuration.error_report_interval,
+        )
+        self._logger.addHandler(self._reporter)
+
+        # the number of messages, replies and shed messages of every shard
+        self._shard_counters: dict[int, Counter[str]] = {}
+
+        # the metrics of the bot, served over HTTP if there's a port for them
+        self._metrics = MetricsRegistry()
+        self._stage_seconds = self._metrics.histogram(
+            "stage_duration_seconds",
+            "How long every stage of a post took (queueing included), by stage and post type.",
+        )
+        self._stage_errors = self._metrics.counter(
+            "stage_errors_total", "The number of failed stages, by stage and post type."
+        )
+        self._register_collectors()
+        self._metrics_server = (
+            MetricsServer(
+                self._logger.getChild("metrics"),
+                self._metrics,
+                host=configuration.metrics_host,
+                port=configuration.metrics_port,
+            )
+            if configuration.metrics_port is not None
+            else None
+        )
+
+        # tracing every message and interaction, the slowest ones are served on /traces
+        self._tracer = Tracer(
+            self._logger.getChild("tracer"), keep=configuration.slow_traces
+        )
+        if self._metrics_server is not None:
+            self._metrics_server.route("/traces", lambda: (200, self._tracer.dump()))
+            self._metrics_server.route(
+                "/healthz", lambda: self._health_route(self.liveness), "application/json"
+            )
+            self._metrics_server.route(
+                "/readyz", lambda: self._health_route(self.readiness), "application/json"
+            )
+
+        # profiles and memory snapshots on demand, written next to the logs
+        self._profiler = Profiler(
+            self._logger.getChild("profiler"), configuration.log_location
+        )
+
+        # the handlers (messages and slash commands) that were admitted and
+        # haven't finished yet, these are waited for on shutdown
+        self._active: set[asyncio.Task] = set()
+        self._shutdown: Optional[asyncio.Task] = None
+
         # configuration
         self._log_file = log_name
         self._secrets = secrets
@@ -85,17 +247,33 @@ class FunnyBot(discord.Client):
         # wrapping around logging function
         self._manipulate_logger()
 
+        # measuring the lag of the event loop
+        self._monitor.start()
+
+        # posting the errors
+        self._reporter.start()
+
+        # serving the metrics
+        if self._metrics_server is not None:
+            self._metrics_server.start()
+
         # logging
         self._logger.info("Starting bot in %s mode.", self._mode.name)
         self._logger.info("Configuration object: %s", self._conf)
         self._logger.debug("Secrets: %s", self._secrets)
         self._logger.info(
             "Supported image formats: %s",
-            ", ".join(
-                map(lambda x: f"{x.name}: {ImageFormat.is_supported(x)}", ImageFormat)
+            Lazy(
+                ", ".join,
+                map(lambda x: f"{x.name}: {ImageFormat.is_supported(x)}", ImageFormat),
             ),
         )
 
+        # only one process publishes the commands, the one running shard 0
+        if not self.publishes_commands:
+            self._logger.info("Leaving the commands to the process running shard 0.")
+            return
+
         # publishing commands
         match self._mode:
             # if in development, dispatch commands to our testing server
@@ -116,6 +294,9 @@ class FunnyBot(discord.Client):
                 # syncing commands to discord
                 commands = await self._tree.sync()
 
+                # the commands only meant for the testing server i.e., /profile
+                commands += await self._tree.sync(guild=self._guild)
+
                 # logging
                 self._logger.info("Published %d commands.", len(commands))
 
@@ -131,11 +312,46 @@ class FunnyBot(discord.Client):
         """Returns the directory where pickle objects are stored."""
         return self._conf.pickle_location
 
+    @property
+    def archive(self) -> FailureArchive:
+        """Returns the archive of the pages that failed to parse."""
+        return self._archive
+
     @property
     def logs_dir(self) -> str:
         """Returns the directory where the logs are stored."""
         return self._conf.log_location
 
+    @property
+    def fetcher(self) -> Fetcher:
+        """Returns the fetch layer used to query iFunny and its CDN."""
+        return self._fetcher
+
+    @property
+    def scheduler(self) -> Scheduler:
+        """Returns the scheduler that runs the jobs of every server."""
+        return self._scheduler
+
+    @property
+    def pipeline(self) -> Pipeline:
+        """Returns the stages that every post goes through."""
+        return self._pipeline
+
+    @property
+    def memory(self) -> MemoryAccountant:
+        """Returns the accountant of the media held in memory."""
+        return self._memory
+
+    @property
+    def monitor(self) -> LagMonitor:
+        """Returns the monitor of the event loop."""
+        return self._monitor
+
+    @property
+    def admission(self) -> AdmissionController:
+        """Returns the admission control of the bot."""
+        return self._admission
+
     @property
     def image_export_format(self) -> ImageFormat:
         """Returns the default image export format used for icons and pictures."""
@@ -183,6 +399,38 @@ class FunnyBot(discord.Client):
         """
         return self._tree
 
+    @property
+    def publishes_commands(self) -> bool:
+        """
+        Returns true if this process publishes the slash commands i.e., it
+        runs shard 0 (or every shard).
+        """
+        return self.shard_ids is None or 0 in self.shard_ids
+
+    def shard_stats(self) -> dict[int, dict[str, float]]:
+        """
+        Returns the statistics of every shard run by this process i.e., its
+        latency (in seconds), its number of servers and its number of handled
+        messages, replies and shed messages.
+        """
+        guilds = Counter(guild.shard_id for guild in list(self.guilds))
+        return {
+            shard_id: {
+                "latency": shard.latency,
+                "guilds": guilds[shard_id],
+                **{
+                    name: self._shard_counters.get(shard_id, Counter())[name]
+                    for name in ("messages", "replies", "shed")
+                },
+            }
+            for (shard_id, shard) in list(self.shards.items())
+        }
+
+    def _count(self, message: discord.message.Message, name: str, n: int = 1):
+        """Counts `n` of `name` for the shard that received `message`."""
+        shard_id = message.guild.shard_id if message.guild is not None else 0
+        self._shard_counters.setdefault(shard_id, Counter())[name] += n
+
     @property
     def prefer_video_url(self) -> bool:
         """
@@ -194,58 +442,406 @@ class FunnyBot(discord.Client):
     # --- bot functions ---
 
     def _manipulate_logger(self):
-        # if development mode, enable debug logs
-        if self._mode == Mode.PRODUCTION:
-            setattr(self._logger, "debug", lambda *args, **kwargs: str)
+        # debug logs are only for development, the mode might have changed since creation
+        self._logger.setLevel(
+            logging.DEBUG if self._mode == Mode.DEVELOPMENT else logging.INFO
+        )
 
-        # getting the original function
-        original_func = getattr(self._logger, "error")
+    @property
+    def metrics(self) -> MetricsRegistry:
+        """Returns the metrics of the bot."""
+        return self._metrics
 
-        # new wrapper
-        def error(msg: object, *args: object, **kwargs) -> None:
-            # calling the original logger function
-            original_func(msg, *args, **kwargs)
+    @property
+    def profiler(self) -> Profiler:
+        """Returns the profiler of the bot."""
+        return self._profiler
+
+    def start_profile(self, signum: int, _):
+        """
+        A signal handler (SIGUSR1), profiles the bot for the configured number
+        of seconds and traces its allocations for as long after, in the background.
+        """
+        self._logger.info("Received %s, profiling.", signal.Signals(signum).name)
 
-            # logging to the error channel
-            loop = asyncio.get_event_loop()
-            loop.create_task(self.log_to_error_channel(msg % args))  # type: ignore
+        def profile():
+            self._profiler.profile(self._conf.profile_seconds)
+            self._profiler.snapshot(self._conf.profile_seconds)
 
-        # setting the functions
-        setattr(self._logger, "error", error)
-        setattr(self._logger, "_error", original_func)
+        threading.Thread(target=profile, name="profiler", daemon=True).start()
 
-    async def log_to_error_channel(self, msg: str):
+    def free(self, *files: Optional[discord.File]):
         """
-        This functions logs to the error channel specified by `self._secrets`.
+        Gives back the memory of the media behind `files` once they're uploaded
+        (or won't be), instead of whenever they're garbage collected.
         """
-        # get the channel
-        channel = self.get_channel(self._secrets.error_channel)
+        for file in files:
+            if file is not None:
+                self._memory.free(file.fp)
 
-        # format the message
-        actual = f"# Error @ {datetime.now().timestamp()}\n{msg}"
+    @property
+    def tracer(self) -> Tracer:
+        """Returns the tracer of the bot."""
+        return self._tracer
+
+    @contextlib.contextmanager
+    def measure(
+        self, stage: str, post_type: Optional[PostType | str]
+    ) -> Iterator[None]:
+        """
+        Measures the stage `stage` of a post of type `post_type` (the body of
+        the `with` statement), counting it as failed if it raises. It's also
+        a span of the current trace.
+        """
+        labels = {"stage": stage, "post_type": post_type or "unknown"}
+        started_at = time.perf_counter()
+        try:
+            with self._tracer.span(stage):
+                yield
+        except BaseException:
+            self._stage_errors.inc(**labels)
+            raise
+        finally:
+            self._stage_seconds.observe(time.perf_counter() - started_at, **labels)
+
+    def _register_collectors(self):
+        """Exposes the statistics of the components of the bot as metrics."""
+        self._metrics.collector(
+            "fetch_total",
+            "The number of fetches, by result (hits, revalidations, misses and shared).",
+            lambda: {(("result", k),): v for (k, v) in self._fetcher.stats.items()},
+            kind="counter",
+        )
+        self._metrics.collector(
+            "cache_bytes", "The size of the cached bodies.", lambda: self._fetcher.cache.size
+        )
+        self._metrics.collector(
+            "media_bytes", "The bytes of media in flight.", lambda: self._memory.in_use
+        )
+        self._metrics.collector(
+            "jobs_running", "The number of jobs running.", lambda: self._scheduler.running
+        )
+        self._metrics.collector(
+            "jobs_pending",
+            "The number of jobs waiting to run, by priority.",
+            lambda: {
+                (("priority", p.name),): self._scheduler.pending(p) for p in Priority
+            },
+        )
+        self._metrics.collector(
+            "guild_jobs_pending",
+            "The number of jobs waiting to run, of the servers with the most of them.",
+            lambda: {
+                (("guild", str(key)),): depth
+                for (key, depth) in Counter(self._scheduler.depths()).most_common(
+                    self._conf.metrics_top_guilds
+                )
+                if depth > 0
+            },
+        )
+        self._metrics.collector(
+            "jobs_shed_total",
+            "The number of jobs turned away, by priority.",
+            lambda: {(("priority", k),): v for (k, v) in self._admission.shed.items()},
+            kind="counter",
+        )
+        self._metrics.collector(
+            "pipeline_depth",
+            "The number of items waiting in front of every stage of the pipeline.",
+            lambda: {(("stage", s.name),): s.depth for s in self._pipeline.stages},
+        )
+        self._metrics.collector(
+            "pipeline_busy",
+            "The number of busy workers of every stage of the pipeline.",
+            lambda: {(("stage", s.name),): s.busy for s in self._pipeline.stages},
+        )
+        self._metrics.collector(
+            "loop_lag_seconds", "The (smoothed) lag of the event loop.", lambda: self._monitor.average
+        )
+        self._metrics.collector(
+            "loop_lag_quantile_seconds",
+            "The percentiles of the lag of the event loop over the last minute.",
+            lambda: {
+                (("quantile", str(q)),): lag
+                for (q, lag) in self._monitor.percentiles().items()
+            },
+        )
+        self._metrics.collector(
+            "loop_lag_max_seconds", "The largest lag of the event loop so far.", lambda: self._monitor.max
+        )
+        self._metrics.collector(
+            "loop_stalls_total",
+            "The number of times the event loop was blocked past the stall threshold.",
+            lambda: self._monitor.stalled,
+            kind="counter",
+        )
+        self._metrics.collector(
+            "circuit_open",
+            "Whether the circuit breaker of a host is open (1) or not (0), by host.",
+            lambda: {
+                (("host", host),): int(breaker.state == CircuitBreaker.OPEN)
+                for (host, breaker) in self._fetcher.breakers.items()
+            },
+        )
+        self._metrics.collector(
+            "shard_latency_seconds",
+            "The latency of the gateway, by shard.",
+            lambda: {
+                (("shard", str(shard_id)),): shard.latency
+                for (shard_id, shard) in list(self.shards.items())
+            },
+        )
 
-        # get again if channel is None
-        if channel is None:
-            # Fallback in case the bot hasn't cached the channel
-            channel = await self.fetch_channel(self._secrets.error_channel)
+    def health(self) -> dict[str, Any]:
+        """
+        Returns the state of the bot i.e., the connection to the gateway, the
+        lag of the event loop, the queues, the circuit breakers and when a
+        page was last scraped. This is safe to call from any thread.
+        """
+        now = time.time()
+        return {
+            "gateway": {
+                "ready": self.is_ready(),
+                "closed": self.is_closed(),
+                "shards": {
+                    shard_id: {
+                        "latency": shard.latency if math.isfinite(shard.latency) else None,
+                        "closed": shard.is_closed(),
+                    }
+                    for (shard_id, shard) in list(self.shards.items())
+                },
+            },
+            "loop": {
+                "lag": self._monitor.lag,
+                "average": self._monitor.average,
+                "p99": self._monitor.percentile(0.99),
+                "blocked": self._monitor.blocked,
+                "stalls": self._monitor.stalled,
+            },
+            "queues": {
+                "running": self._scheduler.running,
+                "pending": self._scheduler.pending(),
+                "pipeline": {
+                    stage.name: {
+                        "depth": stage.depth,
+                        "busy": stage.busy,
+                        "oldest": stage.oldest,
+                    }
+                    for stage in self._pipeline.stages
+                },
+                "saturated": self._admission.saturated(Priority.AUTOEMBED),
+            },
+            "breakers": {
+                host: breaker.state for (host, breaker) in self._fetcher.breakers.items()
+            },
+            "last_scrape": self._last_scrape,
+            "last_scrape_age": (
+                now - self._last_scrape if self._last_scrape is not None else None
+            ),
+            "draining": self._admission.draining,
+        }
+
+    def liveness(self) -> list[str]:
+        """
+        Returns why the bot is stuck and should be restarted, nothing if it
+        isn't i.e., the event loop is blocked or an item of the pipeline
+        (a hung request) has been running for too long.
+        """
+        problems = []
+        if (blocked := self._monitor.blocked) >= self._conf.liveness_max_blocked:
+            problems.append(f"the event loop has been blocked for {blocked:.1f}s")
+        for stage in self._pipeline.stages:
+            if (oldest := stage.oldest) >= self._conf.liveness_max_run:
+                problems.append(
+                    f"the {stage.name} stage has been running an item for {oldest:.1f}s"
+                )
+        return problems
+
+    def readiness(self) -> list[str]:
+        """
+        Returns why the bot can't do its job right now, nothing if it can
+        i.e., it isn't connected to the gateway, it's shutting down or iFunny
+        is failing. A bot that isn't alive isn't ready either.
+        """
+        problems = self.liveness()
+        if self.is_closed():
+            problems.append("the connection to the gateway is closed")
+        elif not self.is_ready():
+            problems.append("not connected to the gateway yet")
+        if self._admission.draining:
+            problems.append("shutting down")
+        for (host, breaker) in self._fetcher.breakers.items():
+            if breaker.state == CircuitBreaker.OPEN:
+                problems.append(f"{host} is failing, its circuit breaker is open")
+        return problems
+
+    def _health_route(self, check: Callable[[], list[str]]) -> tuple[int, str]:
+        """Serves a health check, 200 if it passes and 503 if it doesn't."""
+        problems = check()
+        body = {
+            "status": "failing" if problems else "ok",
+            "problems": problems,
+            **self.health(),
+        }
+        return (503 if problems else 200, json.dumps(body, indent=2) + "\n")
+
+    @property
+    def reporter(self) -> ErrorReporter:
+        """Returns the reporter posting digests of the errors to the error channel."""
+        return self._reporter
+
+    async def log_to_error_channel(self, msg: str):
+        """
+        This functions logs to the error channel specified by `self._secrets`,
+        the errors are grouped and sent here by the `ErrorReporter`.
+        """
+        # get the channel, only once
+        if self._error_channel is None:
+            channel = self.get_channel(self._secrets.error_channel)
+
+            # get again if channel is None
+            if channel is None:
+                # Fallback in case the bot hasn't cached the channel
+                channel = await self.fetch_channel(self._secrets.error_channel)
+
+            if not isinstance(channel, discord.TextChannel):
+                raise RuntimeError(
+                    f"The error channel {self._secrets.error_channel} isn't a text channel."
+                )
+            self._error_channel = channel
 
         # send the message
-        if isinstance(channel, discord.TextChannel):
-            await channel.send(content=actual)
+        await self._error_channel.send(content=msg)
 
     def terminate(self, signum: int, _):
-        """Gracefully terminates the bot from a synchronous context."""
+        """
+        Gracefully terminates the bot from a synchronous context (i.e., a
+        signal handler), see `shutdown`. A second signal closes the bot
+        without waiting for the jobs in flight.
+        """
 
         # logging
         self._logger.info(
             "Received signal %s(%d), shutting down bot.", signal.Signals(signum), signum
         )
 
+        # the bot never got to start, there's nothing to wait for
+        if not isinstance(self.loop, asyncio.AbstractEventLoop):
+            sys.exit(0)
+
         # hooking into the event loop (need to call, async from sync func)
-        loop = asyncio.get_event_loop()
-        loop.create_task(self.close()).add_done_callback(lambda x: sys.exit(0))
+        self.loop.call_soon_threadsafe(self._begin_shutdown)
 
-    def get_icon(self, user: str) -> Optional["discord.File"]:
+    def _begin_shutdown(self):
+        """Starts the shutdown, or hurries it along if it already started."""
+        if self._shutdown is None:
+            self._shutdown = asyncio.create_task(
+                self.shutdown(self._conf.drain_timeout), name="funnybot-shutdown"
+            )
+        else:
+            self._logger.warning("Shutting down again, not waiting for the jobs in flight.")
+            asyncio.create_task(self.close())
+
+    async def shutdown(self, timeout: Optional[float] = None):
+        """
+        Drains the bot and closes it: new messages and slash commands are turned
+        away, the ones in flight get `timeout` seconds to finish (anything still
+        running after that is logged and cancelled), then the pipeline and the
+        cache are torn down and the logs are flushed.
+        """
+
+        # not taking any new jobs
+        self._admission.drain()
+        self._logger.info(
+            "Draining, waiting up to %ss for %d jobs in flight. %s, %s",
+            timeout,
+            len(self._active),
+            self._scheduler,
+            self._pipeline,
+        )
+
+        # letting the jobs in flight finish
+        if self._active:
+            (_, pending) = await asyncio.wait(set(self._active), timeout=timeout)
+            if pending:
+                self._logger.warning(
+                    "%d jobs didn't finish in time, cancelling them: %s",
+                    len(pending),
+                    ", ".join(task.get_name() for task in pending),
+                )
+                for task in pending:
+                    task.cancel()
+                await asyncio.wait(pending, timeout=1)
+
+        # tearing everything down
+        self._pipeline.stop()
+        self._monitor.stop()
+        if isinstance(self._fetcher.cache, DiskCache):
+            self._fetcher.cache.close()  # shared with other processes
+        else:
+            self._fetcher.cache.clear()
+        if self._fetcher.broker is not None:
+            self._fetcher.broker.close()
+        self._archive.close()
+        self._logger.info(
+            "Drained. %s, %s, %s, %s",
+            self._scheduler,
+            self._admission,
+            self._memory,
+            self._fetcher,
+        )
+
+        # no more metrics
+        if self._metrics_server is not None:
+            self._metrics_server.stop()
+
+        # posting the last of the errors
+        await self._reporter.stop()
+        self._logger.removeHandler(self._reporter)
+
+        await self.close()
+
+        # writing out the last of the logs
+        stop_logger(self._logger)
+
+    def admit(self, priority: Priority) -> bool:
+        """
+        Returns true if there's room for a new job of `priority`, this should
+        be checked before doing any work for a message or a slash command.
+
+        The task of an admitted handler is waited for on shutdown.
+        """
+        if not self._admission.admit(priority):
+            return False
+
+        # keeping track of the handler
+        if (task := asyncio.current_task()) is not None:
+            self._active.add(task)
+            task.add_done_callback(self._active.discard)
+        return True
+
+    async def run_interaction(
+        self,
+        interaction: discord.Interaction,
+        func: Callable[..., Awaitable[Any]],
+        *args: Any,
+    ) -> Any:
+        """
+        Runs `func(*args)` (i.e., `get_post`) for a slash command, ahead of
+        any links waiting to be auto-embedded.
+        """
+        key = (
+            interaction.guild_id
+            if interaction.guild_id is not None
+            else interaction.channel_id
+        )
+        name = f"/{interaction.command.name}" if interaction.command else "interaction"
+        with self._tracer.trace(name):
+            return await self._scheduler.submit(
+                key, func, *args, priority=Priority.INTERACTION
+            )
+
+    async def get_icon(self, user: str) -> Optional["discord.File"]:
         """
         This function returns the target user's profile picture as a
         `discord.File` object.
@@ -262,7 +858,7 @@ class FunnyBot(discord.Client):
 
         # getting the user's profile
         try:
-            profile = self.get_profile_by_name(user)
+            profile = await self.get_profile_by_name(user)
 
         # something happened
         except RuntimeError as reason:
@@ -298,7 +894,10 @@ class FunnyBot(discord.Client):
             return None
 
         # getting the icon of the user
-        icon_response = self._retrieve_content(profile.icon_url)
+        with self.measure("media_fetch", PostType.USER):
+            icon_response = await self._pipeline.run(
+                "download", self._retrieve_content, profile.icon_url
+            )
         if icon_response is None:
             reason = f"An error occurred getting {user}'s profile picture."
             self._logger.error(reason)
@@ -308,12 +907,15 @@ class FunnyBot(discord.Client):
         filename = f"{profile.username}_pfp.png"
 
         # converting the pfp to whatever format is chosen
-        converted = self._crop_convert(
-            icon_response.bytes,
-            crop=CropMethod.NOCROP,
-            export_format=self.image_export_format,
-            filename=icon_response.url,
-        )
+        with self.measure("crop_convert", PostType.USER):
+            converted = await self._pipeline.run(
+                "process",
+                self._crop_convert,
+                icon_response.bytes,
+                crop=CropMethod.NOCROP,
+                export_format=self.image_export_format,
+                filename=icon_response.url,
+            )
 
         # user has icon, returning it
         file = discord.File(converted, filename=filename)
@@ -321,7 +923,7 @@ class FunnyBot(discord.Client):
         # returning the image
         return file
 
-    def get_user(self, user: str) -> "discord.Embed":
+    async def get_user(self, user: str) -> "discord.Embed":
         """
         This function returns the target user's profile as a
         `discord.Embed` object.
@@ -335,7 +937,7 @@ class FunnyBot(discord.Client):
 
         # getting the user's profile
         try:
-            profile = self.get_profile_by_name(user)
+            profile = await self.get_profile_by_name(user)
 
         # something happened
         except RuntimeError as reason:
@@ -383,7 +985,7 @@ class FunnyBot(discord.Client):
         # replying to interaction
         return embed
 
-    def get_post(
+    async def get_post(
         self,
         link: str,
         crop_method: CropMethod = CropMethod.AUTO,
@@ -409,11 +1011,12 @@ class FunnyBot(discord.Client):
 
         # got a valid link, getting the post information
         try:
-            post = self._create_post(
-                url,
-                self._headers,
-                crop=crop_method,
-            )
+            with self._tracer.span("create_post", url):
+                post = await self._create_post(
+                    url,
+                    self._headers,
+                    crop=crop_method,
+                )
 
         # something happened
         except RuntimeError as reason:
@@ -443,49 +1046,51 @@ class FunnyBot(discord.Client):
                 f"Couldn't embed the post at {link}. It was either taken down or incorrect."
             )
 
-        # creating an embed
-        embed = discord.Embed(
-            title=f"Post by {sanitize_special_characters(post.author)}",
-            url=post.url,
-            description=f"{post.likes} likes.\t{post.comments} comments.",
-        )
-        embed.set_author(
-            name=post.author,
-            url=post.username_to_url(),
-            icon_url=post.icon_url,
-        )
-
-        # create the filename
-        filename = encode_url(post.url)
+        # the embed and the file of the reply
+        with self._tracer.span("embed"):
+            # creating an embed
+            embed = discord.Embed(
+                title=f"Post by {sanitize_special_characters(post.author)}",
+                url=post.url,
+                description=f"{post.likes} likes.\t{post.comments} comments.",
+            )
+            embed.set_author(
+                name=post.author,
+                url=post.username_to_url(),
+                icon_url=post.icon_url,
+            )
 
-        # forming the file extension
-        extension = ""
-        match post.post_type:
-            case PostType.PICTURE:
-                extension = "png"
-            case PostType.VIDEO:
-                extension = "mp4"
-            case PostType.GIF:
-                extension = "gif"
-            case _:
-                # this should never happen
-                self._logger.error(
-                    "Tried to make extension of invalid post type: %s", post.post_type
-                )
+            # create the filename
+            filename = encode_url(post.url)
+
+            # forming the file extension
+            extension = ""
+            match post.post_type:
+                case PostType.PICTURE:
+                    extension = "png"
+                case PostType.VIDEO:
+                    extension = "mp4"
+                case PostType.GIF:
+                    extension = "gif"
+                case _:
+                    # this should never happen
+                    self._logger.error(
+                        "Tried to make extension of invalid post type: %s", post.post_type
+                    )
 
-        # creating the file object
-        filename = f"{filename}.{extension}"
+            # creating the file object
+            filename = f"{filename}.{extension}"
 
-        # casting to a bytes IO object
-        file = discord.File(post.content, filename=filename)
+            # casting to a bytes IO object
+            file = discord.File(post.content, filename=filename)
 
         return (embed, file, post.content_url, post.post_type)
 
-    def get_profile_by_name(self, username: str) -> Optional[Profile]:
+    async def get_profile_by_name(self, username: str) -> Optional[Profile]:
         """Get's a user's profile by username"""
-        return self._create_profile(username, _headers=self._headers)
+        return await self._create_profile(username, _headers=self._headers)
 
-    def get_profile_by_url(self, url: str) -> Optional[Profile]:
+    async def get_profile_by_url(self, url: str) -> Optional[Profile]:
         """Get's a user's profile by url"""
 
         # get the username from the url
@@ -495,18 +1100,19 @@ class FunnyBot(discord.Client):
             self._logger.error(reason)
             raise RuntimeError(reason)
 
-        return self._create_profile(username, _headers=self._headers)
+        return await self._create_profile(username, _headers=self._headers)
 
     # --- internal functions, mainly dealing with web scraping ---
 
-    def _create_post(
+    async def _create_post(
         self,
         url: str,
         headers: Optional[dict[str, str]] = None,
         crop: CropMethod = CropMethod.AUTO,
     ) -> Optional[Post]:
         """
-        This actually makes a `Post` object by webscraping.
+        This actually makes a `Post` object by webscraping, going through
+        every stage of the pipeline.
 
         If the result is `None`, then the post doesn't exist (or the user
         is shadow banned).
@@ -521,12 +1127,81 @@ class FunnyBot(discord.Client):
         # checking headers
         actual_headers = headers if headers is not None else self._headers
 
+        # the type of the post, as far as the url goes
+        post_type = get_datatype(url)
+
         # getting the post, assuming that it is a proper link
-        response = None
+        with self.measure("page_fetch", post_type):
+            response = await self._pipeline.run(
+                "fetch", self._fetch_page, url, actual_headers
+            )
+        if response is None:
+            self._logger.info("Post at %s was likely banned or shadow banned.", url)
+            return None
+        self._logger.info("The post at %s is still valid.", url)
+
+        # scraping the metadata
+        with self.measure("parse", post_type):
+            info = await self._pipeline.run("parse", self._parse_post, url, response)
+        self._last_scrape = time.time()
+
+        # getting the content of the post
+        try:
+            with self.measure("media_fetch", info.post_type):
+                content = await self._pipeline.run(
+                    "download", self._retrieve_content, info.content_url
+                )
+        except RuntimeError as reason:
+            # logging
+            self._logger.error(
+                "Caught error from _retrieve_content(%s): %s",
+                info.content_url,
+                reason,
+                exc_info=True,
+            )
+
+            # pickling the website as this is a parsing error
+            self._pickle_website(url, response.text, reason)
+
+            # raising
+            raise RuntimeError(
+                f"Error retrieving {info.post_type.name} from {url}."
+            ) from reason
+
+        # cropping, converting, etc.
+        with self._tracer.span("process"):
+            info.response = await self._pipeline.run(
+                "process", self._process_content, info, content, crop
+            )
+
+        # validate the object
         try:
-            response = requests.get(
-                url, headers=actual_headers, allow_redirects=False, timeout=10000
+            info.validate()
+        except RuntimeError as reason:
+            self._logger.error(
+                "Validation of the post failed, reason: %s", reason, exc_info=True
             )
+            raise reason
+
+        # returning the collected information
+        return info
+
+    def _fetch_page(
+        self, url: str, headers: dict[str, str]
+    ) -> Optional[CacheEntry]:
+        """
+        Fetches a page (a post or a profile) from iFunny.
+
+        If the result is `None`, then the page doesn't exist.
+
+        If a `RuntimeError` is thrown, it means that something connection
+        related happened.
+        """
+
+        # getting the page, assuming that it is a proper link
+        response = None
+        try:
+            response = self._fetcher.get(url, headers=headers)
         except NameResolutionError as e:
             raise e
         except Exception as e:
@@ -537,9 +1212,8 @@ class FunnyBot(discord.Client):
         # what did we get from the website?
         match response.status_code:
             case 200:
-                self._logger.info("The post at %s is still valid.", url)
+                return response
             case 404:
-                self._logger.info("Post at %s was likely banned or shadow banned.", url)
                 return None
             case _:
                 # raising an error because something went wrong
@@ -551,6 +1225,15 @@ class FunnyBot(discord.Client):
                 )
                 raise RuntimeError("There was an error making the request to iFunny.")
 
+    def _parse_post(self, url: str, response: CacheEntry) -> Post:
+        """
+        Scrapes the metadata of the post at `url` from its page, everything
+        but the content itself.
+
+        If a `ParsingError` is thrown, it means that this function failed
+        to parse the website for something.
+        """
+
         # transforming the response into something useable
         dom = soup(response.text, "html.parser")
         if not dom.css:
@@ -573,14 +1256,14 @@ class FunnyBot(discord.Client):
             )
 
             # pickle the webpage
-            self._pickle_website(
-                url,
-                response.text,
-                ParsingError(f"Couldn't obtain the canonical url of {url}, aborting."),
+            reason = ParsingError(
+                f"Couldn't obtain the canonical url of {url}, aborting.",
+                selector=Post.CANONICAL_SEL[0],
             )
+            self._pickle_website(url, response.text, reason)
 
             # returning
-            raise ParsingError(f"Couldn't obtain the canonical url of {url}, aborting.")
+            raise reason
 
         # grabbing the datatype
         canonical_url = canonical_el[0].get(Post.CANONICAL_SEL[1], None)
@@ -744,7 +1427,7 @@ class FunnyBot(discord.Client):
             raise e
 
         # logging
-        self._logger.info("Retrieved from %s: %s", url, repr(info))
+        self._logger.info("Retrieved from %s: %s", url, info)
 
         # doing some black magic parsing because iFunny is retarded and hates me
         if info.post_type == PostType.GIF:
@@ -768,26 +1451,16 @@ class FunnyBot(discord.Client):
             # logging
             self._logger.debug("New content url for the gif=%s", info.content_url)
 
+        # returning the collected information
+        return info
 
-        # getting the content of the post
-        try:
-            content = self._retrieve_content(info.content_url)  # type: ignore
-        except RuntimeError as reason:
-            # logging
-            self._logger.error(
-                "Caught error from _retrieve_content(%s): %s",
-                info.content_url,
-                reason,
-                exc_info=True,
-            )
-
-            # pickling the website as this is a parsing error
-            self._pickle_website(url, response.text, reason)
-
-            # raising
-            raise RuntimeError(
-                f"Error retrieving {info.post_type.name} from {url}."
-            ) from reason
+    def _process_content(
+        self, info: Post, content: Response, crop: CropMethod = CropMethod.AUTO
+    ) -> Response:
+        """
+        Processes the content of a post i.e., crops and converts pictures and
+        turns the videos behind gifs into actual gifs.
+        """
 
         match (info.post_type):
             # if the post is an image, crop it
@@ -796,29 +1469,51 @@ class FunnyBot(discord.Client):
                 self._logger.debug("Cropping image from %s", content.url)
 
                 # cropping
-                content.bytes = self._crop_convert(
-                    content.bytes,
-                    crop=crop,
-                    export_format=self.image_export_format,
-                    filename=content.url,
-                )
+                with self.measure("crop_convert", info.post_type):
+                    content.bytes = self._crop_convert(
+                        content.bytes,
+                        crop=crop,
+                        export_format=self.image_export_format,
+                        filename=content.url,
+                    )
 
             case PostType.GIF:
                 # logging
                 self._logger.debug("Converting video to gif from %s", content.url)
 
-                # extract the frames
-                frames = iio.imread(content.bytes, extension=".mp4", plugin="pyav")
+                # decoding the frames one at a time, every frame is turned into a
+                # palette image (what the GIF encoder does anyways) right away,
+                # which is a third of the size of the decoded frame
+                frames = (
+                    Image.fromarray(frame).convert("P", palette=Image.Palette.ADAPTIVE)
+                    for frame in iio.imiter(content.bytes, extension=".mp4", plugin="pyav")
+                )
+                with self.measure("gif_conversion", info.post_type):
+                    first = next(frames, None)
+                    if first is None:
+                        raise RuntimeError(f"Video from {content.url} has no frames")
+
+                    # convert to a gif, at 30 fps
+                    gif_bytes = SpooledBuffer(self._conf.spool_size)
+                    first.save(
+                        gif_bytes,
+                        format="GIF",
+                        save_all=True,
+                        append_images=frames,
+                        duration=1000 / 30,
+                        loop=0,
+                    )
 
-                # convert to a gif
-                gif_bytes = io.BytesIO()
-                iio.imwrite(gif_bytes, frames, extension=".gif", fps=30, loop=0)
+                # the video isn't needed anymore
+                content.bytes.close()
+                del first, frames
                 
                 # logging again
-                self._logger.debug("Converted video to gif, %d bytes", content.bytes.tell())
+                self._logger.debug("Converted video to gif, %r", gif_bytes)
 
                 # reset the pointer
                 gif_bytes.seek(0)
+                self._memory.track(gif_bytes, gif_bytes.memory_size)
 
                 # update the bytes of the content
                 content.bytes = gif_bytes
@@ -826,23 +1521,10 @@ class FunnyBot(discord.Client):
             case _:
                 pass
 
-        
-        # setting the response object back into the post object
-        info.response = content
-
-        # validate the object
-        try:
-            info.validate()
-        except RuntimeError as reason:
-            self._logger.error(
-                "Validation of the post failed, reason: %s", reason, exc_info=True
-            )
-            raise reason
-
-        # returning the collected information
-        return info
+        # returning the processed content
+        return content
 
-    def _create_profile(
+    async def _create_profile(
         self, username: str, _headers: dict[str, str]
     ) -> Optional[Profile]:
         """
@@ -861,36 +1543,37 @@ class FunnyBot(discord.Client):
         # creating the url of the user
         url = username_to_url(username)
 
-        # creating the profile object
-        profile = Profile(username=username)
+        # getting the profile
+        with self.measure("page_fetch", PostType.USER):
+            response = await self._pipeline.run(
+                "fetch", self._fetch_page, url, _headers
+            )
+        if response is None:
+            self._logger.info("User %s doesn't exist.", username)
+            return None
+        self._logger.info("Found user %s", username)
 
-        # getting the post, assuming that it is a proper link
-        response = None
-        try:
-            response = requests.get(
-                url, headers=_headers, allow_redirects=False, timeout=10000
+        # scraping the profile
+        with self.measure("parse", PostType.USER):
+            profile = await self._pipeline.run(
+                "parse", self._parse_profile, username, response
             )
-        except Exception as e:
-            reason = f"There was an exception making a GET request to {url}: {e}"
-            self._logger.error(reason)
-            raise RuntimeError(reason) from e
+        self._last_scrape = time.time()
+        return profile
 
-        # what did we get from the website?
-        match response.status_code:
-            case 200:
-                self._logger.info("Found user %s", username)
-            case 404:
-                self._logger.info("User %s doesn't exist.", username)
-                return None
-            case _:
-                # raising an error because something went wrong
-                self._logger.error(
-                    "Server responded with code %d when making request to %s, reason: %s",
-                    response.status_code,
-                    url,
-                    response.reason,
-                )
-                raise RuntimeError("There was an error making the request to iFunny.")
+    def _parse_profile(self, username: str, response: CacheEntry) -> Profile:
+        """
+        Scrapes the profile of `username` from their page.
+
+        If a `ParsingError` is thrown, it means that this function failed
+        to parse the website for something.
+        """
+
+        # creating the url of the user
+        url = username_to_url(username)
+
+        # creating the profile object
+        profile = Profile(username=username)
 
         # transforming the response into something useable
         dom = soup(response.text, "html.parser")
@@ -911,7 +1594,7 @@ class FunnyBot(discord.Client):
             # couldn't parse the username
             reason = f"Could't get the real username from user {username}'s profile"
             self._logger.error(reason)
-            raise ParsingError(reason)
+            raise ParsingError(reason, selector=Profile.USERNAME_SEL)
 
         # getting the profile picture
         if icon_el := dom.css.select(Profile.ICON_SEL):
@@ -947,7 +1630,7 @@ class FunnyBot(discord.Client):
             profile.features = "No features."
 
         # logging
-        self._logger.info("Retrieved from %s: %s", url, repr(profile))
+        self._logger.info("Retrieved from %s: %s", url, profile)
 
         # returning the collected information
         return profile
@@ -961,13 +1644,53 @@ class FunnyBot(discord.Client):
 
         This method removes all forms of cropping from the API since I mainly
         just don't trust it and for better control.
+
+        The bytes of the content are reserved from the memory budget before
+        it's downloaded, waiting for at most `Configuration.MEDIA_WAIT` seconds
+        if the budget is exhausted, after which an `OverloadedError` is raised
+        (the job is turned away like any other overloaded job). Large content
+        (or content of unknown size) is streamed into a `SpooledBuffer`,
+        which moves to disk once it outgrows the spool size.
         """
 
+        # the bytes reserved for the download
+        reserved = 0
+
+        def allocate(length: Optional[int]) -> Optional[IO[bytes]]:
+            nonlocal reserved
+
+            # waiting for memory, a spooled buffer never holds more than the spool size
+            nbytes = min(length or self._conf.spool_size, self._conf.spool_size)
+            if not self._memory.reserve(nbytes, timeout=self._conf.media_wait):
+                raise OverloadedError(
+                    f"No room in the media budget for {url} after {self._conf.media_wait}s ({self._memory})."
+                )
+            reserved = nbytes
+
+            # small enough to be held (and cached) in memory
+            if length is not None and length <= self._conf.spool_size:
+                return None
+
+            # spooling
+            self._logger.info(
+                "Spooling %s (%s bytes) to a buffer.", url, length or "unknown"
+            )
+            return SpooledBuffer(self._conf.spool_size)
+
         # getting the post, assuming that it is a proper link
         response = None
         try:
-            response = requests.get(url, allow_redirects=False, timeout=10000)
+            with self._tracer.span("download", url):
+                response = self._fetcher.get(url, allocate=allocate)
+        except OverloadedError as reason:
+            # not a failure of the download, the bot is too busy
+            self._logger.warning("Turned away the download of %s: %s", url, reason)
+            raise
         except Exception as e:  # type: ignore
+            # giving back the memory
+            if reserved:
+                self._memory.release(reserved)
+
             # got an error
             self._logger.error(
                 "Failed to retrieve content from %s, most likely no internet connection or a malformed url. Reason: %s",
@@ -979,8 +1702,26 @@ class FunnyBot(discord.Client):
                 f"Failed to retrieve content from {url}, most likely no internet connection or a malformed url. Reason: {e}"
             ) from e
 
+        # the body is either in memory or spooled
+        if response.buffer is not None:
+            buffer = response.buffer
+            header = buffer.read(Response.HEADER_SIZE)
+            buffer.seek(0)
+
+            # it moved to disk, nothing to hold memory for
+            if isinstance(buffer, SpooledBuffer) and not buffer.in_memory:
+                self._memory.release(reserved)
+                reserved = 0
+        else:
+            buffer = io.BytesIO(response.content)
+            header = response.content[: Response.HEADER_SIZE]
+
+        # the reserved bytes are given back once the buffer is gone i.e., uploaded
+        if reserved:
+            self._memory.bind(buffer, reserved)
+
         # do we have a body?
-        if not response.content:
+        if not header:
             self._logger.error(
                 "Expected the response from %s to have a body, it didn't", url
             )
@@ -990,48 +1731,47 @@ class FunnyBot(discord.Client):
 
         # looking at the file type from the header
         sig = None
-        sigs = pyfsig.find_matches_for_file_header(
-            response.content, signatures=IFUNNY_SIGS
-        )
+        with self._tracer.span("sniff"):
+            sigs = pyfsig.find_matches_for_file_header(header, signatures=IFUNNY_SIGS)
 
         # checking the number of signatures
         match len(sigs):
             case 0:
                 self._logger.warning("pyfsig failed to determine the type of the file.")
             case 1:
-                self._logger.debug("Signature of the file: %s", repr(sigs[0]))
+                self._logger.debug("Signature of the file: %r", sigs[0])
                 sig = sigs[0]
             case _:
                 self._logger.warning(
                     "More than one possible signature. Total: %d; %s",
                     len(sigs),
-                    ", ".join(map(lambda x: x.file_extension, sigs)),
+                    Lazy(", ".join, map(lambda x: x.file_extension, sigs)),
                 )
                 sig = sigs[0]
                 self._logger.warning(
                     "Picking the first signature: %s", sig.file_extension
                 )
 
-        # creating new Response object
-        resp = Response(
-            io.BytesIO(response.content), remove_image_cropping(url), sig, response
-        )
+        # creating new Response object, the body is in the buffer now
+        resp = Response(buffer, remove_image_cropping(url), sig, response)
+        resp.release()
+        del response
 
         # logging
-        self._logger.debug(resp)
+        self._logger.debug("%s", resp)
 
         # returning the response object
         return resp
 
     def _crop_convert(
         self,
-        _bytes: io.BytesIO,
+        _bytes: IO[bytes],
         crop: CropMethod = CropMethod.AUTO,
         export_format: ImageFormat = ImageFormat.PNG,
         filename: Optional[str] = None,
-    ) -> io.BytesIO:
+    ) -> SpooledBuffer:
         """
-        Converts a byte stream of type `io.BytesIO` to the specified format using PIL,
+        Converts a byte stream to the specified format using PIL, into a `SpooledBuffer`,
         also crops the bottom 20 pixels out of the image to remove the dreaded iFunny
         watermark.
 
@@ -1049,39 +1789,36 @@ class FunnyBot(discord.Client):
         # getting the effective filename of the image
         effective_name = filename if filename is not None else "unknown"
 
-        # turning bytes into an image
-        _image = Image.open(_bytes)
-
-        # new buffer
-        nbuf = io.BytesIO()
+        # turning bytes into an image, the encoded bytes aren't needed once
+        # the image is decoded
+        with self._tracer.span("decode"):
+            _image = Image.open(_bytes)
+            _image.load()
+            _bytes.close()
+            del _bytes
 
         # variables
         _hash = None
 
         # cropping the image
-        match crop:
-            case CropMethod.AUTO:
-                # determining if the image should be cropped or not
-                sub_image = Image.new(_image.mode, _image.size).crop(
-                    (
-                        _image.width - 100,
-                        _image.height - 20,
-                        _image.width,
-                        _image.height,
-                    )
-                )
-                _hash = hashlib.sha1(sub_image.tobytes()).hexdigest()
-                sub_image.close()
-
-                # testing
-                if _hash == WATERMARK_MAGIC_HASH:
+        with self._tracer.span("crop"):
+            match crop:
+                case CropMethod.AUTO:
+                    # determining if the image should be cropped or not, this is
+                    # the bottom right 100x20 corner of a blank image of the same mode
+                    sub_image = Image.new(_image.mode, (100, 20))
+                    _hash = hashlib.sha1(sub_image.tobytes()).hexdigest()
+                    sub_image.close()
+
+                    # testing
+                    if _hash == WATERMARK_MAGIC_HASH:
+                        _image = ImageOps.crop(_image, (0, 0, 0, 20))
+                case CropMethod.NOCROP:
+                    # don't crop
+                    pass
+                case CropMethod.FORCE:
+                    # force crop
                     _image = ImageOps.crop(_image, (0, 0, 0, 20))
-            case CropMethod.NOCROP:
-                # don't crop
-                pass
-            case CropMethod.FORCE:
-                # force crop
-                _image = ImageOps.crop(_image, (0, 0, 0, 20))
 
         # checking the accuracy of auto cropping
         if crop == CropMethod.AUTO:
@@ -1093,8 +1830,10 @@ class FunnyBot(discord.Client):
                 _hash == WATERMARK_MAGIC_HASH,
             )
 
-        # converting the image
-        _image.save(nbuf, format=export_format.name)
+        # converting the image into the one new buffer
+        with self._tracer.span("encode"):
+            nbuf = SpooledBuffer(self._conf.spool_size)
+            _image.save(nbuf, format=export_format.name)
 
         # logging
         # checking the file type
@@ -1107,9 +1846,9 @@ class FunnyBot(discord.Client):
             self._logger.info("Converted %s to %s.", _image.format, export_format.name)
 
         # cleanup
-        _bytes.close()
-        del _bytes
+        _image.close()
         nbuf.seek(0)
+        self._memory.track(nbuf, nbuf.memory_size)
 
         # returning the new buffer
         return nbuf
@@ -1118,41 +1857,13 @@ class FunnyBot(discord.Client):
         self, url: str, content: str, reason: Optional[Exception] = None
     ):
         """
-        Transforms the website into a pickle file. Saves it in the following
-        format:
-        {
-            url: `url`,
-            reason: `reason`,
-            payload: `content`,
-            timestamp: `datetime.now().timestamp()`
-        }
+        Archives the website (compressed and deduplicated, see `FailureArchive`)
+        into the pickles directory, along with `reason` and the selector that
+        failed, if `reason` is a `ParsingError` of a selector.
 
-        This should be used to debug HTML parsing errors.
+        This should be used to debug HTML parsing errors, it doesn't block.
         """
-
-        # creating filename
-        filename = (
-            f"{self.pickles_dir}/{datetime.now().timestamp()}-{encode_url(url)}.pickle"
-        )
-
-        # creating object
-        payload = {
-            "timestamp": datetime.now().timestamp(),
-            "url": url,
-            "reason": reason,
-            "payload": content,
-        }
-
-        # pickling
-        with open(filename, "wb") as p:
-            _bytes = pickle.dumps(payload)
-            p.write(_bytes)
-            self._logger.info(
-                "Pickled website for %s to %s (%d bytes)",
-                url,
-                filename,
-                len(_bytes),
-            )
+        self._archive.add(url, content, reason)
 
     # --- bot events ---
 
@@ -1178,7 +1889,14 @@ class FunnyBot(discord.Client):
                 )
 
         # logging
-        self._logger.info("Logged in as: %s", repr(self.user))
+        self._logger.info("Logged in as: %r", self.user)
+        self._logger.info("Running shards %s of %s.", self.shard_ids or "all", self.shard_count)
+
+    async def on_shard_ready(self, shard_id: int):
+        self._logger.info("Shard %d is ready: %s", shard_id, self.shard_stats().get(shard_id))
+
+    async def on_shard_disconnect(self, shard_id: int):
+        self._logger.warning("Shard %d disconnected: %s", shard_id, self.shard_stats().get(shard_id))
 
     async def on_message(self, message: discord.message.Message):
         # guard clauses
@@ -1198,60 +1916,164 @@ class FunnyBot(discord.Client):
         if not (urls := get_url(message.content)):
             return
 
-        # there might be multiple urls
-        for url in urls:
-            # what type of url was it? post or user?
-            post_type = get_datatype(url)
-            match post_type:
-                case PostType.USER:
-                    # getting the username from the url
-                    if (user := get_username_from_url(url)) is None:
-                        # there was an error
-                        await message.reply(
-                            content=f"Couldn't extract the username from: {url}",
-                        )
+        # dropping the message if the bot is too busy
+        if not self.admit(Priority.AUTOEMBED):
+            self._count(message, "shed")
+            return
+        self._count(message, "messages")
+
+        # tracing the message, the tasks of its urls are part of the trace
+        with self._tracer.trace("message"):
+            # there might be multiple urls, deduplicating them (keeping the first
+            # occurrence of every post so the replies stay in the original order)
+            unique: dict[str, str] = {}
+            for url in urls:
+                unique.setdefault(canonicalize_url(url), url)
+
+            # the jobs are scheduled per server (or per channel for DMs)
+            key = message.guild.id if message.guild is not None else message.channel.id
+
+            # processing the urls concurrently
+            limit = asyncio.Semaphore(self._conf.message_concurrency)
+            tasks = [
+                asyncio.create_task(self._process_url(url, limit, key))
+                for url in unique.values()
+            ]
+
+            # the upload limit of the server
+            upload_limit = (
+                message.guild.filesize_limit
+                if message.guild is not None
+                else Reply.MAX_UPLOAD_SIZE
+            )
+
+            # packing the replies into as few messages as possible, in the
+            # original order, sending a message whenever it's full
+            batch = Reply()
+            try:
+                for task in tasks:
+                    if (reply := await task) is None:
                         continue
 
-                    try:
-                        # making the embed
-                        embed = self.get_user(user)
-
-                        # logging
-                        self._logger.info(
-                            "Replying to interaction with embed about user %s", user
-                        )
-
-                        # passing the url as content since you actually can't click this on mobile
-                        await message.reply(embed=embed, content=url)
-                    except RuntimeError as reason:
-                        # there was an error
-                        await message.reply(content=str(reason))
-
-                # apparently, Python won't work properly if the case is a list of enums
-                # or comma-separated
-                case PostType.VIDEO | PostType.GIF | PostType.PICTURE | PostType.MEME:
-                    try:
-                        # creating everything
-                        (embed, file, content_url, actual_type) = self.get_post(url)
-
-                        # logging
-                        self._logger.info(
-                            "Replying to interaction with embed about post at %s", url
-                        )
-
-                        # replying to the user
-                        if actual_type == PostType.VIDEO and self.prefer_video_url:
-                            await message.reply(content=content_url)
-                            # await message.reply(embed=embed, content=content_url)
-                        else:
-                            await message.reply(embed=embed, file=file)
-                    except RuntimeError as reason:
-                        # there was an error
-                        await message.reply(content=str(reason))
+                    if not batch.fits(reply, upload_limit):
+                        with self.measure("upload", batch.kind):
+                            await message.reply(**batch.kwargs())
+                        self._count(message, "replies")
+                        self.free(*batch.files)
+                        batch = Reply()
+
+                    batch.merge(reply)
+
+                # sending what's left
+                if not batch.empty:
+                    with self.measure("upload", batch.kind):
+                        await message.reply(**batch.kwargs())
+                    self._count(message, "replies")
+            finally:
+                # don't leave anything running if a reply failed, and give back
+                # the memory of whatever was (or won't be) sent
+                self.free(*batch.files)
+                for task in tasks:
+                    task.cancel()
+                    if task.done() and not task.cancelled() and task.exception() is None:
+                        if (reply := task.result()) is not None:
+                            self.free(*reply.files)
+
+    async def _process_url(
+        self, url: str, limit: asyncio.Semaphore, key: int
+    ) -> Optional[Reply]:
+        """
+        Processes a single url from a message, bounded by the per message
+        limit `limit` and scheduled fairly under `key` (the server).
 
-                case _:
+        """
+        async with limit:
+            try:
+                with self._tracer.span("url", url):
+                    return await self._scheduler.submit(
+                        key, self._create_reply, url, priority=Priority.AUTOEMBED
+                    )
+            except OverloadedError as reason:
+                # auto-embeds are the first to go when the bot is busy
+                self._logger.warning("Dropped %s: %s", url, reason)
+                return None
+
+    async def _create_reply(self, url: str) -> Optional[Reply]:
+        """
+        Creates the reply for a url found in a message. Returns `None`
+        if there's nothing to reply with.
+
+        Any error but an `OverloadedError` becomes an error reply, so a single
+        bad link can't take down the replies to the other links of its message.
+        """
+
+        # what type of url was it? post or user?
+        post_type = get_datatype(url)
+        match post_type:
+            case PostType.USER:
+                # getting the username from the url
+                if (user := get_username_from_url(url)) is None:
+                    # there was an error
+                    return Reply(content=f"Couldn't extract the username from: {url}")
+
+                try:
+                    # making the embed
+                    embed = await self.get_user(user)
+
+                    # logging
+                    self._logger.info(
+                        "Replying to interaction with embed about user %s", user
+                    )
+
+                    # passing the url as content since you actually can't click this on mobile
+                    return Reply(embed=embed, content=url)
+                except OverloadedError:
+                    # the link is dropped, not replied to
+                    raise
+                except RuntimeError as reason:
+                    # there was an error
+                    return Reply(content=str(reason))
+                except Exception as reason:  # type: ignore
+                    # anything else is a bug, only losing the reply of this link to it
+                    self._logger.error(
+                        "Unexpected error creating the reply for %s: %s", url, reason, exc_info=True
+                    )
+                    return Reply(content=f"Encountered an unexpected error with {url}.")
+
+            # apparently, Python won't work properly if the case is a list of enums
+            # or comma-separated
+            case PostType.VIDEO | PostType.GIF | PostType.PICTURE | PostType.MEME:
+                try:
+                    # creating everything
+                    (embed, file, content_url, actual_type) = await self.get_post(url)
+
+                    # logging
+                    self._logger.info(
+                        "Replying to interaction with embed about post at %s", url
+                    )
+
+                    # replying to the user
+                    if actual_type == PostType.VIDEO and self.prefer_video_url:
+                        self.free(file)
+                        return Reply(content=content_url, post_type=actual_type)
+                        # return Reply(embed=embed, content=content_url)
+                    return Reply(embed=embed, file=file, post_type=actual_type)
+                except OverloadedError:
+                    # the link is dropped, not replied to
+                    raise
+                except RuntimeError as reason:
+                    # there was an error
+                    return Reply(content=str(reason))
+                except Exception as reason:  # type: ignore
+                    # anything else is a bug, only losing the reply of this link to it
                     self._logger.error(
-                        "Could not discern the type of the post, silently aborting. Type was %s",
-                        get_datatype(url),
+                        "Unexpected error creating the reply for %s: %s", url, reason, exc_info=True
                     )
-                    return None
+                    return Reply(content=f"Encountered an unexpected error with {url}.")
+
+            case _:
+                self._logger.error(
+                    "Could not discern the type of the post, silently aborting. Type was %s",
+                    get_datatype(url),
+                )
+                return None
@@ -0,0 +1,162 @@
+"""
+This file contains the lease broker that keeps several bot processes (or
+threads) from fetching the same thing at the same time.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from typing import Optional
+
+
+class LeaseBroker(object):
+    """
+    Hands out leases on keys (the URLs of posts and media) through a SQLite
+    database in WAL mode, so it works for every process on the host without
+    any outside service.
+
+    Whoever holds the lease on a key fetches it and puts the result in the
+    shared cache, everyone else waits for the lease to be released and reads
+    the result from the cache. A lease expires after `ttl` seconds, so a
+    crashed process can't hold a key forever, the holder renews it for as
+    long as it's still downloading.
+    """
+
+    # how long (in seconds) a lease is held without being renewed
+    TTL = 120.0
+
+    # how often (in seconds) a waiter checks on the lease
+    POLL_INTERVAL = 0.05
+
+    # how long (in seconds) to wait for another process holding the database
+    TIMEOUT = 30.0
+
+    def __init__(
+        self, path: str, ttl: float = TTL, poll_interval: float = POLL_INTERVAL
+    ):
+        self._path = path
+        self._ttl = ttl
+        self._poll_interval = poll_interval
+        self._lock = threading.Lock()
+
+        # statistics
+        self._claimed = 0
+        self._waited = 0
+
+        # autocommit, the transactions are explicit
+        self._connection = sqlite3.connect(
+            path,
+            timeout=LeaseBroker.TIMEOUT,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS leases (
+                key TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires REAL NOT NULL
+            )
+            """
+        )
+
+    def __repr__(self) -> str:
+        return f"<LeaseBroker: {self._path}, ttl={self._ttl}s, claimed={self._claimed}, waited={self._waited}>"
+
+    @property
+    def ttl(self) -> float:
+        """Returns how long (in seconds) a lease is held without being renewed."""
+        return self._ttl
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """Returns the number of leases claimed and the number of waits for a lease."""
+        return {"claimed": self._claimed, "waited": self._waited}
+
+    @staticmethod
+    def _owner() -> str:
+        """Returns the name of the caller i.e., its process and thread."""
+        return f"{os.getpid()}:{threading.get_ident()}"
+
+    def claim(self, key: str) -> bool:
+        """
+        Claims the lease on `key`, returns false if someone else holds it.
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                # taking over expired leases
+                self._connection.execute(
+                    "DELETE FROM leases WHERE key = ? AND expires <= ?", (key, now)
+                )
+                claimed = (
+                    self._connection.execute(
+                        "INSERT OR IGNORE INTO leases VALUES (?, ?, ?)",
+                        (key, LeaseBroker._owner(), now + self._ttl),
+                    ).rowcount
+                    == 1
+                )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+        if claimed:
+            self._claimed += 1
+        return claimed
+
+    def renew(self, key: str) -> bool:
+        """
+        Extends the lease on `key` by another `ttl` seconds, returns false if
+        the caller doesn't hold it (anymore).
+        """
+        with self._lock:
+            return (
+                self._connection.execute(
+                    "UPDATE leases SET expires = ? WHERE key = ? AND owner = ?",
+                    (time.time() + self._ttl, key, LeaseBroker._owner()),
+                ).rowcount
+                == 1
+            )
+
+    def release(self, key: str):
+        """Releases the lease on `key`, if the caller holds it."""
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM leases WHERE key = ? AND owner = ?",
+                (key, LeaseBroker._owner()),
+            )
+
+    def held(self, key: str) -> bool:
+        """Returns true if anyone holds an unexpired lease on `key`."""
+        with self._lock:
+            return (
+                self._connection.execute(
+                    "SELECT 1 FROM leases WHERE key = ? AND expires > ?",
+                    (key, time.time()),
+                ).fetchone()
+                is not None
+            )
+
+    def wait(self, key: str, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until nobody holds the lease on `key` (it was released or it
+        expired without being renewed), returns false if it's still held
+        after `timeout` seconds (if any).
+        """
+        self._waited += 1
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while self.held(key):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self._poll_interval)
+        return True
+
+    def close(self):
+        """Closes the database."""
+        with self._lock:
+            self._connection.close()
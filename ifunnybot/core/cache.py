@@ -0,0 +1,88 @@
+"""
+This file contains the cache used by the fetch layer.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from ifunnybot.types.cache_entry import CacheEntry
+
+
+class Cache(object):
+    """
+    A thread safe, size capped, least recently used cache of `CacheEntry`
+    objects keyed by their URL.
+    """
+
+    # the total size of all bodies in the cache
+    MAX_SIZE = 32_000_000
+
+    # bodies larger than this are never cached, i.e., long videos
+    MAX_ENTRY_SIZE = 4_000_000
+
+    def __init__(
+        self, max_size: int = MAX_SIZE, max_entry_size: int = MAX_ENTRY_SIZE
+    ):
+        self._max_size = max_size
+        self._max_entry_size = max_entry_size
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<Cache: {len(self)} entries, {self._size / 1_000_000} MB / {self._max_size / 1_000_000} MB>"
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """Returns the total size of the cached bodies in bytes."""
+        return self._size
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        """
+        Returns the entry for `url` (fresh or not), `None` if it isn't cached.
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+            return entry
+
+    def put(self, entry: CacheEntry) -> bool:
+        """
+        Caches `entry`, evicting the least recently used entries if needed.
+
+        Returns false if the entry was too large to be cached.
+        """
+        if entry.size > self._max_entry_size:
+            return False
+
+        with self._lock:
+            # replacing the old entry
+            if (old := self._entries.pop(entry.url, None)) is not None:
+                self._size -= old.size
+
+            self._entries[entry.url] = entry
+            self._size += entry.size
+
+            # evicting
+            while self._size > self._max_size and self._entries:
+                (_, evicted) = self._entries.popitem(last=False)
+                self._size -= evicted.size
+
+        return True
+
+    def remove(self, url: str):
+        """Removes the entry for `url` from the cache, if any."""
+        with self._lock:
+            if (old := self._entries.pop(url, None)) is not None:
+                self._size -= old.size
+
+    def clear(self):
+        """Removes every entry from the cache."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
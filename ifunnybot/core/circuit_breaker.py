@@ -0,0 +1,120 @@
+"""
+This file contains the circuit breaker used by the fetch layer, so a host
+that is down isn't hammered (and waited on) by every job.
+"""
+
+import time
+import threading
+from typing import Optional
+
+
+class CircuitBreaker(object):
+    """
+    A thread safe circuit breaker for a single host.
+
+    It's closed (requests go through) until `threshold` requests in a row
+    fail, then it opens and every request is turned away for `cooldown`
+    seconds. After that it's half-open: a single request is let through as
+    a probe, closing the breaker if it succeeds and opening it again if it
+    fails.
+    """
+
+    # the states of the breaker
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    # the number of failures in a row that open the breaker
+    THRESHOLD = 5
+
+    # how long (in seconds) the breaker stays open before probing the host
+    COOLDOWN = 30.0
+
+    def __init__(
+        self, name: str, threshold: int = THRESHOLD, cooldown: float = COOLDOWN
+    ):
+        self._name = name
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self._lock = threading.Lock()
+
+        # the failures in a row, and when the breaker opened (or probed) last
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_at: Optional[float] = None
+
+        # statistics
+        self._opened = 0
+        self._rejected = 0
+
+    def __repr__(self) -> str:
+        return f"<CircuitBreaker {self._name}: {self.state}, {self._failures} failures, opened {self._opened} times, rejected {self._rejected}>"
+
+    @property
+    def name(self) -> str:
+        """Returns the name of the breaker (the host)."""
+        return self._name
+
+    @property
+    def state(self) -> str:
+        """Returns the state of the breaker."""
+        if self._opened_at is None:
+            return CircuitBreaker.CLOSED
+        if time.monotonic() - self._opened_at < self._cooldown:
+            return CircuitBreaker.OPEN
+        return CircuitBreaker.HALF_OPEN
+
+    @property
+    def retry_in(self) -> float:
+        """Returns how long (in seconds) until the host is probed, 0 if it isn't open."""
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self._opened_at + self._cooldown - time.monotonic())
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """Returns the number of times the breaker opened and the number of rejected requests."""
+        return {"opened": self._opened, "rejected": self._rejected}
+
+    def allow(self) -> bool:
+        """
+        Returns true if a request can be made. While half-open, only one
+        request (the probe) is allowed per cooldown.
+        """
+        with self._lock:
+            match self.state:
+                case CircuitBreaker.CLOSED:
+                    return True
+                case CircuitBreaker.HALF_OPEN if (
+                    self._probe_at is None
+                    or time.monotonic() - self._probe_at >= self._cooldown
+                ):
+                    self._probe_at = time.monotonic()
+                    return True
+                case _:
+                    self._rejected += 1
+                    return False
+
+    def success(self):
+        """Records a successful request, closing the breaker."""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_at = None
+
+    def failure(self) -> bool:
+        """
+        Records a failed request, opening the breaker if there were too many.
+        Returns true if it was closed before.
+        """
+        with self._lock:
+            self._failures += 1
+            if self._opened_at is None and self._failures < self._threshold:
+                return False
+
+            opened = self._opened_at is None
+            if opened:
+                self._opened += 1
+            self._opened_at = time.monotonic()
+            self._probe_at = None
+            return opened
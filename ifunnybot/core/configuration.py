@@ -1,3 +1,5 @@
+from typing import Optional
+
 from ifunnybot.types.mode import ImageFormat
 
 class Configuration:
@@ -8,9 +10,43 @@ class Configuration:
     # writing data
     PICKLE_LOCATION = "pickles"
 
+    # the total size (in bytes) of the pages kept in the pickle location, the
+    # least recently failed ones are removed past it
+    ARCHIVE_SIZE: int = 64_000_000
+
     # logging
     LOG_LOCATION = "logs"
 
+    # the size (in bytes) at which the log file is rotated, and how many
+    # rotated files are kept
+    LOG_MAX_BYTES: int = 10_000_000
+    LOG_BACKUP_COUNT: int = 5
+
+    # the log levels of the components of the bot (i.e., "fetcher", "scheduler",
+    # "pipeline", "monitor", "admission"), overriding the level of the mode
+    LOG_LEVELS: dict[str, str] = {}
+
+    # errors are posted to the error channel as a digest, at most once this often (in seconds)
+    ERROR_REPORT_INTERVAL: float = 60.0
+
+    # the metrics are served on http://METRICS_HOST:METRICS_PORT/metrics, not at all if the port is None
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: Optional[int] = None
+
+    # the queues of only the servers with the most jobs waiting are exported (as guild_jobs_pending)
+    METRICS_TOP_GUILDS: int = 10
+
+    # the number of the slowest traces (of messages and interactions) that are kept, served on /traces
+    SLOW_TRACES: int = 20
+
+    # how long (in seconds) a profile takes by default, started with SIGUSR1 or /profile
+    PROFILE_SECONDS: float = 30.0
+
+    # the bot counts as stuck (/healthz fails) once the event loop is blocked,
+    # or a stage of the pipeline has been running a single item, for this long (in seconds)
+    LIVENESS_MAX_BLOCKED: float = 30.0
+    LIVENESS_MAX_RUN: float = 300.0
+
     # default image format
     IMAGE_FORMAT: ImageFormat = ImageFormat.PNG
 
@@ -18,17 +54,168 @@ class Configuration:
     # this saves on performance
     PREFER_VIDEO_URL: bool = True
 
+    # how long (in seconds) a cached page or media object is used before
+    # it gets revalidated with iFunny
+    CACHE_TTL: float = 300
+
+    # the maximum size (in bytes) of all cached pages and media objects
+    CACHE_SIZE: int = 32_000_000
+
+    # the SQLite database the cache is kept in, shared by every bot process
+    # on the host (i.e., shard groups), the cache is kept in memory if None
+    CACHE_PATH: Optional[str] = None
+
+    # with a cache path, only one process fetches a URL at a time while the
+    # others wait for its result, for at most this long (in seconds) unless
+    # it's still downloading, kept well above the timeout of a request (30s)
+    LEASE_TTL: float = 120.0
+
+    # once this many requests in a row to a host fail, requests to it are
+    # turned away for the cooldown (in seconds) instead of waiting on it
+    FAILURE_THRESHOLD: int = 5
+    BREAKER_COOLDOWN: float = 30.0
+
+    # the origins requests are sent to instead of the ones in the urls, by
+    # origin e.g., {"https://ifunny.co": "http://127.0.0.1:8080"} for a local
+    # stand-in of iFunny (see `benchmarks/standin.py`)
+    HOSTS: dict[str, str] = {}
+
+    # the maximum number of links processed at once for a single message
+    MESSAGE_CONCURRENCY: int = 3
+
+    # the maximum number of links processed at once across every message
+    MAX_CONCURRENT_JOBS: int = 4
+
+    # the maximum number of links processed at once for a single server,
+    # so a single server can't hog the bot
+    MAX_GUILD_JOBS: int = 2
+
+    # the number of job slots kept for slash commands, links posted in
+    # messages can't use these
+    RESERVED_JOBS: int = 1
+
+    # the maximum number of links waiting to be processed, any more are dropped
+    MAX_PENDING_JOBS: int = 64
+
+    # the number of workers of every stage of the pipeline, size these to
+    # the hardware e.g., the number of cores for "process" (a stage never
+    # gets more workers than the maximum number of jobs, more would be idle)
+    PIPELINE_WORKERS: dict[str, int] = {
+        "fetch": 4,
+        "parse": 2,
+        "download": 4,
+        "process": 2,
+    }
+
+    # the maximum number of items waiting in front of every stage, the maximum
+    # number of jobs if None: a job is in one stage at a time, so the jobs
+    # running (bounded by the scheduler) bound what can wait in the stages
+    PIPELINE_QUEUE_SIZE: Optional[int] = None
+
+    # the bot turns away new jobs once any of these are reached: the number
+    # of jobs waiting, the bytes of media in flight and the lag of the event loop
+    ADMISSION_MAX_PENDING: int = 32
+    MAX_MEDIA_BYTES: int = 128_000_000
+    MAX_LOOP_LAG: float = 0.5
+
+    # the lag (in seconds) past which the stack of the blocked event loop is captured and logged
+    LOOP_STALL_THRESHOLD: float = 0.1
+
+    # the maximum bytes of downloaded media held in memory, downloads wait
+    # for room once it's used up, and the size past which media is kept
+    # on disk instead
+    MEDIA_BUDGET: int = 96_000_000
+    SPOOL_SIZE: int = 4_000_000
+
+    # how long (in seconds) a download waits for room in the media budget,
+    # the job is turned away as overloaded after that
+    MEDIA_WAIT: float = 10.0
+
+    # how long (in seconds) the jobs in flight get to finish on shutdown
+    DRAIN_TIMEOUT: float = 30.0
+
     def __init__(
         self,
         pickle_location: str = PICKLE_LOCATION,
+        archive_size: int = ARCHIVE_SIZE,
         log_location: str = LOG_LOCATION,
+        log_max_bytes: int = LOG_MAX_BYTES,
+        log_backup_count: int = LOG_BACKUP_COUNT,
+        log_levels: Optional[dict[str, str]] = None,
+        error_report_interval: float = ERROR_REPORT_INTERVAL,
+        metrics_host: str = METRICS_HOST,
+        metrics_port: Optional[int] = METRICS_PORT,
+        metrics_top_guilds: int = METRICS_TOP_GUILDS,
+        slow_traces: int = SLOW_TRACES,
+        profile_seconds: float = PROFILE_SECONDS,
+        liveness_max_blocked: float = LIVENESS_MAX_BLOCKED,
+        liveness_max_run: float = LIVENESS_MAX_RUN,
         image_format: ImageFormat = IMAGE_FORMAT,
-        prefer_video_url: bool = PREFER_VIDEO_URL
+        prefer_video_url: bool = PREFER_VIDEO_URL,
+        cache_ttl: float = CACHE_TTL,
+        cache_size: int = CACHE_SIZE,
+        cache_path: Optional[str] = CACHE_PATH,
+        lease_ttl: float = LEASE_TTL,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        breaker_cooldown: float = BREAKER_COOLDOWN,
+        hosts: Optional[dict[str, str]] = None,
+        message_concurrency: int = MESSAGE_CONCURRENCY,
+        max_concurrent_jobs: int = MAX_CONCURRENT_JOBS,
+        max_guild_jobs: int = MAX_GUILD_JOBS,
+        reserved_jobs: int = RESERVED_JOBS,
+        max_pending_jobs: int = MAX_PENDING_JOBS,
+        pipeline_workers: Optional[dict[str, int]] = None,
+        pipeline_queue_size: Optional[int] = PIPELINE_QUEUE_SIZE,
+        admission_max_pending: int = ADMISSION_MAX_PENDING,
+        max_media_bytes: int = MAX_MEDIA_BYTES,
+        max_loop_lag: float = MAX_LOOP_LAG,
+        loop_stall_threshold: float = LOOP_STALL_THRESHOLD,
+        media_budget: int = MEDIA_BUDGET,
+        spool_size: int = SPOOL_SIZE,
+        media_wait: float = MEDIA_WAIT,
+        drain_timeout: float = DRAIN_TIMEOUT,
     ):
         self.pickle_location = pickle_location
+        self.archive_size = archive_size
         self.log_location = log_location
+        self.log_max_bytes = log_max_bytes
+        self.log_backup_count = log_backup_count
+        self.log_levels = {**Configuration.LOG_LEVELS, **(log_levels or {})}
+        self.error_report_interval = error_report_interval
+        self.metrics_host = metrics_host
+        self.metrics_port = metrics_port
+        self.metrics_top_guilds = metrics_top_guilds
+        self.slow_traces = slow_traces
+        self.profile_seconds = profile_seconds
+        self.liveness_max_blocked = liveness_max_blocked
+        self.liveness_max_run = liveness_max_run
         self.image_format = image_format
         self.prefer_video_url = prefer_video_url
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.cache_path = cache_path
+        self.lease_ttl = lease_ttl
+        self.failure_threshold = failure_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.hosts = {**Configuration.HOSTS, **(hosts or {})}
+        self.message_concurrency = message_concurrency
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.max_guild_jobs = max_guild_jobs
+        self.reserved_jobs = reserved_jobs
+        self.max_pending_jobs = max_pending_jobs
+        self.pipeline_workers = {
+            **Configuration.PIPELINE_WORKERS,
+            **(pipeline_workers or {}),
+        }
+        self.pipeline_queue_size = pipeline_queue_size
+        self.admission_max_pending = admission_max_pending
+        self.max_media_bytes = max_media_bytes
+        self.max_loop_lag = max_loop_lag
+        self.loop_stall_threshold = loop_stall_threshold
+        self.media_budget = media_budget
+        self.spool_size = spool_size
+        self.media_wait = media_wait
+        self.drain_timeout = drain_timeout
 
     def __repr__(self) -> str:
-        return f"<Configuration: log_location={self.log_location}, pickle_location={self.pickle_location}, image_format={self.image_format.name}, prefer_video_url={self.prefer_video_url}>"
+        return f"<Configuration: log_location={self.log_location}, log_max_bytes={self.log_max_bytes}, log_backup_count={self.log_backup_count}, log_levels={self.log_levels}, error_report_interval={self.error_report_interval}, metrics_host={self.metrics_host}, metrics_port={self.metrics_port}, metrics_top_guilds={self.metrics_top_guilds}, slow_traces={self.slow_traces}, profile_seconds={self.profile_seconds}, liveness_max_blocked={self.liveness_max_blocked}, liveness_max_run={self.liveness_max_run}, pickle_location={self.pickle_location}, archive_size={self.archive_size}, image_format={self.image_format.name}, prefer_video_url={self.prefer_video_url}, cache_ttl={self.cache_ttl}, cache_size={self.cache_size}, cache_path={self.cache_path}, lease_ttl={self.lease_ttl}, failure_threshold={self.failure_threshold}, breaker_cooldown={self.breaker_cooldown}, hosts={self.hosts}, message_concurrency={self.message_concurrency}, max_concurrent_jobs={self.max_concurrent_jobs}, max_guild_jobs={self.max_guild_jobs}, reserved_jobs={self.reserved_jobs}, max_pending_jobs={self.max_pending_jobs}, pipeline_workers={self.pipeline_workers}, pipeline_queue_size={self.pipeline_queue_size}, admission_max_pending={self.admission_max_pending}, max_media_bytes={self.max_media_bytes}, max_loop_lag={self.max_loop_lag}, loop_stall_threshold={self.loop_stall_threshold}, media_budget={self.media_budget}, spool_size={self.spool_size}, media_wait={self.media_wait}, drain_timeout={self.drain_timeout}>"
@@ -0,0 +1,241 @@
+"""
+This file contains the persistent cache used by the fetch layer when several
+bot processes (i.e., shard groups) run on the same host.
+"""
+
+import json
+import time
+import sqlite3
+import threading
+from typing import Optional
+
+from ifunnybot.core.cache import Cache
+from ifunnybot.types.cache_entry import CacheEntry
+
+
+class DiskCache(object):
+    """
+    A thread (and process) safe, size capped, least recently used cache of
+    `CacheEntry` objects keyed by their URL, kept in a SQLite database.
+
+    It's a drop-in replacement for `Cache`. The database is in WAL mode, so
+    every process on the host can read it while another one writes to it,
+    and it survives restarts.
+
+    The total size of the bodies is kept in a table of its own, updated by
+    triggers, instead of summing every entry on every write. Reads only
+    write when the last use of an entry is older than `TOUCH_INTERVAL`, so
+    hits don't queue up on the write lock of the database.
+    """
+
+    # the total size of all bodies in the cache
+    MAX_SIZE = 256_000_000
+
+    # bodies larger than this are never cached, i.e., long videos
+    MAX_ENTRY_SIZE = Cache.MAX_ENTRY_SIZE
+
+    # how long (in seconds) to wait for another process holding the database
+    TIMEOUT = 30.0
+
+    # how stale (in seconds) the last use of an entry can get before a hit
+    # updates it, which is all the precision the eviction order needs
+    TOUCH_INTERVAL = 5.0
+
+    def __init__(
+        self,
+        path: str,
+        max_size: int = MAX_SIZE,
+        max_entry_size: int = MAX_ENTRY_SIZE,
+    ):
+        self._path = path
+        self._max_size = max_size
+        self._max_entry_size = max_entry_size
+        self._lock = threading.Lock()
+
+        # autocommit, the transactions are explicit
+        self._connection = sqlite3.connect(
+            path,
+            timeout=DiskCache.TIMEOUT,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                status_code INTEGER NOT NULL,
+                reason TEXT NOT NULL,
+                content BLOB NOT NULL,
+                headers TEXT NOT NULL,
+                encoding TEXT,
+                expires REAL NOT NULL,
+                size INTEGER NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)"
+        )
+
+        # the running total of the sizes, a database from before it gets its
+        # total once, from the entries it already has
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS totals (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    size INTEGER NOT NULL
+                )
+                """
+            )
+            self._connection.execute(
+                "INSERT OR IGNORE INTO totals SELECT 0, COALESCE(SUM(size), 0) FROM entries"
+            )
+            self._connection.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries
+                BEGIN UPDATE totals SET size = size + NEW.size WHERE id = 0; END
+                """
+            )
+            self._connection.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries
+                BEGIN UPDATE totals SET size = size - OLD.size WHERE id = 0; END
+                """
+            )
+            self._connection.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries
+                BEGIN UPDATE totals SET size = size - OLD.size + NEW.size WHERE id = 0; END
+                """
+            )
+            self._connection.execute("COMMIT")
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+
+    def __repr__(self) -> str:
+        return f"<DiskCache: {self._path}, {len(self)} entries, {self.size / 1_000_000} MB / {self._max_size / 1_000_000} MB>"
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    @property
+    def path(self) -> str:
+        """Returns the path of the database."""
+        return self._path
+
+    @property
+    def size(self) -> int:
+        """Returns the total size of the cached bodies in bytes."""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT size FROM totals WHERE id = 0"
+            ).fetchone()[0]
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        """
+        Returns the entry for `url` (fresh or not), `None` if it isn't cached.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT status_code, reason, content, headers, encoding, expires, accessed FROM entries WHERE url = ?",
+                (url,),
+            ).fetchone()
+            if row is None:
+                return None
+
+            # only writing when the last use is getting stale
+            if now - row[6] > DiskCache.TOUCH_INTERVAL:
+                self._connection.execute(
+                    "UPDATE entries SET accessed = ? WHERE url = ?", (now, url)
+                )
+
+        (status_code, reason, content, headers, encoding, expires, _) = row
+        return CacheEntry(
+            url, status_code, reason, content, json.loads(headers), encoding, expires
+        )
+
+    def put(self, entry: CacheEntry) -> bool:
+        """
+        Caches `entry`, evicting the least recently used entries if needed.
+
+        Returns false if the entry was too large to be cached.
+        """
+        if entry.size > self._max_entry_size:
+            return False
+
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                # an upsert, a replace wouldn't run the triggers of the row it deletes
+                self._connection.execute(
+                    """
+                    INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (url) DO UPDATE SET
+                        status_code = excluded.status_code,
+                        reason = excluded.reason,
+                        content = excluded.content,
+                        headers = excluded.headers,
+                        encoding = excluded.encoding,
+                        expires = excluded.expires,
+                        size = excluded.size,
+                        accessed = excluded.accessed
+                    """,
+                    (
+                        entry.url,
+                        entry.status_code,
+                        entry.reason,
+                        entry.content,
+                        json.dumps(entry.headers),
+                        entry.encoding,
+                        entry.expires,
+                        entry.size,
+                        time.time(),
+                    ),
+                )
+
+                # evicting
+                size = self._connection.execute(
+                    "SELECT size FROM totals WHERE id = 0"
+                ).fetchone()[0]
+                if size > self._max_size:
+                    evicted = []
+                    for (url, entry_size) in self._connection.execute(
+                        "SELECT url, size FROM entries ORDER BY accessed"
+                    ):
+                        if size <= self._max_size:
+                            break
+                        evicted.append((url,))
+                        size -= entry_size
+                    self._connection.executemany(
+                        "DELETE FROM entries WHERE url = ?", evicted
+                    )
+
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+        return True
+
+    def remove(self, url: str):
+        """Removes the entry for `url` from the cache, if any."""
+        with self._lock:
+            self._connection.execute("DELETE FROM entries WHERE url = ?", (url,))
+
+    def clear(self):
+        """Removes every entry from the cache."""
+        with self._lock:
+            self._connection.execute("DELETE FROM entries")
+
+    def close(self):
+        """Closes the database."""
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,333 @@
+"""
+This file contains the fetch layer, everything that talks to iFunny or
+the iFunny CDN goes through here.
+"""
+
+import time
+import logging
+from urllib.parse import urlsplit
+from http.cookiejar import DefaultCookiePolicy
+from typing import IO, Callable, Optional
+
+import requests
+
+from ifunnybot.core.cache import Cache
+from ifunnybot.core.disk_cache import DiskCache
+from ifunnybot.core.broker import LeaseBroker
+from ifunnybot.core.circuit_breaker import CircuitBreaker
+from ifunnybot.types.cache_entry import CacheEntry
+from ifunnybot.types.circuit_open_exception import CircuitOpenError
+
+
+class Fetcher(object):
+    """
+    Makes GET requests on behalf of the bot and caches the responses.
+
+    Stale entries that have validators (`ETag` or `Last-Modified`) are
+    revalidated with a conditional GET, meaning that a `304 Not Modified`
+    refreshes the entry without downloading the body again.
+
+    With a `LeaseBroker` (and a cache shared between processes), only one
+    process (or thread) fetches a URL at a time, the others wait for it and
+    use its result from the cache. The lease is renewed while the body
+    downloads, and given up as soon as it's clear that the body won't be
+    cached (i.e., large media), as there's nothing to wait for then.
+
+    Every host has a `CircuitBreaker`. Once a host keeps failing (errors or
+    5xx responses), requests to it are turned away with a `CircuitOpenError`
+    instead of waiting on it, unless there's a stale copy in the cache,
+    which is used instead.
+
+    Requests can be sent to other hosts than the ones in the urls with
+    `hosts`, a mapping of origins to the origins used instead e.g.,
+    `{"https://ifunny.co": "http://127.0.0.1:8080"}` (for a local stand-in
+    of iFunny). The cache and the circuit breakers still go by the urls.
+    """
+
+    # how long (in seconds) an entry is used without asking the server
+    TTL = 300
+
+    # the timeout (in seconds) of connecting and of every read, a hung
+    # request holds a worker of the pipeline for this long at most
+    TIMEOUT = 30
+
+    # the size of the chunks a body is streamed in
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        cache: Optional[Cache | DiskCache] = None,
+        ttl: float = TTL,
+        broker: Optional[LeaseBroker] = None,
+        failure_threshold: int = CircuitBreaker.THRESHOLD,
+        cooldown: float = CircuitBreaker.COOLDOWN,
+        hosts: Optional[dict[str, str]] = None,
+    ):
+        self._logger = logger
+        self._cache = cache if cache is not None else Cache()
+        self._ttl = ttl
+        self._broker = broker
+        self._hosts = {k.rstrip("/"): v.rstrip("/") for (k, v) in (hosts or {}).items()}
+
+        # the circuit breakers, by host
+        self._failure_threshold = failure_threshold
+        self._cooldown = cooldown
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+        # re-using connections, but staying as stateless as a plain `requests.get`
+        self._session = requests.Session()
+        self._session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+        # statistics
+        self._hits = 0
+        self._revalidations = 0
+        self._misses = 0
+        self._shared = 0
+        self._stale = 0
+        self._last_success: Optional[float] = None
+
+    def __repr__(self) -> str:
+        return f"<Fetcher: ttl={self._ttl}s, {self._cache}, hits={self._hits}, revalidations={self._revalidations}, misses={self._misses}, shared={self._shared}, stale={self._stale}>"
+
+    @property
+    def cache(self) -> Cache | DiskCache:
+        """Returns the cache used by the fetcher."""
+        return self._cache
+
+    @property
+    def broker(self) -> Optional[LeaseBroker]:
+        """Returns the broker deduplicating the fetches, if any."""
+        return self._broker
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """
+        Returns the number of fresh hits, successful revalidations
+        (`304 Not Modified`), misses (full downloads), shared results
+        (fetched by someone else while we waited) and stale results (used
+        while the host's circuit breaker was open).
+        """
+        return {
+            "hits": self._hits,
+            "revalidations": self._revalidations,
+            "misses": self._misses,
+            "shared": self._shared,
+            "stale": self._stale,
+        }
+
+    @property
+    def breakers(self) -> dict[str, CircuitBreaker]:
+        """Returns the circuit breakers, by host."""
+        return dict(self._breakers)
+
+    @property
+    def last_success(self) -> Optional[float]:
+        """Returns when (a timestamp) a host last answered without an error, `None` if never."""
+        return self._last_success
+
+    def _failure(self, breaker: CircuitBreaker):
+        """Records a failed request to the host of `breaker`."""
+        if breaker.failure():
+            self._logger.warning(
+                "%s keeps failing, turning away requests to it for %.0fs.",
+                breaker.name,
+                breaker.retry_in,
+            )
+
+    def _rewrite(self, url: str) -> str:
+        """Returns `url` with its origin replaced, if it's one of the rewritten hosts."""
+        if not self._hosts:
+            return url
+        parts = urlsplit(url)
+        if (origin := self._hosts.get(f"{parts.scheme}://{parts.netloc}")) is None:
+            return url
+        return origin + url[len(parts.scheme) + 3 + len(parts.netloc) :]
+
+    def _breaker(self, url: str) -> CircuitBreaker:
+        """Returns the circuit breaker of the host of `url`."""
+        host = urlsplit(url).netloc
+        if (breaker := self._breakers.get(host)) is None:
+            breaker = self._breakers.setdefault(
+                host, CircuitBreaker(host, self._failure_threshold, self._cooldown)
+            )
+        return breaker
+
+    def get(
+        self,
+        url: str,
+        headers: Optional[dict[str, str]] = None,
+        timeout: float = TIMEOUT,
+        allocate: Optional[Callable[[Optional[int]], Optional[IO[bytes]]]] = None,
+    ) -> CacheEntry:
+        """
+        Makes a GET request to `url` (redirects are not followed), answering
+        from the cache whenever possible.
+
+        Before the body of a `200 OK` is downloaded, `allocate` (if any) is
+        called with its `Content-Length` (`None` if unknown). It can block
+        (i.e., to wait for memory) and can return a buffer to stream the body
+        into instead of holding it in memory, such bodies aren't cached.
+
+        Any exception raised by `requests` is passed on to the caller, a
+        `CircuitOpenError` is raised if the host is failing.
+        """
+
+        # answering from the cache
+        now = time.time()
+        cached = self._cache.get(url)
+        if cached is not None and cached.is_fresh(now):
+            self._hits += 1
+            return cached
+
+        if self._broker is None:
+            return self._fetch(url, cached, now, headers, timeout, allocate)
+
+        # someone else is fetching it, their result ends up in the cache
+        if not self._broker.claim(url):
+            self._logger.debug("Waiting for someone else to fetch %s.", url)
+            self._broker.wait(url)
+            now = time.time()
+            cached = self._cache.get(url)
+            if cached is not None and cached.is_fresh(now):
+                self._shared += 1
+                return cached
+
+            # it failed or isn't cacheable (i.e., large media), fetching it
+            # ourselves instead of waiting on the others one after another
+            return self._fetch(url, cached, now, headers, timeout, allocate)
+
+        try:
+            # they might have finished between our miss and our claim
+            now = time.time()
+            cached = self._cache.get(url)
+            if cached is not None and cached.is_fresh(now):
+                self._shared += 1
+                return cached
+
+            return self._fetch(url, cached, now, headers, timeout, allocate, leased=True)
+        finally:
+            self._broker.release(url)
+
+    def _fetch(
+        self,
+        url: str,
+        cached: Optional[CacheEntry],
+        now: float,
+        headers: Optional[dict[str, str]],
+        timeout: float,
+        allocate: Optional[Callable[[Optional[int]], Optional[IO[bytes]]]],
+        leased: bool = False,
+    ) -> CacheEntry:
+        """
+        Makes the actual request for `get`, revalidating `cached` if possible.
+        If `leased`, the caller holds the lease on `url`.
+        """
+
+        # asking the server if our copy is still good, this is
+        # a normal GET request if there is nothing to revalidate
+        actual_headers = dict(headers) if headers is not None else {}
+        if cached is not None and cached.is_revalidatable():
+            actual_headers.update(cached.conditional_headers())
+
+        # not waiting on a host that keeps failing, a stale copy beats nothing
+        breaker = self._breaker(url)
+        if not breaker.allow():
+            if cached is not None:
+                self._stale += 1
+                self._logger.debug("%s is failing, using a stale copy of %s.", breaker.name, url)
+                return cached
+            raise CircuitOpenError(
+                f"{breaker.name} is failing, not trying it again for {breaker.retry_in:.0f}s."
+            )
+
+        try:
+            response = self._session.get(
+                self._rewrite(url),
+                headers=actual_headers,
+                allow_redirects=False,
+                timeout=timeout,
+                stream=True,
+            )
+        except requests.RequestException:
+            self._failure(breaker)
+            raise
+
+        # anything but a server error means the host is alive
+        if response.status_code >= 500:
+            self._failure(breaker)
+        else:
+            breaker.success()
+            self._last_success = time.time()
+
+        # our copy is still good
+        if response.status_code == 304 and cached is not None:
+            response.close()
+            self._revalidations += 1
+            cached.refresh(
+                now + self._ttl,
+                {k.lower(): v for (k, v) in response.headers.items()},
+            )
+            self._cache.put(cached)
+            self._logger.debug("Revalidated %s, not modified.", url)
+            return cached
+
+        # downloading the whole thing
+        self._misses += 1
+
+        # the body might not be held in memory
+        if allocate is not None and response.status_code == 200:
+            length = response.headers.get("content-length")
+            try:
+                buffer = allocate(
+                    int(length) if length and length.isdigit() else None
+                )
+            except BaseException:
+                response.close()
+                raise
+            if buffer is not None:
+                # it won't be cached, nobody has to wait for it
+                if leased:
+                    self._broker.release(url)  # type: ignore
+                    leased = False
+
+                with response:
+                    for chunk in response.iter_content(Fetcher.CHUNK_SIZE):
+                        buffer.write(chunk)
+                buffer.seek(0)
+                return CacheEntry(
+                    url,
+                    response.status_code,
+                    response.reason,
+                    b"",
+                    dict(response.headers),
+                    response.encoding,
+                    buffer=buffer,
+                )
+
+        entry = CacheEntry.from_response(
+            url, response, expires=now + self._ttl, content=self._read(url, response, leased)
+        )
+
+        # only caching good responses
+        if entry.status_code == 200:
+            self._cache.put(entry)
+        else:
+            self._cache.remove(url)
+
+        return entry
+
+    def _read(self, url: str, response: requests.Response, leased: bool) -> bytes:
+        """
+        Reads the body of `response`, renewing the lease on `url` (if
+        `leased`) every half of its lifetime while it downloads.
+        """
+        chunks = []
+        renewed_at = time.monotonic()
+        with response:
+            for chunk in response.iter_content(Fetcher.CHUNK_SIZE):
+                chunks.append(chunk)
+                if leased and time.monotonic() - renewed_at > self._broker.ttl / 2:  # type: ignore
+                    self._broker.renew(url)  # type: ignore
+                    renewed_at = time.monotonic()
+        return b"".join(chunks)
@@ -1,30 +1,128 @@
-import logging
 import sys
+import copy
+import queue
+import logging
+import logging.handlers
+from typing import Any, Callable, Optional
+
+from ifunnybot.core.tracing import TraceFilter
+
+# the size (in bytes) at which a log file is rotated, and how many old ones are kept
+MAX_BYTES = 10_000_000
+BACKUP_COUNT = 5
+
+# the background writers of every logger, by name
+_listeners: dict[str, logging.handlers.QueueListener] = {}
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the background writer. Only the message itself is
+    merged on the calling thread (the arguments might change or be read by
+    other threads later on), the formatting i.e., the timestamp and any
+    traceback is left to the writer.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class Lazy(object):
+    """
+    An argument of a log call that is only computed if the record is actually
+    emitted i.e., `logger.debug("Formats: %s", Lazy(", ".join, formats))`
+    costs nothing while debug logs are off.
+    """
 
+    __slots__ = ("_func", "_args")
 
-def create_logger(filename: str, name: str = "FunnyBot") -> logging.Logger:
+    def __init__(self, func: Callable[..., Any], *args: Any):
+        self._func = func
+        self._args = args
+
+    def __str__(self) -> str:
+        return str(self._func(*self._args))
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+def create_logger(
+    filename: str,
+    name: str = "FunnyBot",
+    max_bytes: int = MAX_BYTES,
+    backup_count: int = BACKUP_COUNT,
+    level: int = logging.DEBUG,
+    levels: Optional[dict[str, str]] = None,
+) -> logging.Logger:
     """
     Creates a logger for whatever (primarily for the bot).
+
+    The logger only puts records on a queue, the actual writing to stdout and
+    to the (rotated) log file happens on a background thread, see `stop_logger`.
+
+    The components of the bot log through child loggers (i.e., `FunnyBot.fetcher`),
+    `levels` overrides the level of any of them by name e.g., `{"fetcher": "DEBUG"}`.
+
+    Every record carries the ID of the trace it was logged in, see `Tracer`.
     """
     # creating a Logger
     logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(level)
+    for (child, child_level) in (levels or {}).items():
+        logger.getChild(child).setLevel(child_level.upper())
 
     # creating formatter
-    fmt = logging.Formatter("%(asctime)s - %(name)s - %(funcName)-20s:%(lineno)4d - %(levelname)-7s: %(message)s")
+    fmt = logging.Formatter(
+        "%(asctime)s - %(name)s - %(funcName)-20s:%(lineno)4d - %(levelname)-7s - %(trace_id)s: %(message)s",
+        defaults={"trace_id": "-"},
+    )
 
     # stdout handler
     std = logging.StreamHandler(sys.stdout)
     std.setFormatter(fmt)
     std.setLevel(logging.DEBUG)
 
-    # file handler
-    fd = logging.FileHandler(filename, mode="w")
+    # file handler, rotated once it gets too large
+    fd = logging.handlers.RotatingFileHandler(
+        filename, maxBytes=max_bytes, backupCount=backup_count
+    )
     fd.setFormatter(fmt)
     fd.setLevel(logging.DEBUG)
 
-    # adding handlers
-    logger.addHandler(std)
-    logger.addHandler(fd)
+    # writing on a background thread
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        records, std, fd, respect_handler_level=True
+    )
+    listener.start()
+
+    # replacing the writer of a logger created before
+    stop_logger(logger)
+    _listeners[name] = listener
+
+    # adding handlers, the trace ID is only known on the logging thread
+    handler = _QueueHandler(records)
+    handler.addFilter(TraceFilter())
+    logger.addHandler(handler)
 
     return logger
+
+
+def stop_logger(logger: logging.Logger):
+    """
+    Writes out every queued record of `logger` and stops its background writer.
+    """
+    if (listener := _listeners.pop(logger.name, None)) is None:
+        return
+
+    # stopping the writer, it writes out whatever is left in the queue first
+    for handler in [h for h in logger.handlers if isinstance(h, _QueueHandler)]:
+        logger.removeHandler(handler)
+    listener.stop()
+    for handler in listener.handlers:
+        handler.flush()
+        handler.close()
@@ -0,0 +1,115 @@
+"""
+This file contains the accountant of the media held in memory.
+"""
+
+import weakref
+import threading
+from typing import Optional
+
+
+class MemoryAccountant(object):
+    """
+    Keeps track of how many bytes of media (downloaded or converted) are in
+    flight and enforces a budget on the downloads.
+
+    A download reserves its bytes before its body is read, waiting while the
+    budget is exhausted. A buffer is accounted for until it's freed (after
+    its upload, or once it's dropped) or garbage collected, whichever
+    comes first.
+    """
+
+    # the maximum number of bytes of downloaded media in memory
+    BUDGET = 96_000_000
+
+    def __init__(self, budget: int = BUDGET):
+        self._budget = budget
+        self._in_use = 0
+        self._peak = 0
+        self._waiting = 0
+        self._condition = threading.Condition()
+
+        # the releases of the accounted buffers, run when they're freed or collected
+        self._bound: weakref.WeakKeyDictionary[object, weakref.finalize] = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def __repr__(self) -> str:
+        return f"<MemoryAccountant: {self._in_use / 1_000_000} MB / {self._budget / 1_000_000} MB in use, peak {self._peak / 1_000_000} MB, {self._waiting} waiting>"
+
+    @property
+    def budget(self) -> int:
+        """Returns the maximum number of bytes of downloaded media in memory."""
+        return self._budget
+
+    @property
+    def in_use(self) -> int:
+        """Returns the number of bytes of media in flight."""
+        return self._in_use
+
+    @property
+    def peak(self) -> int:
+        """Returns the largest number of bytes of media in flight so far."""
+        return self._peak
+
+    @property
+    def waiting(self) -> int:
+        """Returns the number of downloads waiting for the budget."""
+        return self._waiting
+
+    def reserve(self, nbytes: int, timeout: Optional[float] = None) -> bool:
+        """
+        Reserves `nbytes` bytes, blocking while they don't fit in the budget.
+        Anything fits when nothing is in use, so a single large download
+        can't wait forever.
+
+        Returns false if the bytes couldn't be reserved within `timeout`.
+        """
+        with self._condition:
+            self._waiting += 1
+            try:
+                if not self._condition.wait_for(
+                    lambda: self._in_use == 0
+                    or self._in_use + nbytes <= self._budget,
+                    timeout=timeout,
+                ):
+                    return False
+            finally:
+                self._waiting -= 1
+
+            self._in_use += nbytes
+            self._peak = max(self._peak, self._in_use)
+            return True
+
+    def release(self, nbytes: int):
+        """Releases `nbytes` bytes, waking up any waiting downloads."""
+        with self._condition:
+            self._in_use -= nbytes
+            self._condition.notify_all()
+
+    def bind(self, buffer: object, nbytes: int):
+        """Releases `nbytes` already reserved bytes once `buffer` is freed or garbage collected."""
+        finalizer = weakref.finalize(buffer, self.release, nbytes)
+        with self._condition:
+            self._bound[buffer] = finalizer
+
+    def free(self, buffer: object):
+        """
+        Releases the bytes accounted for `buffer` now (i.e., once it's been
+        uploaded), instead of whenever it's garbage collected. Freeing a
+        buffer twice, or one that isn't accounted for, does nothing.
+        """
+        with self._condition:
+            finalizer = self._bound.pop(buffer, None)
+        if finalizer is not None:
+            finalizer()
+
+    def track(self, buffer: object, nbytes: int):
+        """
+        Accounts for `nbytes` bytes until `buffer` is garbage collected, without
+        waiting for the budget (i.e., converted copies of a download, waiting for
+        these could deadlock the jobs holding the downloads).
+        """
+        with self._condition:
+            self._in_use += nbytes
+            self._peak = max(self._peak, self._in_use)
+        self.bind(buffer, nbytes)
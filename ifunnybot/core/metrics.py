@@ -0,0 +1,334 @@
+"""
+This file contains the metrics of the bot and the HTTP endpoint they're
+exposed on, in the Prometheus text format.
+"""
+
+import math
+import time
+import bisect
+import logging
+import threading
+import contextlib
+import http.server
+from typing import Callable, Iterator, Optional
+
+# the labels of a sample, sorted by name
+Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict[str, object]) -> Labels:
+    """Turns keyword labels into a hashable, sorted tuple."""
+    return tuple(sorted((k, str(v)) for (k, v) in labels.items()))
+
+
+def _escape(value: str) -> str:
+    """Escapes the value of a label."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(name: str, labels: Labels, value: float) -> str:
+    """Formats a single sample."""
+    if labels:
+        pairs = ",".join(f'{k}="{_escape(v)}"' for (k, v) in labels)
+        return f"{name}{{{pairs}}} {value}"
+    return f"{name} {value}"
+
+
+class CounterMetric(object):
+    """A counter, per set of labels, that only goes up."""
+
+    def __init__(self, name: str, description: str):
+        self._name = name
+        self._description = description
+        self._values: dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<CounterMetric {self._name}: {len(self._values)} series>"
+
+    @property
+    def name(self) -> str:
+        """Returns the name of the counter."""
+        return self._name
+
+    def inc(self, amount: float = 1, **labels: object):
+        """Increments the counter of `labels` by `amount`."""
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: object) -> float:
+        """Returns the value of the counter of `labels`."""
+        return self._values.get(_labels(labels), 0)
+
+    def render(self) -> list[str]:
+        """Returns the counter in the Prometheus text format."""
+        with self._lock:
+            values = list(self._values.items())
+        return [
+            f"# HELP {self._name} {self._description}",
+            f"# TYPE {self._name} counter",
+            *(_format(self._name, labels, value) for (labels, value) in values),
+        ]
+
+
+class HistogramMetric(object):
+    """
+    A histogram, per set of labels, of observations (i.e., latencies in
+    seconds) in fixed buckets. An observation is a bisect and three
+    additions under a lock.
+    """
+
+    # the upper bounds of the buckets, in seconds
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(
+        self, name: str, description: str, buckets: tuple[float, ...] = BUCKETS
+    ):
+        self._name = name
+        self._description = description
+        self._buckets = tuple(sorted(buckets))
+
+        # per set of labels: the count of every bucket (and +Inf), the sum and the count
+        self._values: dict[Labels, list] = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<HistogramMetric {self._name}: {len(self._values)} series>"
+
+    @property
+    def name(self) -> str:
+        """Returns the name of the histogram."""
+        return self._name
+
+    def observe(self, value: float, **labels: object):
+        """Adds an observation to the histogram of `labels`."""
+        key = _labels(labels)
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            if (series := self._values.get(key)) is None:
+                series = self._values[key] = [[0] * (len(self._buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels: object) -> Iterator[None]:
+        """Observes how long (in seconds) the body of the `with` statement takes."""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def count(self, **labels: object) -> int:
+        """Returns the number of observations of `labels`."""
+        series = self._values.get(_labels(labels))
+        return series[2] if series is not None else 0
+
+    def quantile(self, q: float, **labels: object) -> float:
+        """
+        Returns an estimate of the `q` quantile of `labels` i.e., the upper
+        bound of the bucket it falls into, `nan` if there are no observations.
+        """
+        with self._lock:
+            series = self._values.get(_labels(labels))
+            if series is None or series[2] == 0:
+                return math.nan
+            (counts, _, count) = (list(series[0]), series[1], series[2])
+
+        rank = q * count
+        cumulative = 0
+        for (bound, bucket) in zip((*self._buckets, math.inf), counts):
+            cumulative += bucket
+            if cumulative >= rank:
+                return bound
+        return math.inf
+
+    def render(self) -> list[str]:
+        """Returns the histogram in the Prometheus text format."""
+        with self._lock:
+            values = [
+                (labels, list(counts), total, count)
+                for (labels, (counts, total, count)) in self._values.items()
+            ]
+
+        lines = [
+            f"# HELP {self._name} {self._description}",
+            f"# TYPE {self._name} histogram",
+        ]
+        for (labels, counts, total, count) in values:
+            cumulative = 0
+            for (bound, bucket) in zip((*self._buckets, math.inf), counts):
+                cumulative += bucket
+                le = "+Inf" if bound == math.inf else str(bound)
+                lines.append(
+                    _format(f"{self._name}_bucket", (*labels, ("le", le)), cumulative)
+                )
+            lines.append(_format(f"{self._name}_sum", labels, total))
+            lines.append(_format(f"{self._name}_count", labels, count))
+        return lines
+
+
+class MetricsRegistry(object):
+    """
+    The metrics of the bot: counters and histograms that are updated as the
+    bot works, and collectors that read a value (i.e., the statistics of the
+    cache) whenever the metrics are rendered.
+    """
+
+    def __init__(self, prefix: str = "funnybot"):
+        self._prefix = prefix
+        self._metrics: dict[str, CounterMetric | HistogramMetric] = {}
+        self._collectors: list[
+            tuple[str, str, str, Callable[[], dict[Labels, float] | float]]
+        ] = []
+
+    def __repr__(self) -> str:
+        return f"<MetricsRegistry: {len(self._metrics)} metrics, {len(self._collectors)} collectors>"
+
+    def counter(self, name: str, description: str) -> CounterMetric:
+        """Creates (or returns the existing) counter `name`."""
+        name = f"{self._prefix}_{name}"
+        if name not in self._metrics:
+            self._metrics[name] = CounterMetric(name, description)
+        return self._metrics[name]  # type: ignore
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        buckets: tuple[float, ...] = HistogramMetric.BUCKETS,
+    ) -> HistogramMetric:
+        """Creates (or returns the existing) histogram `name`."""
+        name = f"{self._prefix}_{name}"
+        if name not in self._metrics:
+            self._metrics[name] = HistogramMetric(name, description, buckets)
+        return self._metrics[name]  # type: ignore
+
+    def collector(
+        self,
+        name: str,
+        description: str,
+        func: Callable[[], dict[Labels, float] | float],
+        kind: str = "gauge",
+    ):
+        """
+        Adds a metric of type `kind` whose value is read from `func` at render
+        time, `func` returns either a value or a value per set of labels.
+        """
+        self._collectors.append((f"{self._prefix}_{name}", description, kind, func))
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text format."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+
+        for (name, description, kind, func) in self._collectors:
+            try:
+                values = func()
+            except Exception:  # type: ignore
+                continue
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            if isinstance(values, dict):
+                lines.extend(_format(name, labels, value) for (labels, value) in values.items())
+            else:
+                lines.append(_format(name, (), values))
+
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer(object):
+    """
+    Serves the metrics of a registry over HTTP (`GET /metrics`) from a
+    background thread.
+    """
+
+    # local only by default, inside of a container this needs to be 0.0.0.0
+    HOST = "127.0.0.1"
+    PORT = 9100
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        registry: MetricsRegistry,
+        host: str = HOST,
+        port: int = PORT,
+    ):
+        self._logger = logger
+        self._registry = registry
+        self._host = host
+        self._port = port
+        self._server: Optional[http.server.ThreadingHTTPServer] = None
+        self._routes: dict[str, tuple[Callable[[], tuple[int, str]], str]] = {
+            "/metrics": (
+                lambda: (200, self._registry.render()),
+                "text/plain; version=0.0.4; charset=utf-8",
+            )
+        }
+
+    def __repr__(self) -> str:
+        return f"<MetricsServer: http://{self._host}:{self._port}, {'running' if self._server else 'stopped'}>"
+
+    @property
+    def address(self) -> tuple[str, int]:
+        """Returns the host and the port the server listens on."""
+        if self._server is not None:
+            return self._server.server_address[:2]  # type: ignore
+        return (self._host, self._port)
+
+    def route(
+        self,
+        path: str,
+        func: Callable[[], tuple[int, str]],
+        content_type: str = "text/plain; charset=utf-8",
+    ):
+        """Serves `GET path` with `func`, which returns a status code and a body."""
+        self._routes[path] = (func, content_type)
+
+    def start(self):
+        """Starts serving, this doesn't block."""
+        if self._server is not None:
+            return
+
+        routes = self._routes
+        logger = self._logger
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                content_type = "text/plain; charset=utf-8"
+                if (route := routes.get(self.path.split("?", 1)[0])) is None:
+                    (status, body) = (404, "not found\n")
+                else:
+                    (func, content_type) = route
+                    try:
+                        (status, body) = func()
+                    except Exception as e:  # type: ignore
+                        logger.warning("Failed to serve %s: %s", self.path, e)
+                        (status, body) = (500, f"{e}\n")
+
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer((self._host, self._port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(
+            target=self._server.serve_forever, name="metrics-server", daemon=True
+        ).start()
+        self._logger.info("Serving metrics on http://%s:%d/metrics", *self.address)
+
+    def stop(self):
+        """Stops serving."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,222 @@
+"""
+This file contains the monitor of the event loop.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+from typing import Optional
+
+
+class Stall(object):
+    """A time the event loop was blocked, and where it was blocked."""
+
+    __slots__ = ("timestamp", "blocked", "stack", "culprit")
+
+    def __init__(self, timestamp: float, blocked: float, stack: list[str], culprit: str):
+        self.timestamp = timestamp
+        self.blocked = blocked
+        self.stack = stack
+        self.culprit = culprit
+
+    def __repr__(self) -> str:
+        return f"<Stall: {self.blocked * 1000:.1f}ms in {self.culprit}>"
+
+
+class LagMonitor(object):
+    """
+    Measures the lag of the event loop i.e., how late a sleep of `interval`
+    seconds wakes up. Anything blocking the loop shows up as lag.
+
+    A watchdog thread checks on the loop as well. Once the loop hasn't woken
+    up for `threshold` seconds past its sleep, the watchdog captures the
+    stack of the loop thread (the loop can't do it itself, it's blocked) and
+    logs it, along with the innermost call of the bot that was blocking.
+    """
+
+    # how often (in seconds) the lag is measured
+    INTERVAL = 0.25
+
+    # the lag (in seconds) at which the loop counts as stalled and its stack is captured
+    THRESHOLD = 0.1
+
+    # the number of measurements the percentiles are taken over i.e., the last minute
+    WINDOW = 240
+
+    # the number of stalls that are kept
+    MAX_STALLS = 32
+
+    # the percentiles of the lag that are exported
+    QUANTILES = (0.5, 0.9, 0.99)
+
+    # the innermost frame in here is the culprit of a stall
+    PACKAGE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        interval: float = INTERVAL,
+        threshold: float = THRESHOLD,
+        window: int = WINDOW,
+    ):
+        self._logger = logger
+        self._interval = interval
+        self._threshold = threshold
+        self._task: Optional[asyncio.Task] = None
+
+        # the last measurement and a smoothed one
+        self._lag = 0.0
+        self._average = 0.0
+        self._max = 0.0
+        self._window: deque[float] = deque(maxlen=window)
+
+        # the watchdog, it watches the last time the loop woke up
+        self._heartbeat = time.perf_counter()
+        self._loop_thread: Optional[int] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._stalls: deque[Stall] = deque(maxlen=LagMonitor.MAX_STALLS)
+        self._stalled = 0
+        self._captured: Optional[float] = None  # the heartbeat of the last captured stall
+
+    def __repr__(self) -> str:
+        return f"<LagMonitor: lag={self._lag * 1000:.1f}ms, average={self._average * 1000:.1f}ms, max={self._max * 1000:.1f}ms, p99={self.percentile(0.99) * 1000:.1f}ms, {self._stalled} stalls>"
+
+    @property
+    def lag(self) -> float:
+        """Returns the last measured lag in seconds."""
+        return self._lag
+
+    @property
+    def average(self) -> float:
+        """Returns the exponentially smoothed lag in seconds."""
+        return self._average
+
+    @property
+    def max(self) -> float:
+        """Returns the largest lag measured so far in seconds."""
+        return self._max
+
+    @property
+    def blocked(self) -> float:
+        """
+        Returns how long (in seconds) the loop has been blocked right now i.e.,
+        how overdue its next measurement is, this works while the loop is stuck.
+        """
+        if self._task is None:
+            return 0.0
+        return max(0.0, time.perf_counter() - self._heartbeat - self._interval)
+
+    @property
+    def stalled(self) -> int:
+        """Returns the number of stalls so far."""
+        return self._stalled
+
+    @property
+    def stalls(self) -> list[Stall]:
+        """Returns the last stalls, the latest last."""
+        return list(self._stalls)
+
+    def percentile(self, q: float) -> float:
+        """Returns the `q` percentile (0 to 1) of the recent lag in seconds."""
+        lags = sorted(self._window)
+        if not lags:
+            return 0.0
+        return lags[min(len(lags) - 1, int(q * len(lags)))]
+
+    def percentiles(self) -> dict[float, float]:
+        """Returns the exported percentiles of the recent lag in seconds."""
+        return {q: self.percentile(q) for q in LagMonitor.QUANTILES}
+
+    def start(self):
+        """Starts measuring, this requires a running event loop."""
+        if self._task is None:
+            self._loop_thread = threading.get_ident()
+            self._heartbeat = time.perf_counter()
+            self._task = asyncio.create_task(self._measure(), name="lag-monitor")
+
+        if self._watchdog is None:
+            self._stopped.clear()
+            self._watchdog = threading.Thread(
+                target=self._watch, name="lag-watchdog", daemon=True
+            )
+            self._watchdog.start()
+
+    def stop(self):
+        """Stops measuring."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        if self._watchdog is not None:
+            self._stopped.set()
+            self._watchdog.join()
+            self._watchdog = None
+
+    async def _measure(self):
+        """Sleeps for `interval` seconds over and over, measuring the overshoot."""
+        while True:
+            before = time.perf_counter()
+            self._heartbeat = before
+            await asyncio.sleep(self._interval)
+            lag = max(0.0, time.perf_counter() - before - self._interval)
+
+            # keeping track
+            self._lag = lag
+            self._average = 0.8 * self._average + 0.2 * lag
+            self._max = max(self._max, lag)
+            self._window.append(lag)
+
+            # the watchdog only saw the start of the stall, this is all of it
+            if self._captured == before and self._stalls:
+                stall = self._stalls[-1]
+                stall.blocked = lag
+                self._logger.info(
+                    "The event loop was blocked for %.1fms in total, in %s.",
+                    lag * 1000,
+                    stall.culprit,
+                )
+
+    def _watch(self):
+        """
+        Checks on the loop until stopped, capturing the stack of the loop
+        thread once per stall.
+        """
+        while not self._stopped.wait(self._threshold / 2):
+            heartbeat = self._heartbeat
+            blocked = time.perf_counter() - heartbeat - self._interval
+            if blocked < self._threshold or heartbeat == self._captured:
+                continue
+
+            # the loop is stuck, where?
+            if (frame := sys._current_frames().get(self._loop_thread)) is None:  # type: ignore
+                continue
+            summary = traceback.extract_stack(frame)
+            del frame
+
+            # the innermost call of the bot, the rest is the stdlib or a library
+            culprit = next(
+                (
+                    f"{os.path.basename(entry.filename)}:{entry.lineno} {entry.name}"
+                    for entry in reversed(summary)
+                    if entry.filename.startswith(LagMonitor.PACKAGE)
+                    and entry.filename != __file__
+                ),
+                "unknown",
+            )
+
+            stall = Stall(time.time(), blocked, summary.format(), culprit)
+            self._stalls.append(stall)
+            self._stalled += 1
+            self._captured = heartbeat
+            self._logger.warning(
+                "The event loop has been blocked for %.1fms, in %s:\n%s",
+                blocked * 1000,
+                culprit,
+                "".join(stall.stack).rstrip(),
+            )
@@ -0,0 +1,229 @@
+"""
+This file contains the staged pipeline that the posts go through i.e.,
+page fetch, metadata extraction, media download and media processing.
+Uploading to Discord isn't a stage, discord.py already waits out the rate
+limits of every channel on its own and a shared stage would make every
+server wait on the slowest channel.
+"""
+
+import time
+import asyncio
+import inspect
+import logging
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+
+class Stage(object):
+    """
+    A stage of the pipeline, a bounded queue of work and a fixed number of
+    workers taking from it.
+
+    Blocking (synchronous) work runs in the stage's own threads, so a stage
+    blocking (i.e., waiting for memory) can't starve the other stages of
+    threads. Coroutine functions run on the event loop. Once the queue is
+    full, anyone submitting work waits. In the bot the queues are sized so
+    this doesn't happen, the scheduler bounds the jobs running instead.
+    """
+
+    def __init__(self, name: str, workers: int = 1, maxsize: int = 16):
+        if workers < 1:
+            raise ValueError("workers must be at least 1.")
+
+        self._name = name
+        self._workers = workers
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._tasks: list[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        # statistics
+        self._completed = 0
+        self._failed = 0
+        self._busy = 0  # the number of workers doing work
+        self._wait_time = 0.0  # time spent in the queue
+        self._run_time = 0.0  # time spent doing the work
+        self._max_run_time = 0.0
+        self._started_at: Optional[float] = None
+        self._running: dict[int, float] = {}  # when every running item started
+
+    def __repr__(self) -> str:
+        return f"<Stage {self._name}: {self._busy}/{self._workers} busy, {self._queue.qsize()}/{self._queue.maxsize} queued, {self._completed} completed, {self._failed} failed>"
+
+    @property
+    def name(self) -> str:
+        """Returns the name of the stage."""
+        return self._name
+
+    @property
+    def depth(self) -> int:
+        """Returns the number of items waiting in the queue."""
+        return self._queue.qsize()
+
+    @property
+    def busy(self) -> int:
+        """Returns the number of workers currently doing work."""
+        return self._busy
+
+    @property
+    def oldest(self) -> float:
+        """Returns how long (in seconds) the longest running item has been running."""
+        started = list(self._running.values())
+        return time.perf_counter() - min(started) if started else 0.0
+
+    def stats(self) -> dict[str, float]:
+        """
+        Returns the throughput (items per second since the stage started),
+        the average wait and run latencies (in seconds) and the utilization
+        of the workers.
+        """
+        done = self._completed + self._failed
+        elapsed = time.perf_counter() - self._started_at if self._started_at else 0.0
+        return {
+            "workers": self._workers,
+            "busy": self._busy,
+            "depth": self._queue.qsize(),
+            "completed": self._completed,
+            "failed": self._failed,
+            "throughput": done / elapsed if elapsed > 0 else 0.0,
+            "avg_wait": self._wait_time / done if done else 0.0,
+            "avg_run": self._run_time / done if done else 0.0,
+            "max_run": self._max_run_time,
+            "utilization": (
+                self._run_time / (elapsed * self._workers) if elapsed > 0 else 0.0
+            ),
+        }
+
+    def start(self):
+        """Starts the workers, this requires a running event loop."""
+        if self._tasks:
+            return
+        self._started_at = time.perf_counter()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self._workers, thread_name_prefix=f"pipeline-{self._name}"
+        )
+        self._tasks = [
+            asyncio.create_task(self._work(), name=f"pipeline-{self._name}-{i}")
+            for i in range(self._workers)
+        ]
+
+    def stop(self):
+        """Stops the workers, anything still queued is never run."""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Queues `func(*args, **kwargs)` and waits for its result (or its
+        exception) once a worker has run it, in the context of the caller
+        (i.e., its trace).
+        """
+        self.start()
+
+        future = asyncio.get_running_loop().create_future()
+        context = contextvars.copy_context()
+        await self._queue.put((func, args, kwargs, context, future, time.perf_counter()))
+        return await future
+
+    async def _work(self):
+        """A worker, runs whatever is in the queue until stopped."""
+        while True:
+            (func, args, kwargs, context, future, queued_at) = await self._queue.get()
+
+            # the caller gave up waiting
+            if future.done():
+                self._queue.task_done()
+                continue
+
+            # doing the work
+            self._busy += 1
+            started_at = time.perf_counter()
+            self._running[id(future)] = started_at
+            try:
+                if inspect.iscoroutinefunction(func):
+                    result = await asyncio.create_task(
+                        func(*args, **kwargs), context=context
+                    )
+                else:
+                    # like `asyncio.to_thread`, but in the threads of the stage
+                    result = await asyncio.get_running_loop().run_in_executor(
+                        self._executor,
+                        functools.partial(context.run, func, *args, **kwargs),
+                    )
+                self._completed += 1
+                if not future.done():
+                    future.set_result(result)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:  # type: ignore
+                self._failed += 1
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                # bookkeeping
+                finished_at = time.perf_counter()
+                self._busy -= 1
+                self._running.pop(id(future), None)
+                self._wait_time += started_at - queued_at
+                self._run_time += finished_at - started_at
+                self._max_run_time = max(self._max_run_time, finished_at - started_at)
+                self._queue.task_done()
+
+
+class Pipeline(object):
+    """
+    A collection of named stages. A job goes through the stages it needs one
+    after another, while other jobs fill up the other stages.
+    """
+
+    # the stages of the pipeline, in order
+    STAGES = ("fetch", "parse", "download", "process")
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        workers: dict[str, int],
+        maxsize: int = 16,
+    ):
+        self._logger = logger
+        self._stages: dict[str, Stage] = {
+            name: Stage(name, workers=workers.get(name, 1), maxsize=maxsize)
+            for name in Pipeline.STAGES
+        }
+
+    def __repr__(self) -> str:
+        return f"<Pipeline: {', '.join(map(repr, self._stages.values()))}>"
+
+    def __getitem__(self, name: str) -> Stage:
+        return self._stages[name]
+
+    @property
+    def stages(self) -> list[Stage]:
+        """Returns the stages, in order."""
+        return list(self._stages.values())
+
+    def start(self):
+        """Starts the workers of every stage."""
+        for stage in self._stages.values():
+            stage.start()
+
+    def stop(self):
+        """Stops the workers of every stage."""
+        for stage in self._stages.values():
+            stage.stop()
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """Returns the statistics of every stage."""
+        return {name: stage.stats() for (name, stage) in self._stages.items()}
+
+    async def run(
+        self, stage: str, func: Callable[..., Any], *args: Any, **kwargs: Any
+    ) -> Any:
+        """Runs `func(*args, **kwargs)` in the stage `stage`."""
+        return await self._stages[stage].run(func, *args, **kwargs)
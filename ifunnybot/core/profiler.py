@@ -0,0 +1,170 @@
+"""
+This file contains the profiler of the bot, for finding hotspots (and
+memory growth) in production without redeploying.
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Optional
+
+
+class Profiler(object):
+    """
+    A sampling profiler and `tracemalloc` snapshots, writing their results
+    into `directory` (the logs directory).
+
+    `profile` samples the stacks of every thread `1 / interval` times a
+    second for a number of seconds and writes them in the collapsed stack
+    format (one `thread;outer;...;inner count` line per stack), which
+    flamegraph.pl and speedscope read. Sampling costs a few percent of a
+    core while it runs and nothing otherwise.
+
+    `snapshot` traces the allocations for a number of seconds and writes
+    the biggest allocations and how they changed over those seconds. Tracing
+    is only on while a snapshot is taken, it slows down every allocation.
+    """
+
+    # how often (in seconds) the stacks are sampled
+    INTERVAL = 0.01
+
+    # the number of frames kept per allocation by tracemalloc
+    FRAMES = 16
+
+    # the number of lines of a snapshot (or of a diff) that are written
+    TOP = 50
+
+    def __init__(
+        self, logger: logging.Logger, directory: str, interval: float = INTERVAL
+    ):
+        self._logger = logger
+        self._directory = directory
+        self._interval = interval
+
+        # only one profile runs at a time
+        self._profiling = threading.Lock()
+
+        # only one snapshot is taken at a time
+        self._snapshot_lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<Profiler: {self._directory}, interval={self._interval}s, profiling={self.profiling}, tracing={tracemalloc.is_tracing()}>"
+
+    @property
+    def profiling(self) -> bool:
+        """Returns true if a profile is being taken."""
+        return self._profiling.locked()
+
+    def _path(self, kind: str, extension: str) -> str:
+        """Returns the path of a new output file."""
+        return os.path.join(
+            self._directory, f"{int(time.time())}-{os.getpid()}-{kind}.{extension}"
+        )
+
+    @staticmethod
+    def _collapse(frame, thread: str) -> str:
+        """Returns the stack of `frame` as a line of the collapsed stack format."""
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(
+                f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{frame.f_lineno})".replace(
+                    ";", ":"
+                )
+            )
+            frame = frame.f_back
+        names.append(thread.replace(";", ":"))
+        return ";".join(reversed(names))
+
+    def profile(self, seconds: float) -> Optional[str]:
+        """
+        Samples every thread for `seconds` seconds (this blocks) and writes the
+        collapsed stacks, returns the path they were written to or `None` if
+        a profile is already being taken.
+        """
+        if not self._profiling.acquire(blocking=False):
+            self._logger.warning("Already taking a profile, not starting another one.")
+            return None
+
+        try:
+            self._logger.info("Profiling for %.1fs.", seconds)
+            me = threading.get_ident()
+            stacks: Counter[str] = Counter()
+            samples = 0
+
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for (ident, frame) in sys._current_frames().items():  # type: ignore
+                    if ident != me:
+                        stacks[Profiler._collapse(frame, names.get(ident, str(ident)))] += 1
+                del frame
+                samples += 1
+                time.sleep(self._interval)
+
+            # the hottest stacks first
+            path = self._path("profile", "collapsed")
+            with open(path, "w", encoding="utf-8") as fd:
+                for (stack, count) in stacks.most_common():
+                    fd.write(f"{stack} {count}\n")
+
+            self._logger.info(
+                "Wrote a profile of %d samples (%d stacks) to %s", samples, len(stacks), path
+            )
+            return path
+        finally:
+            self._profiling.release()
+
+    def snapshot(self, seconds: float) -> Optional[str]:
+        """
+        Traces the allocations for `seconds` seconds (this blocks) and writes
+        where the memory is allocated at the end, and how that changed over
+        those seconds. Tracing is stopped right after, as every allocation
+        pays for it while it's on.
+
+        Returns the path it was written to or `None` if a snapshot is already
+        being taken.
+        """
+        if not self._snapshot_lock.acquire(blocking=False):
+            self._logger.warning("Already taking a snapshot, not starting another one.")
+            return None
+
+        # not stopping tracing that was started by someone else (i.e., PYTHONTRACEMALLOC)
+        started = not tracemalloc.is_tracing()
+        try:
+            if started:
+                tracemalloc.start(Profiler.FRAMES)
+            self._logger.info("Tracing allocations for %.1fs.", seconds)
+
+            exclude = (tracemalloc.Filter(False, tracemalloc.__file__),)
+            before = tracemalloc.take_snapshot().filter_traces(exclude)
+            time.sleep(seconds)
+            after = tracemalloc.take_snapshot().filter_traces(exclude)
+            (current, peak) = tracemalloc.get_traced_memory()
+        finally:
+            if started:
+                tracemalloc.stop()
+            self._snapshot_lock.release()
+
+        lines = [
+            f"traced: {current / 1_000_000:.2f} MB, peak: {peak / 1_000_000:.2f} MB",
+            "",
+            f"top {Profiler.TOP} allocations:",
+            *map(str, after.statistics("lineno")[: Profiler.TOP]),
+            "",
+            f"top {Profiler.TOP} differences over {seconds:.1f}s:",
+            *map(str, after.compare_to(before, "lineno")[: Profiler.TOP]),
+        ]
+
+        path = self._path("tracemalloc", "txt")
+        with open(path, "w", encoding="utf-8") as fd:
+            fd.write("\n".join(lines) + "\n")
+
+        self._logger.info(
+            "Wrote a snapshot of %.2f MB traced to %s", current / 1_000_000, path
+        )
+        return path
@@ -0,0 +1,147 @@
+"""
+This file contains the reporter that posts the errors of the bot into the
+error channel.
+"""
+
+import re
+import time
+import asyncio
+import logging
+import threading
+from typing import Awaitable, Callable, Optional
+
+
+class ErrorReporter(logging.Handler):
+    """
+    A logging handler that groups error records and posts a digest of them
+    at most once every `interval` seconds, instead of a message per error.
+
+    Records are grouped by their unformatted message and their exception
+    (type and message, without any URLs), so the same failure on a thousand
+    different posts is a single line i.e., "x137 ParsingError: Failure to
+    parse metadata ... Couldn't find any tags matching: ...".
+    """
+
+    # how often (in seconds) a digest is posted at most
+    INTERVAL = 60.0
+
+    # the maximum number of groups in a digest, the rest are only counted
+    MAX_GROUPS = 10
+
+    # the maximum length of a digest (the limit of a Discord message)
+    MAX_LENGTH = 2000
+
+    # the URLs in exception messages, these differ between posts
+    URL_REGEX = re.compile(r"https?://\S+")
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        send: Callable[[str], Awaitable[None]],
+        interval: float = INTERVAL,
+        level: int = logging.ERROR,
+    ):
+        super().__init__(level=level)
+        self._logger = logger
+        self._send = send
+        self._interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+        # the groups of the current window, in order of appearance
+        self._groups: dict[tuple[str, str, str], list] = {}
+        self._window_start = time.time()
+        self._groups_lock = threading.Lock()
+
+        # statistics
+        self._reported = 0
+        self._digests = 0
+
+    def __repr__(self) -> str:
+        return f"<ErrorReporter: interval={self._interval}s, {len(self._groups)} pending groups, {self._reported} errors in {self._digests} digests>"
+
+    @property
+    def reported(self) -> int:
+        """Returns the number of errors reported so far."""
+        return self._reported
+
+    @property
+    def digests(self) -> int:
+        """Returns the number of digests posted so far."""
+        return self._digests
+
+    def emit(self, record: logging.LogRecord):
+        """Adds `record` to its group, this can be called from any thread."""
+        try:
+            if record.exc_info and record.exc_info[1] is not None:
+                key = (
+                    type(record.exc_info[1]).__name__,
+                    str(record.msg),
+                    ErrorReporter.URL_REGEX.sub("<url>", str(record.exc_info[1])),
+                )
+            else:
+                key = (record.levelname, str(record.msg), "")
+
+            with self._groups_lock:
+                if (group := self._groups.get(key)) is None:
+                    # the count and the first message, as an example
+                    self._groups[key] = [1, record.getMessage()]
+                else:
+                    group[0] += 1
+        except Exception:  # type: ignore
+            self.handleError(record)
+
+    def start(self):
+        """Starts posting digests, this requires a running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._report(), name="error-reporter")
+
+    async def stop(self):
+        """Stops posting digests, posting whatever is left first."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush_digest()
+
+    def digest(self) -> Optional[str]:
+        """
+        Returns the digest of the current window and starts a new one, `None`
+        if there were no errors.
+        """
+        with self._groups_lock:
+            (groups, self._groups) = (self._groups, {})
+            (started_at, self._window_start) = (self._window_start, time.time())
+
+        if not groups:
+            return None
+
+        # building the digest, the most frequent errors first
+        total = sum(count for (count, _) in groups.values())
+        ordered = sorted(groups.items(), key=lambda item: item[1][0], reverse=True)
+        lines = [f"# {total} errors in the last {round(time.time() - started_at)}s"]
+        for ((name, _, _), (count, example)) in ordered[: ErrorReporter.MAX_GROUPS]:
+            lines.append(f"- x{count} {name}: {example[:300]}")
+        if len(ordered) > ErrorReporter.MAX_GROUPS:
+            rest = ordered[ErrorReporter.MAX_GROUPS :]
+            lines.append(
+                f"- and {sum(count for (_, (count, _)) in rest)} more errors of {len(rest)} other kinds"
+            )
+
+        self._reported += total
+        return "\n".join(lines)[: ErrorReporter.MAX_LENGTH]
+
+    async def flush_digest(self):
+        """Posts the digest of the current window, if there were any errors."""
+        if (digest := self.digest()) is None:
+            return
+        try:
+            await self._send(digest)
+            self._digests += 1
+        except Exception as e:  # type: ignore
+            # not logging this as an error, that would only feed the next digest
+            self._logger.warning("Failed to post an error digest: %s", e)
+
+    async def _report(self):
+        """Posts a digest every `interval` seconds, if there were any errors."""
+        while True:
+            await asyncio.sleep(self._interval)
+            await self.flush_digest()
@@ -0,0 +1,246 @@
+"""
+This file contains the scheduler that shares the bot between servers.
+"""
+
+import asyncio
+import logging
+import contextvars
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable
+
+from ifunnybot.types.mode import Priority
+from ifunnybot.types.overloaded_exception import OverloadedError
+
+
+class Scheduler(object):
+    """
+    A fair, priority aware scheduler of jobs.
+
+    Every priority gets its own lane and the lanes are always served in
+    order, so interactions go before any waiting auto-embeds. Within a lane,
+    every key (the guild ID) gets its own queue and the queues are served
+    in a round robin fashion.
+
+    At most `workers` jobs run at once. Auto-embeds can't take the last
+    `reserved` workers, those are kept for interactions, and at most
+    `per_key` auto-embeds can run at once for the same key, so a single
+    server spamming links can't use up all of the bot while smaller servers
+    wait. Auto-embeds are shed once `max_pending` of them are waiting.
+    """
+
+    # the maximum number of jobs running at once
+    WORKERS = 4
+
+    # the number of workers that only interactions can use
+    RESERVED = 1
+
+    # the maximum number of auto-embeds running at once for a single key
+    PER_KEY = 2
+
+    # the maximum number of auto-embeds waiting to run
+    MAX_PENDING = 64
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        workers: int = WORKERS,
+        reserved: int = RESERVED,
+        per_key: int = PER_KEY,
+        max_pending: int = MAX_PENDING,
+    ):
+        if workers < 1 or per_key < 1:
+            raise ValueError("workers and per_key must be at least 1.")
+        if not 0 <= reserved < workers:
+            raise ValueError("reserved must be between 0 and workers - 1.")
+
+        self._logger = logger
+        self._workers = workers
+        self._reserved = reserved
+        self._per_key = per_key
+        self._max_pending = max_pending
+
+        # the pending jobs of every lane, per key, and the order they're served in
+        self._queues: dict[Priority, dict[Hashable, deque]] = {p: {} for p in Priority}
+        self._rings: dict[Priority, deque[Hashable]] = {p: deque() for p in Priority}
+
+        # the running jobs
+        self._in_flight: dict[Priority, dict[Hashable, int]] = {p: {} for p in Priority}
+        self._running = 0
+        self._tasks: set[asyncio.Task] = set()
+
+        # statistics
+        self._completed = 0
+        self._shed = 0
+
+    def __repr__(self) -> str:
+        return f"<Scheduler: {self._running}/{self._workers} running, {self.pending()} pending, {self._completed} completed, {self._shed} shed>"
+
+    @property
+    def running(self) -> int:
+        """Returns the number of jobs currently running."""
+        return self._running
+
+    @property
+    def shed(self) -> int:
+        """Returns the number of jobs turned away because too many were waiting."""
+        return self._shed
+
+    def pending(self, priority: Priority | None = None) -> int:
+        """
+        Returns the number of jobs waiting to run, in a lane or overall. This
+        (like `depths` and `in_flight`) is safe to call from any thread.
+        """
+        lanes = Priority if priority is None else [priority]
+        # copying the queues first (atomically), the loop might add or remove some meanwhile
+        return sum(
+            len(queue) for lane in lanes for queue in list(self._queues[lane].values())
+        )
+
+    def depths(self, priority: Priority = Priority.AUTOEMBED) -> dict[Hashable, int]:
+        """Returns the number of jobs waiting to run in a lane, for every key."""
+        return {key: len(queue) for (key, queue) in list(self._queues[priority].items())}
+
+    def in_flight(self, priority: Priority = Priority.AUTOEMBED) -> dict[Hashable, int]:
+        """Returns the number of jobs running in a lane, for every key."""
+        return dict(self._in_flight[priority])
+
+    async def submit(
+        self,
+        key: Hashable,
+        func: Callable[..., Awaitable[Any]],
+        *args: Any,
+        priority: Priority = Priority.AUTOEMBED,
+    ) -> Any:
+        """
+        Queues `func(*args)` under `key` in the lane of `priority` and waits
+        for its result (or its exception) once the scheduler gets around to
+        running it.
+
+        Raises an `OverloadedError` if the job was shed.
+        """
+
+        # shedding auto-embeds, the interactions are never shed here
+        if (
+            priority != Priority.INTERACTION
+            and self.pending(priority) >= self._max_pending
+        ):
+            self._shed += 1
+            raise OverloadedError(
+                f"Too many jobs are waiting ({self._max_pending}), shedding a job for {key}."
+            )
+
+        future = asyncio.get_running_loop().create_future()
+
+        # queueing the job
+        (queues, ring) = (self._queues[priority], self._rings[priority])
+        if key not in queues:
+            queues[key] = deque()
+            ring.append(key)
+        queues[key].append((func, args, contextvars.copy_context(), future))
+        self._logger.debug(
+            "Queued a %s job for %s, %d pending for it.",
+            priority.name,
+            key,
+            len(queues[key]),
+        )
+
+        # maybe it can run straight away
+        self._dispatch()
+
+        return await future
+
+    def _dispatch(self):
+        """Starts as many pending jobs as the limits allow, lane by lane."""
+
+        for priority in sorted(Priority):
+            (queues, ring) = (self._queues[priority], self._rings[priority])
+            in_flight = self._in_flight[priority]
+
+            # only interactions can use the reserved workers
+            workers = self._workers
+            per_key = None
+            if priority != Priority.INTERACTION:
+                workers -= self._reserved
+                per_key = self._per_key
+
+            # going around the ring at most once without starting anything
+            idle = 0
+            while self._running < workers and idle < len(ring):
+                key = ring[0]
+                ring.rotate(-1)
+
+                # this key has used up its share
+                if per_key is not None and in_flight.get(key, 0) >= per_key:
+                    idle += 1
+                    continue
+
+                # skipping the jobs whose caller gave up waiting
+                queue = queues[key]
+                while queue and queue[0][3].done():
+                    queue.popleft()
+
+                # nothing left for this key
+                if not queue:
+                    del queues[key]
+                    ring.remove(key)
+                    continue
+
+                # starting the job
+                (func, args, context, future) = queue.popleft()
+                self._start(priority, key, func, args, context, future)
+                idle = 0
+
+    def _start(
+        self,
+        priority: Priority,
+        key: Hashable,
+        func: Callable[..., Awaitable[Any]],
+        args: tuple,
+        context: contextvars.Context,
+        future: asyncio.Future,
+    ):
+        """Runs a single job as a task, in the context of whoever submitted it."""
+        in_flight = self._in_flight[priority]
+        in_flight[key] = in_flight.get(key, 0) + 1
+        self._running += 1
+
+        task = asyncio.create_task(
+            self._run(priority, key, func, args, future), context=context
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        # the caller gave up waiting, so should we
+        future.add_done_callback(lambda f: task.cancel() if f.cancelled() else None)
+
+    async def _run(
+        self,
+        priority: Priority,
+        key: Hashable,
+        func: Callable[..., Awaitable[Any]],
+        args: tuple,
+        future: asyncio.Future,
+    ):
+        """Runs a job and hands its result to whoever submitted it."""
+        try:
+            result = await func(*args)
+            if not future.done():
+                future.set_result(result)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:  # type: ignore
+            if not future.done():
+                future.set_exception(e)
+        finally:
+            # freeing the slot
+            self._running -= 1
+            self._completed += 1
+            in_flight = self._in_flight[priority]
+            if (count := in_flight[key] - 1) > 0:
+                in_flight[key] = count
+            else:
+                del in_flight[key]
+
+            # letting the next job in
+            self._dispatch()
@@ -0,0 +1,226 @@
+"""
+This file contains the tracing of the bot i.e., which stages a message or an
+interaction went through and how long each one of them took.
+"""
+
+import time
+import uuid
+import heapq
+import logging
+import threading
+import contextlib
+import contextvars
+from typing import Iterator, Optional
+
+
+class Span(object):
+    """A stage of a trace, its start is relative to the start of the trace."""
+
+    __slots__ = ("name", "detail", "depth", "start", "duration", "failed")
+
+    def __init__(self, name: str, detail: Optional[str], depth: int, start: float):
+        self.name = name
+        self.detail = detail
+        self.depth = depth
+        self.start = start
+        self.duration: Optional[float] = None
+        self.failed = False
+
+    def __repr__(self) -> str:
+        return f"<Span {self.name}: +{self.start * 1000:.1f}ms, {self.duration * 1000 if self.duration is not None else 0:.1f}ms{', failed' if self.failed else ''}>"
+
+
+class Trace(object):
+    """
+    The spans of a single message or interaction, in the order they started.
+    Spans are added from the event loop and from the threads of the pipeline.
+    """
+
+    def __init__(self, name: str):
+        self._id = uuid.uuid4().hex[:12]
+        self._name = name
+        self._started_at = time.perf_counter()
+        self._timestamp = time.time()
+        self._duration: Optional[float] = None
+        self._spans: list[Span] = []
+
+    def __repr__(self) -> str:
+        return f"<Trace {self._id}: {self._name}, {len(self._spans)} spans, {self.duration * 1000:.1f}ms>"
+
+    def __lt__(self, other: "Trace") -> bool:
+        return self.duration < other.duration
+
+    @property
+    def id(self) -> str:
+        """Returns the ID of the trace, it's attached to every log record of it."""
+        return self._id
+
+    @property
+    def name(self) -> str:
+        """Returns what was traced i.e., "message" or "/post"."""
+        return self._name
+
+    @property
+    def duration(self) -> float:
+        """Returns how long (in seconds) the trace took, so far if it's still running."""
+        if self._duration is not None:
+            return self._duration
+        return time.perf_counter() - self._started_at
+
+    @property
+    def spans(self) -> list[Span]:
+        """Returns the spans of the trace."""
+        return list(self._spans)
+
+    def begin(self, name: str, depth: int, detail: Optional[str] = None) -> Span:
+        """Starts a span."""
+        span = Span(name, detail, depth, time.perf_counter() - self._started_at)
+        self._spans.append(span)
+        return span
+
+    def end(self, span: Span):
+        """Ends a span."""
+        span.duration = time.perf_counter() - self._started_at - span.start
+
+    def finish(self):
+        """Ends the trace."""
+        self._duration = time.perf_counter() - self._started_at
+
+    def render(self) -> str:
+        """Returns the trace and the breakdown of its spans as text."""
+        lines = [
+            f"trace {self._id} {self._name} {self.duration * 1000:.1f}ms at {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self._timestamp))}"
+        ]
+        for span in self.spans:
+            duration = (
+                f"{span.duration * 1000:9.1f}ms"
+                if span.duration is not None
+                else "  running"
+            )
+            lines.append(
+                f"  {'  ' * span.depth}{span.name:<{24 - 2 * span.depth}} +{span.start * 1000:9.1f}ms {duration}{' failed' if span.failed else ''}{f'  {span.detail}' if span.detail else ''}"
+            )
+        return "\n".join(lines)
+
+
+# the trace (and the depth of the span) of whatever is running, copied into
+# the tasks and the threads of the pipeline along with the rest of the context
+_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar(
+    "trace", default=None
+)
+_depth: contextvars.ContextVar[int] = contextvars.ContextVar("depth", default=0)
+
+
+def current_trace() -> Optional[Trace]:
+    """Returns the trace of whatever is running, `None` if it isn't traced."""
+    return _trace.get()
+
+
+class Tracer(object):
+    """
+    Traces messages and interactions, keeping the slowest `keep` traces
+    around for `slowest` and `dump`.
+
+    `trace` starts a trace for whatever runs in the body of the `with`
+    statement (and every task or pipeline stage it starts), `span` adds a
+    span to the current trace, it does nothing if there isn't one.
+    """
+
+    # the number of the slowest traces that are kept
+    KEEP = 20
+
+    def __init__(self, logger: logging.Logger, keep: int = KEEP):
+        self._logger = logger
+        self._keep = keep
+
+        # a min-heap, the fastest of the slowest traces is replaced first
+        self._slowest: list[Trace] = []
+        self._lock = threading.Lock()
+
+        # statistics
+        self._traced = 0
+
+    def __repr__(self) -> str:
+        return f"<Tracer: keep={self._keep}, {self._traced} traced>"
+
+    @property
+    def traced(self) -> int:
+        """Returns the number of finished traces."""
+        return self._traced
+
+    @contextlib.contextmanager
+    def trace(self, name: str) -> Iterator[Trace]:
+        """Traces the body of the `with` statement as `name`."""
+        trace = Trace(name)
+        token = _trace.set(trace)
+        depth = _depth.set(0)
+        try:
+            yield trace
+        finally:
+            trace.finish()
+            self._logger.debug("Finished %r", trace)
+            _depth.reset(depth)
+            _trace.reset(token)
+            self._record(trace)
+
+    @contextlib.contextmanager
+    def span(self, name: str, detail: Optional[str] = None) -> Iterator[Optional[Span]]:
+        """
+        Adds the body of the `with` statement as the span `name` to the current
+        trace, `detail` (i.e., the URL) is shown next to it.
+        """
+        if (trace := _trace.get()) is None:
+            yield None
+            return
+
+        depth = _depth.get()
+        span = trace.begin(name, depth, detail)
+        token = _depth.set(depth + 1)
+        try:
+            yield span
+        except BaseException:
+            span.failed = True
+            raise
+        finally:
+            _depth.reset(token)
+            trace.end(span)
+
+    def _record(self, trace: Trace):
+        """Keeps `trace` if it's one of the slowest."""
+        with self._lock:
+            self._traced += 1
+            if len(self._slowest) < self._keep:
+                heapq.heappush(self._slowest, trace)
+            elif self._slowest and self._slowest[0] < trace:
+                heapq.heapreplace(self._slowest, trace)
+
+    def slowest(self, n: Optional[int] = None) -> list[Trace]:
+        """Returns the `n` (or all of the kept) slowest traces, the slowest first."""
+        with self._lock:
+            traces = sorted(self._slowest, reverse=True)
+        return traces[:n] if n is not None else traces
+
+    def dump(self, n: Optional[int] = None) -> str:
+        """Returns the `n` slowest traces and the breakdown of their spans as text."""
+        traces = self.slowest(n)
+        if not traces:
+            return "no traces\n"
+        return "\n\n".join(trace.render() for trace in traces) + "\n"
+
+    def clear(self):
+        """Forgets the kept traces."""
+        with self._lock:
+            self._slowest = []
+
+
+class TraceFilter(logging.Filter):
+    """
+    Attaches the ID of the current trace to every record as `trace_id` ("-"
+    if it isn't traced). This has to run on the thread doing the logging,
+    the context doesn't reach the background writer.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace = _trace.get()
+        record.trace_id = trace.id if trace is not None else "-"
+        return True
@@ -4,3 +4,6 @@ from .profile import *
 from .response import *
 from .mode import *
 from .secrets import *
+from .cache_entry import *
+from .reply import *
+from .spooled_buffer import *
@@ -0,0 +1,176 @@
+"""
+This file contains an object representing a cached response from iFunny
+or the iFunny CDN.
+"""
+
+import time
+from typing import IO, Optional
+
+import requests
+
+
+class CacheEntry(object):
+    """
+    Represents a response from iFunny (or its CDN) along with the validators
+    (`ETag` and `Last-Modified`) needed to revalidate it later on.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        status_code: int,
+        reason: str,
+        content: bytes,
+        headers: Optional[dict[str, str]] = None,
+        encoding: Optional[str] = None,
+        expires: float = 0.0,
+        buffer: Optional[IO[bytes]] = None,
+    ):
+        if not url:
+            raise ValueError("url wasn't defined during creation.")
+
+        self._url = url
+        self._status_code = status_code
+        self._reason = reason
+        self._content = content
+        self._encoding = encoding
+        self._expires = expires
+        self._buffer = buffer
+
+        # the headers are stored lower case, HTTP headers are case insensitive
+        self._headers: dict[str, str] = {
+            k.lower(): v for (k, v) in (headers or {}).items()
+        }
+
+        # lazily decoded
+        self._text: Optional[str] = None
+
+    @staticmethod
+    def from_response(
+        url: str,
+        response: requests.Response,
+        expires: float = 0.0,
+        content: Optional[bytes] = None,
+    ) -> "CacheEntry":
+        """
+        Creates a `CacheEntry` from a `requests.Response`, this consumes the
+        body of the response unless it was read already (`content`).
+        """
+        return CacheEntry(
+            url,
+            response.status_code,
+            response.reason,
+            content if content is not None else response.content,
+            dict(response.headers),
+            response.encoding,
+            expires,
+        )
+
+    def __repr__(self) -> str:
+        return f"<CacheEntry({self._status_code}): url={self._url}, etag={self.etag}, last_modified={self.last_modified}, {len(self._content)} bytes>"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        """
+        Returns true if the entry can be used without asking the server.
+        """
+        return (now if now is not None else time.time()) < self._expires
+
+    def is_revalidatable(self) -> bool:
+        """
+        Returns true if the entry has any validators that the server can
+        use to answer with a `304 Not Modified`.
+        """
+        return self.etag is not None or self.last_modified is not None
+
+    def conditional_headers(self) -> dict[str, str]:
+        """
+        Returns the headers needed to make a conditional GET request
+        for this entry.
+        """
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def refresh(self, expires: float, headers: Optional[dict[str, str]] = None):
+        """
+        Refreshes the entry after a `304 Not Modified`, the server may send
+        updated validators along with the response.
+        """
+        self._expires = expires
+        for key in ("etag", "last-modified"):
+            if headers is not None and (value := headers.get(key)) is not None:
+                self._headers[key] = value
+
+    @property
+    def url(self) -> str:
+        """Returns the URL the entry originated from."""
+        return self._url
+
+    @property
+    def status_code(self) -> int:
+        """Returns the HTTP status code of the response."""
+        return self._status_code
+
+    @property
+    def reason(self) -> str:
+        """Returns the HTTP reason of the response."""
+        return self._reason
+
+    @property
+    def headers(self) -> dict[str, str]:
+        """Returns the (lower cased) headers of the response."""
+        return self._headers
+
+    @property
+    def content(self) -> bytes:
+        """Returns the body of the response."""
+        return self._content
+
+    @property
+    def encoding(self) -> Optional[str]:
+        """Returns the encoding of the body, if known."""
+        return self._encoding
+
+    @property
+    def buffer(self) -> Optional[IO[bytes]]:
+        """
+        Returns the buffer holding the body of the response if it was streamed
+        into one (i.e., a temporary file) instead of being held in memory,
+        `content` is empty in that case.
+        """
+        return self._buffer
+
+    @property
+    def text(self) -> str:
+        """Returns the body of the response decoded as a string."""
+        if self._text is None:
+            self._text = self._content.decode(
+                self._encoding or "utf-8", errors="replace"
+            )
+        return self._text
+
+    @property
+    def etag(self) -> Optional[str]:
+        """Returns the `ETag` validator of the response."""
+        return self._headers.get("etag")
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        """Returns the `Last-Modified` validator of the response."""
+        return self._headers.get("last-modified")
+
+    @property
+    def expires(self) -> float:
+        """Returns the timestamp of when the entry needs to be revalidated."""
+        return self._expires
+
+    @property
+    def size(self) -> int:
+        """Returns the size of the body in bytes."""
+        return len(self._content)
@@ -0,0 +1,8 @@
+"""
+This type of error is meant to represent a request that wasn't made because the host kept failing.
+"""
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
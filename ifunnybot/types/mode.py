@@ -17,6 +17,15 @@ class Mode(enum.Enum):
     TESTING = 2  # for future use
 
 
+class Priority(enum.IntEnum):
+    """
+    Priority of a job, lower values go first.
+    """
+
+    INTERACTION = 0  # slash commands, these have a deadline
+    AUTOEMBED = 1  # links posted in messages, these can wait
+
+
 class CropMethod(enum.StrEnum):
     """
     Enum of possible cropping methods.
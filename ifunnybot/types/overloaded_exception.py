@@ -0,0 +1,8 @@
+"""
+This type of error is meant to represent a job that was turned away because the bot is too busy.
+"""
+
+
+class OverloadedError(Exception):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
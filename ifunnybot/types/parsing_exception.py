@@ -2,7 +2,12 @@
 This type of error is meant to represent any errors that happen during HTML parsing.
 """
 
+from typing import Optional
+
 
 class ParsingError(Exception):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, selector: Optional[str] = None, **kwargs):
         super().__init__(*args, **kwargs)
+
+        # the CSS selector that didn't match anything, if that's what failed
+        self.selector = selector
@@ -0,0 +1,133 @@
+"""
+This file contains an object representing a reply (or several replies
+packed together) to a message.
+"""
+
+import io
+from typing import Optional
+
+import discord
+
+from ifunnybot.types.post_type import PostType
+
+
+class Reply(object):
+    """
+    Represents the contents of a reply to a message. Several replies can be
+    merged into one as long as they stay within Discord's limits.
+    """
+
+    # Discord's limits for a single message
+    MAX_EMBEDS = 10
+    MAX_FILES = 10
+    MAX_CONTENT = 2000
+
+    # the upload limit of servers without boosts (and DMs)
+    MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+
+    def __init__(
+        self,
+        content: Optional[str] = None,
+        embed: Optional[discord.Embed] = None,
+        file: Optional[discord.File] = None,
+        post_type: Optional[PostType] = None,
+    ):
+        self._content: list[str] = [content] if content else []
+        self._embeds: list[discord.Embed] = [embed] if embed is not None else []
+        self._files: list[discord.File] = [file] if file is not None else []
+        self._size = sum(map(Reply._file_size, self._files))
+        self._post_types: set[PostType] = {post_type} if post_type is not None else set()
+
+    def __repr__(self) -> str:
+        return f"<Reply: {len(self.content or '')} characters, {len(self._embeds)} embeds, {len(self._files)} files, {self._size / 1_000_000} MB>"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    @staticmethod
+    def _file_size(file: discord.File) -> int:
+        """Returns the number of bytes left to be uploaded in `file`."""
+        fp: io.IOBase = file.fp  # type: ignore
+        position = fp.tell()
+        end = fp.seek(0, io.SEEK_END)
+        fp.seek(position)
+        return end - position
+
+    @property
+    def content(self) -> Optional[str]:
+        """Returns the text of the reply, `None` if there isn't any."""
+        return "\n".join(self._content) if self._content else None
+
+    @property
+    def embeds(self) -> list[discord.Embed]:
+        """Returns the embeds of the reply."""
+        return self._embeds
+
+    @property
+    def files(self) -> list[discord.File]:
+        """Returns the files of the reply."""
+        return self._files
+
+    @property
+    def post_type(self) -> Optional[PostType]:
+        """Returns the type of the posts in the reply, `None` if there's more than one."""
+        return next(iter(self._post_types)) if len(self._post_types) == 1 else None
+
+    @property
+    def kind(self) -> PostType | str:
+        """
+        Returns the type of the posts in the reply for the metrics, "mixed" if
+        there's more than one and "none" if there are no posts (i.e., errors).
+        """
+        if not self._post_types:
+            return "none"
+        return self.post_type or "mixed"
+
+    @property
+    def size(self) -> int:
+        """Returns the total size of the files in bytes."""
+        return self._size
+
+    @property
+    def empty(self) -> bool:
+        """Returns true if there's nothing to reply with."""
+        return not (self._content or self._embeds or self._files)
+
+    def fits(self, other: "Reply", upload_limit: int = MAX_UPLOAD_SIZE) -> bool:
+        """
+        Returns true if `other` can be merged into this reply without going
+        over any of Discord's limits. Anything fits into an empty reply.
+        """
+        if self.empty:
+            return True
+
+        # the content is joined by a newline
+        content = len(self.content or "") + len(other.content or "")
+        if self._content and other._content:
+            content += 1
+
+        return (
+            content <= Reply.MAX_CONTENT
+            and len(self._embeds) + len(other._embeds) <= Reply.MAX_EMBEDS
+            and len(self._files) + len(other._files) <= Reply.MAX_FILES
+            and self._size + other._size <= upload_limit
+        )
+
+    def merge(self, other: "Reply"):
+        """Merges `other` into this reply, check `fits` beforehand."""
+        self._content.extend(other._content)
+        self._embeds.extend(other._embeds)
+        self._files.extend(other._files)
+        self._size += other._size
+        self._post_types |= other._post_types
+
+    def kwargs(self) -> dict:
+        """Returns the keyword arguments for `message.reply`."""
+        kwargs = {}
+        if self._content:
+            kwargs["content"] = self.content
+        if self._embeds:
+            kwargs["embeds"] = self._embeds
+        if self._files:
+            kwargs["files"] = self._files
+        return kwargs
@@ -4,23 +4,27 @@ from the iFunny CDN.
 """
 
 import io
-from typing import Optional
+from typing import IO, Optional
 
-import requests
 from pyfsig.interface import FileSignature
 
+from ifunnybot.types.cache_entry import CacheEntry
+
 
 class Response(object):
     """
     Contains information about the response from the iFunny CDN.
     """
 
+    # the number of bytes needed to determine the type of the content
+    HEADER_SIZE = 64
+
     def __init__(
         self,
-        bytes_: io.BytesIO,
+        bytes_: IO[bytes],
         url: str,
         type_: Optional[FileSignature],
-        response: requests.Response,
+        response: CacheEntry,
     ):
         if not bytes_:
             raise ValueError("_bytes wasn't defined during creation.")
@@ -32,22 +36,31 @@ class Response(object):
         self._bytes = bytes_
         self._type = type_
         self._url = url
-        self._response = response
+        self._reason = response.reason
+        self._response: Optional[CacheEntry] = response
 
     @property
     def reason(self) -> str:
         """
         A shorthand to get the HTTP reason of the response
         """
-        return self._response.reason
+        return self._reason
 
     @property
-    def raw(self) -> requests.Response:
+    def raw(self) -> Optional[CacheEntry]:
         """
-        The raw response from `requests`.
+        The raw (possibly cached) response from the fetch layer, `None` once
+        it has been released.
         """
         return self._response
 
+    def release(self):
+        """
+        Drops the raw response once its body is in the buffer, so the body
+        isn't kept alive by the response for as long as the buffer is.
+        """
+        self._response = None
+
     @property
     def url(self) -> str:
         """
@@ -63,7 +76,17 @@ class Response(object):
         return self._type
 
     @property
-    def bytes(self) -> io.BytesIO:
+    def size(self) -> int:
+        """
+        Gets the number of bytes left to read in the buffer.
+        """
+        position = self._bytes.tell()
+        end = self._bytes.seek(0, io.SEEK_END)
+        self._bytes.seek(position)
+        return end - position
+
+    @property
+    def bytes(self) -> IO[bytes]:
         """
         Gets the buffer containing the post itself.
         """
@@ -78,8 +101,8 @@ class Response(object):
 
     def __repr__(self) -> str:
         if self._type:
-            return f"<Response({self.reason}): url={self._url}, type={self._type.file_extension}, {self._bytes.getbuffer().nbytes / 1_000_000} MB>"
-        return f'<Response({self.reason}): url={self._url}, type="???", {self._bytes.getbuffer().nbytes / 1_000_000} MB>'
+            return f"<Response({self.reason}): url={self._url}, type={self._type.file_extension}, {self.size / 1_000_000} MB>"
+        return f'<Response({self.reason}): url={self._url}, type="???", {self.size / 1_000_000} MB>'
 
     def __str__(self) -> str:
         return self.__repr__()
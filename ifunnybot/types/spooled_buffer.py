@@ -0,0 +1,50 @@
+"""
+This file contains a buffer for media that stays in memory while it's
+small and moves to a temporary file once it gets large.
+"""
+
+import io
+import tempfile
+
+
+class SpooledBuffer(tempfile.SpooledTemporaryFile):
+    """
+    A `tempfile.SpooledTemporaryFile` for media i.e., downloads, converted
+    images and gifs, which are uploaded straight from it.
+
+    Asking a spooled file for its `fileno()` moves it to disk, and libraries
+    like PIL ask for it just in case. This buffer refuses to hand it out
+    while it's still in memory, the callers fall back to `write()`.
+    """
+
+    # the size past which a buffer moves to disk
+    MAX_SIZE = 4_000_000
+
+    def __init__(self, max_size: int = MAX_SIZE):
+        super().__init__(max_size=max_size, mode="w+b")
+
+    def __repr__(self) -> str:
+        return f"<SpooledBuffer: {self.size} bytes, {'in memory' if self.in_memory else 'on disk'}>"
+
+    def fileno(self) -> int:
+        if self.in_memory:
+            raise io.UnsupportedOperation("fileno() of an in memory buffer")
+        return super().fileno()
+
+    @property
+    def in_memory(self) -> bool:
+        """Returns true if the buffer hasn't moved to disk yet."""
+        return not self._rolled  # type: ignore
+
+    @property
+    def size(self) -> int:
+        """Returns the total size of the buffer in bytes."""
+        position = self.tell()
+        end = self.seek(0, io.SEEK_END)
+        self.seek(position)
+        return end
+
+    @property
+    def memory_size(self) -> int:
+        """Returns the number of bytes the buffer holds in memory."""
+        return self.size if self.in_memory else 0
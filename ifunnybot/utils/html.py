@@ -36,7 +36,9 @@ def generate_safe_selector(
 
         # checking the results
         if len(elements) == 0:
-            raise ParsingError(f"Couldn't find any tags matching: {selector}")
+            raise ParsingError(
+                f"Couldn't find any tags matching: {selector}", selector=selector
+            )
 
         # unpack
         return elements[0]
@@ -54,6 +54,16 @@ def get_url(text: str) -> Optional[list[str]]:
     return None
 
 
+def canonicalize_url(url: str) -> str:
+    """
+    Returns the canonical form of an iFunny url i.e., without the
+    `br.` subdomain and the `?s=cl` query, meant for deduplicating links.
+    """
+
+    url = re.sub(r"^https:\/\/br\.ifunny\.co", "https://ifunny.co", url)
+    return re.sub(r"\?s=cl$", "", url)
+
+
 def has_url(text: str) -> bool:
     """
     Returns true if the text has an ifunny url, false otherwise.
@@ -3,9 +3,12 @@ The main file for the bot.
 """
 
 import os
-import sys
 import signal
+import asyncio
 import argparse
+import multiprocessing
+from datetime import datetime
+from typing import Literal, Optional
 from urllib3.exceptions import NameResolutionError
 
 import discord
@@ -13,6 +16,7 @@ from discord import app_commands
 from dotenv import dotenv_values
 
 import ifunnybot as funny
+from ifunnybot.types.overloaded_exception import OverloadedError
 
 # loading in config values
 config = {**os.environ, **dotenv_values(".env")}
@@ -25,6 +29,9 @@ intents = discord.Intents.default()
 intents.message_content = True
 
 
+# the cache shared by the processes when none is given
+SHARED_CACHE = "funnybot-cache.sqlite3"
+
 # setup argparse
 parser = argparse.ArgumentParser(description="A discord bot to embed iFunny posts.")
 parser.add_argument(
@@ -56,28 +63,120 @@ parser.add_argument(
     help=f"The default image export format. Default: {funny.Configuration.IMAGE_FORMAT}",
 )
 
+parser.add_argument(
+    "--max-pending",
+    type=int,
+    default=funny.Configuration.ADMISSION_MAX_PENDING,
+    dest="max_pending",
+    help=f"The number of waiting jobs at which new ones are turned away. Default: {funny.Configuration.ADMISSION_MAX_PENDING}",
+)
+parser.add_argument(
+    "--max-media-bytes",
+    type=int,
+    default=funny.Configuration.MAX_MEDIA_BYTES,
+    dest="max_media_bytes",
+    help=f"The bytes of media in flight at which new jobs are turned away. Default: {funny.Configuration.MAX_MEDIA_BYTES}",
+)
+parser.add_argument(
+    "--max-loop-lag",
+    type=float,
+    default=funny.Configuration.MAX_LOOP_LAG,
+    dest="max_loop_lag",
+    help=f"The lag of the event loop (in seconds) at which new jobs are turned away. Default: {funny.Configuration.MAX_LOOP_LAG}",
+)
+parser.add_argument(
+    "--loop-stall-threshold",
+    type=float,
+    default=funny.Configuration.LOOP_STALL_THRESHOLD,
+    dest="loop_stall_threshold",
+    help=f"The lag of the event loop (in seconds) past which the blocking call is logged. Default: {funny.Configuration.LOOP_STALL_THRESHOLD}",
+)
+
+parser.add_argument(
+    "--log-level",
+    action="append",
+    default=[],
+    dest="log_levels",
+    metavar="COMPONENT=LEVEL",
+    help="The log level of a component of the bot e.g., fetcher=DEBUG, can be given more than once.",
+)
+parser.add_argument(
+    "--metrics-host",
+    default=funny.Configuration.METRICS_HOST,
+    dest="metrics_host",
+    help=f"The interface the metrics are served on. Default: {funny.Configuration.METRICS_HOST}",
+)
+parser.add_argument(
+    "--metrics-port",
+    type=int,
+    default=funny.Configuration.METRICS_PORT,
+    dest="metrics_port",
+    help="The port the metrics are served on (at /metrics), every process of --processes uses the next one. Default: not served",
+)
+parser.add_argument(
+    "--shards",
+    type=int,
+    default=None,
+    dest="shards",
+    help="The total number of shards. Default: the number Discord recommends",
+)
+parser.add_argument(
+    "--processes",
+    type=int,
+    default=1,
+    dest="processes",
+    help="The number of processes the shards are split between, requires --shards. Default: 1",
+)
+parser.add_argument(
+    "--cache",
+    default=funny.Configuration.CACHE_PATH,
+    dest="cache",
+    help=f"The SQLite database the cache is kept in, shared by the processes. Default: in memory ({SHARED_CACHE} with --processes)",
+)
+
+# the reply to slash commands when the bot is saturated
+BUSY_MESSAGE = "The bot is too busy right now, please try again in a minute or so."
+
 
 # signal handler
 def handler(signal, frame, bot: funny.FunnyBot):
-    # killing the bot
+    # draining the bot, `client.run` returns once it's closed
     bot.terminate(signal, frame)
 
-    # terminating the program
-    sys.exit(0)
-
-
-# main loop
-if __name__ == "__main__":
-    # getting args
-    args = parser.parse_args()
 
+# creates the client for a group of shards (all of them if None)
+def create_client(
+    args: argparse.Namespace, shard_ids: Optional[list[int]] = None
+) -> funny.FunnyBot:
     # creating the configuration object
     conf = funny.Configuration(
-        pickle_location=args.pickle, log_location=args.logs, image_format=args.format
+        pickle_location=args.pickle,
+        log_location=args.logs,
+        image_format=args.format,
+        admission_max_pending=args.max_pending,
+        max_media_bytes=args.max_media_bytes,
+        max_loop_lag=args.max_loop_lag,
+        loop_stall_threshold=args.loop_stall_threshold,
+        cache_path=args.cache,
+        log_levels=dict(level.split("=", 1) for level in args.log_levels),
+        metrics_host=args.metrics_host,
+        metrics_port=args.metrics_port,
     )
 
+    # every process gets its own log file
+    log_name = f"{int(datetime.utcnow().timestamp())}-funnybot.log"
+    if shard_ids is not None:
+        log_name = f"{int(datetime.utcnow().timestamp())}-funnybot-shards-{'-'.join(map(str, shard_ids))}.log"
+
     # creating the client
-    client = funny.FunnyBot(intents=intents, secrets=secrets, configuration=conf)
+    client = funny.FunnyBot(
+        intents=intents,
+        secrets=secrets,
+        configuration=conf,
+        log_name=log_name,
+        shard_ids=shard_ids,
+        shard_count=args.shards,
+    )
 
     # setting potential development mode
     if args.dev is True:
@@ -87,6 +186,20 @@ if __name__ == "__main__":
     signal.signal(signal.SIGINT, lambda sig, frame: handler(sig, frame, client))
     signal.signal(signal.SIGTERM, lambda sig, frame: handler(sig, frame, client))
 
+    # profiling on demand, `kill -USR1 <pid>` writes a profile into the logs directory
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, client.start_profile)
+
+    # sends the followup of an interaction, measured as the upload of its
+    # post type ("none" for the replies without a post i.e., errors)
+    async def followup(
+        interaction: discord.Interaction,
+        post_type: funny.PostType | str = "none",
+        **kwargs,
+    ):
+        with client.measure("upload", post_type):
+            return await interaction.followup.send(**kwargs)
+
     # --- slash commands ---
 
     @client.tree.command(
@@ -96,21 +209,33 @@ if __name__ == "__main__":
     @app_commands.rename(user_="user")
     @app_commands.describe(user_="The user's name.")
     async def icon(interaction: discord.Interaction, user_: str):
+        # turning the interaction away if the bot is too busy
+        if not client.admit(funny.Priority.INTERACTION):
+            return await interaction.response.send_message(
+                content=BUSY_MESSAGE, ephemeral=True
+            )
+
         # deferring the reply
         await interaction.response.defer(thinking=True)
 
         try:
             # calling the bot
-            icon_ = client.get_icon(user_)
+            icon_ = await client.run_interaction(interaction, client.get_icon, user_)
 
             # returning the image
             if icon_ is not None:
-                return await interaction.followup.send(file=icon_)
-            return await interaction.followup.send(
+                try:
+                    return await followup(interaction, funny.PostType.USER, file=icon_)
+                finally:
+                    client.free(icon_)
+            return await followup(
+                interaction,
                 content=f"User {user_} doesn't have a profile picture."
             )
+        except OverloadedError:
+            return await followup(interaction, content=BUSY_MESSAGE, ephemeral=True)
         except RuntimeError as reason:
-            return await interaction.followup.send(content=str(reason), ephemeral=True)
+            return await followup(interaction, content=str(reason), ephemeral=True)
 
     @client.tree.command(
         name="user",
@@ -119,53 +244,184 @@ if __name__ == "__main__":
     @app_commands.rename(user_="user")
     @app_commands.describe(user_="The user's name.")
     async def user(interaction: discord.Interaction, user_: str):
+        # turning the interaction away if the bot is too busy
+        if not client.admit(funny.Priority.INTERACTION):
+            return await interaction.response.send_message(
+                content=BUSY_MESSAGE, ephemeral=True
+            )
+
         # deferring the reply
         await interaction.response.defer(thinking=True)
 
         try:
             # calling the bot
-            embed_ = client.get_user(user_)
+            embed_ = await client.run_interaction(interaction, client.get_user, user_)
 
             # passing the url as content since you actually can't click this on mobile
             url = funny.username_to_url(user_)
 
             # returning the image
-            return await interaction.followup.send(embed=embed_, content=url)
+            return await followup(interaction, funny.PostType.USER, embed=embed_, content=url)
+        except OverloadedError:
+            return await followup(interaction, content=BUSY_MESSAGE, ephemeral=True)
         except RuntimeError as reason:
-            return await interaction.followup.send(content=str(reason), ephemeral=True)
+            return await followup(interaction, content=str(reason), ephemeral=True)
 
     @client.tree.command(
         name="post", description="Embeds a post from iFunny into Discord."
     )
     @app_commands.describe(link="An iFunny.co link e.g., ifunny.co/video/...")
     async def post(interaction: discord.Interaction, link: str):
+        # turning the interaction away if the bot is too busy
+        if not client.admit(funny.Priority.INTERACTION):
+            return await interaction.response.send_message(
+                content=BUSY_MESSAGE, ephemeral=True
+            )
+
         # deferring the reply
         await interaction.response.defer(thinking=True)
 
         try:
             # calling the bot
-            (embed, file, content_url, actual_type) = client.get_post(link)
+            (embed, file, content_url, actual_type) = await client.run_interaction(
+                interaction, client.get_post, link
+            )
 
             # returning the image
-            if client.prefer_video_url and actual_type == funny.PostType.VIDEO:
-                # return await interaction.followup.send(embed=embed, content=content_url)
-                return await interaction.followup.send(content=content_url)
-            else:
-                return await interaction.followup.send(embed=embed, file=file)
+            try:
+                if client.prefer_video_url and actual_type == funny.PostType.VIDEO:
+                    # return await interaction.followup.send(embed=embed, content=content_url)
+                    return await followup(interaction, actual_type, content=content_url)
+                else:
+                    return await followup(interaction, actual_type, embed=embed, file=file)
+            finally:
+                client.free(file)
+        except OverloadedError:
+            return await followup(interaction, content=BUSY_MESSAGE, ephemeral=True)
         except RuntimeError as reason:
-            return await interaction.followup.send(content=str(reason), ephemeral=True)
+            return await followup(interaction, content=str(reason), ephemeral=True)
         except NameResolutionError as reason:  # type: ignore
-            return await interaction.followup.send(
+            return await followup(
+                interaction,
                 content="Encountered a DNS error, this is an known on going issue, please try again in a minute or so.",
                 ephemeral=True,
             )
         except Exception as reason:  # type: ignore
-            return await interaction.followup.send(
+            return await followup(
+                interaction,
                 content=f"Encounted an unexpected error: {reason}.",
                 ephemeral=True,
             )
 
+    @client.tree.command(
+        name="profile",
+        description="Profiles the bot or takes a memory snapshot. (owner only)",
+        guild=discord.Object(id=secrets.guild_id),
+    )
+    @app_commands.describe(
+        kind="cpu samples the stacks of the bot, memory traces its allocations for as long.",
+        seconds="How long to profile for.",
+    )
+    async def profile(
+        interaction: discord.Interaction,
+        kind: Literal["cpu", "memory"] = "cpu",
+        seconds: Optional[app_commands.Range[float, 1, 300]] = None,
+    ):
+        # only for the owner of the bot
+        if not await client.is_owner(interaction.user):
+            return await interaction.response.send_message(
+                content="Only the owner of the bot can do that.", ephemeral=True
+            )
+
+        # deferring the reply
+        await interaction.response.defer(thinking=True, ephemeral=True)
+
+        # profiling off of the event loop
+        if kind == "cpu":
+            path = await asyncio.to_thread(
+                client.profiler.profile, seconds or conf.profile_seconds
+            )
+        else:
+            path = await asyncio.to_thread(
+                client.profiler.snapshot, seconds or conf.profile_seconds
+            )
+
+        # returning the file
+        if path is None:
+            return await interaction.followup.send(
+                content="Already taking a profile or a snapshot.", ephemeral=True
+            )
+        return await interaction.followup.send(
+            content=f"Wrote {path}", file=discord.File(path), ephemeral=True
+        )
+
     # --- slash commands ---
 
-    # running the bot
-    client.run(secrets.token)
+    return client
+
+
+# runs the bot for a group of shards (all of them if None)
+def run(args: argparse.Namespace, shard_ids: Optional[list[int]] = None):
+    create_client(args, shard_ids).run(secrets.token)
+
+
+# runs the shards in `args.processes` processes, sharing the cache
+def launch(args: argparse.Namespace):
+    # splitting the shards between the processes
+    groups = [
+        list(range(args.shards))[i :: args.processes] for i in range(args.processes)
+    ]
+    processes = [
+        multiprocessing.Process(
+            target=run,
+            args=(
+                argparse.Namespace(
+                    **{
+                        **vars(args),
+                        "metrics_port": (
+                            args.metrics_port + i
+                            if args.metrics_port is not None
+                            else None
+                        ),
+                    }
+                ),
+                group,
+            ),
+            name=f"funnybot-shards-{group}",
+        )
+        for (i, group) in enumerate(groups)
+        if group
+    ]
+    for process in processes:
+        process.start()
+
+    # the processes drain themselves, ctrl+c already reaches all of them
+    def forward(sig, _):
+        for process in processes:
+            if process.is_alive() and process.pid is not None:
+                os.kill(process.pid, sig)
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, forward)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, forward)
+
+    # waiting for every process to exit
+    for process in processes:
+        process.join()
+
+
+# main loop
+if __name__ == "__main__":
+    # getting args
+    args = parser.parse_args()
+
+    # running the bot, in one or more processes
+    if args.processes > 1:
+        if args.shards is None:
+            parser.error("--processes requires --shards.")
+        if args.cache is None:
+            args.cache = SHARED_CACHE
+        launch(args)
+    else:
+        run(args)